@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ...database.base import get_db
 from ...database.models import User
-from ...dependencies import get_current_user
-from ...core.security import hash_password, verify_password, create_access_token
+from ...dependencies import get_current_user, oauth2_scheme
+from ...core.security import hash_password_async, verify_password_async, create_access_token, decode_access_token, PasswordHashBusy
+from ...services.token_revocation import revoke_token
 from pydantic import BaseModel
 from datetime import timedelta
 import uuid
@@ -25,32 +27,40 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+async def password_hash_or_503(task):
+    # Tempestade de logins: recusa rápido em vez de acumular requisições
+    try:
+        return await task
+    except PasswordHashBusy:
+        raise HTTPException(status_code=503, detail="Authentication is busy, try again later", headers={"Retry-After": "1"})
+
 # --- Endpoints de Autenticação ---
 @router.post("/register", tags=["Authentication"])
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user.username).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(User).where(User.username == user.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = hash_password(user.password)
+    # bcrypt é CPU-bound: roda no pool de processos dedicado
+    hashed_password = await password_hash_or_503(hash_password_async(user.password))
     
     # Cria o novo usuário
     new_user = User(username=user.username, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return {"message": "User registered successfully"}
 
 @router.post("/login", response_model=TokenResponse, tags=["Authentication"])
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user.username).first()
-    if not existing_user or not verify_password(user.password, existing_user.hashed_password):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(User).where(User.username == user.username))
+    if not existing_user or not await password_hash_or_503(verify_password_async(user.password, existing_user.hashed_password)):
         raise HTTPException(status_code=400, detail="Invalid username or password")
     
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": str(existing_user.id)},
+        data={"sub": str(existing_user.id), "username": existing_user.username},
         expires_delta=access_token_expires
     )
     
@@ -60,4 +70,12 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
         "username": existing_user.username,
         "access_token": access_token,
         "token_type": "bearer"
-    }
\ No newline at end of file
+    }
+
+@router.post("/logout", tags=["Authentication"])
+async def logout(token: str = Depends(oauth2_scheme), current_user: User = Depends(get_current_user)):
+    # Revoga o token atual até a sua expiração
+    payload = decode_access_token(token)
+    if payload.get("jti"):
+        await revoke_token(payload["jti"], payload["exp"])
+    return {"message": "Logged out successfully"}
\ No newline at end of file
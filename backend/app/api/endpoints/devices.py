@@ -1,19 +1,38 @@
+import logging
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Security
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from ...core.config import settings
 from ...database.base import get_db
 from ...database.models import Device, User
 from pydantic import BaseModel, field_validator
 from typing import List, Optional
 import uuid
 from .auth import get_current_user 
-from ...database.models import Telemetry
+from ...database.models import Telemetry, DeviceLatestTelemetry, DeviceIngestKey, TelemetryRollupHourly, TelemetryRollupDaily
 from typing import Dict
-from ...services.cache_service import get_cache, set_cache, clear_cache
+from ...services.cache_service import (
+    cache_key as build_cache_key, serialize, get_cache_async, set_cache_async, clear_cache_async,
+    get_or_compute_raw_async
+)
+from ...services.historical_cache import get_closed_buckets, store_closed_buckets
+from ...services.latest_telemetry import read_latest_payload, load_latest_payload, build_payload, remove_latest_device
+from ...services.rule_index import invalidate_rule_index
+from ...services.ingest_auth import generate_ingest_token, invalidate_ingest_key
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Janela, agrupamento (segundos) e tabela de rollup de cada período do histórico
+HISTORICAL_PERIODS = {
+    "last_24h": (timedelta(hours=24), 60 * 60, TelemetryRollupHourly), # Agrupamento por hora
+    "last_7d": (timedelta(days=7), 60 * 60 * 12, TelemetryRollupHourly), # Agrupamento por 12 horas
+    "last_30d": (timedelta(days=30), 60 * 60 * 24, TelemetryRollupDaily), # Agrupamento por 24 horas
+}
+
 # --- Modelos Pydantic para validação ---
 class DeviceCreate(BaseModel):
     name: str
@@ -46,6 +65,10 @@ class DeviceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class IngestTokenResponse(BaseModel):
+    device_uuid: uuid.UUID
+    ingest_token: str
+
 class HistoricalDataResponse(BaseModel):
     timestamps: List[datetime]
     cpu_usage: List[float]
@@ -65,39 +88,67 @@ class TelemetryResponse(BaseModel):
     class Config:
         from_attributes = True
 
+def parse_device_uuid(device_uuid: str) -> uuid.UUID:
+    # UUID malformado é tratado como dispositivo inexistente
+    try:
+        return uuid.UUID(device_uuid)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+async def get_owned_device(db: AsyncSession, device_uuid: str, user: User) -> Optional[Device]:
+    return await db.scalar(select(Device).where(
+        Device.uuid == parse_device_uuid(device_uuid),
+        Device.user_id == user.id
+    ))
+
 # --- Endpoints de Dispositivo ---
 @router.get("/devices/latest-telemetry", response_model=Dict[str, TelemetryResponse], tags=["Devices"])
-def get_latest_telemetry(
+async def get_latest_telemetry(
     user: User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user_id_str = str(user.id)
-    cache_key = f"latest_telemetry:{user_id_str}" 
-    cached_data = get_cache(cache_key)
-    
-    if cached_data:
-        print(f"[CACHE HIT] Última Telemetria para o usuário {user_id_str}")
-        return cached_data
-
-    print(f"[CACHE MISS] Consultando DB por Última Telemetria para o usuário {user_id_str}")
-    latest_telemetry = {}
-    user_devices = db.query(Device).filter(Device.user_id == user.id).all()
+    # O worker mantém o hash do usuário atualizado a cada lote: um HGETALL, sempre fresco
+    payload = await read_latest_payload(user.id)
+    if payload is not None:
+        return Response(content=payload, media_type="application/json")
 
-    for device in user_devices:
-        latest = db.query(Telemetry).filter(Telemetry.device_uuid == device.uuid).order_by(Telemetry.boot_date.desc()).first()
-        if latest:
-            latest_telemetry[str(device.uuid)] = TelemetryResponse.model_validate(latest).model_dump()
+    user_id_str = str(user.id)
+    logger.info("Última telemetria carregada do banco (hash ausente no Redis).", extra={"user_id": user_id_str})
+    # Hash ausente (ex.: Redis reiniciado): carrega da tabela mantida pelo worker, por chave primária
+    latest_rows = (await db.scalars(select(DeviceLatestTelemetry).join(
+        Device, Device.uuid == DeviceLatestTelemetry.device_uuid
+    ).where(Device.user_id == user.id))).all()
+
+    entries = {
+        str(latest.device_uuid): (
+            latest.boot_date.isoformat() if latest.boot_date else None,
+            serialize(TelemetryResponse(
+                id=latest.telemetry_id,
+                cpu_usage=latest.cpu_usage,
+                ram_usage=latest.ram_usage,
+                temperature=latest.temperature,
+                latency=latest.latency,
+                connectivity=latest.connectivity,
+                boot_date=latest.boot_date,
+                device_uuid=latest.device_uuid
+            ).model_dump())
+        )
+        for latest in latest_rows
+    }
 
-    set_cache(cache_key, latest_telemetry, ttl_seconds=30)
-    return latest_telemetry
+    # Sem Redis, responde direto com o que veio do banco
+    payload = await load_latest_payload(user.id, entries)
+    if payload is None:
+        payload = build_payload({device_uuid.encode(): raw for device_uuid, (_, raw) in entries.items()})
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/devices", response_model=DeviceResponse, status_code=status.HTTP_201_CREATED, tags=["Devices"])
-def create_device(
+async def create_device(
     device_data: DeviceCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Security(get_current_user) 
 ):
-    existing_device = db.query(Device).filter(Device.sn == device_data.sn).first()
+    existing_device = await db.scalar(select(Device).where(Device.sn == device_data.sn))
     if existing_device:
         raise HTTPException(status_code=400, detail="Serial Number already registered")
 
@@ -109,168 +160,212 @@ def create_device(
         user_id=current_user.id
     )
     db.add(new_device)
-    db.commit()
-    db.refresh(new_device)
+    await db.commit()
+    await db.refresh(new_device)
 
     # Invalidação de Cache
-    clear_cache(f"user_devices:{str(current_user.id)}")
+    await clear_cache_async(build_cache_key("user_devices", current_user.id))
+    await invalidate_rule_index()
     return new_device
 
 @router.get("/devices", response_model=List[DeviceResponse], tags=["Devices"])
-def get_all_devices(
-    db: Session = Depends(get_db),
+async def get_all_devices(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Security(get_current_user)
 ):
     user_id_str = str(current_user.id)
-    cache_key = f"user_devices:{user_id_str}"
+    cache_key = build_cache_key("user_devices", user_id_str)
 
-    cached_devices = get_cache(cache_key)
+    cached_devices = await get_cache_async(cache_key)
     if cached_devices:
-        print(f"[CACHE HIT] Lista de Dispositivos para o usuário {user_id_str}")
+        logger.debug("Lista de dispositivos servida do cache.", extra={"sampled": True, "user_id": user_id_str})
         return cached_devices
 
-    print(f"[CACHE MISS] Consultando DB por lista de dispositivos para o usuário {user_id_str}")
-    devices = db.query(Device).filter(Device.user_id == current_user.id).all()
+    logger.debug("Lista de dispositivos consultada no banco.", extra={"sampled": True, "user_id": user_id_str})
+    devices = (await db.scalars(select(Device).where(Device.user_id == current_user.id))).all()
 
     try:
         device_data = [DeviceResponse.model_validate(d).model_dump() for d in devices]
-        set_cache(cache_key, device_data, ttl_seconds=60)
+        await set_cache_async(cache_key, device_data)
     except Exception as e:
-        print(f"[ERRO CACHE] Falha ao serializar lista de dispositivos: {e}")
+        logger.error("Falha ao serializar lista de dispositivos: %s", e)
         # Retorna os dados crus do DB se o cache falhar
         return devices 
 
     return device_data
 
 @router.get("/devices/{device_uuid}", response_model=DeviceResponse, tags=["Devices"])
-def get_device_by_uuid(
+async def get_device_by_uuid(
     device_uuid: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    device = db.query(Device).filter(Device.uuid == device_uuid).first()
+    device = await get_owned_device(db, device_uuid, current_user)
 
-    if not device or device.user_id != current_user.id:
+    if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     return device
 
 @router.put("/devices/{device_uuid}", response_model=DeviceResponse, tags=["Devices"])
-def update_device(
+async def update_device(
     device_uuid: str, 
     device_data: DeviceUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    existing_device = db.query(Device).filter(Device.uuid == device_uuid).first()
+    existing_device = await get_owned_device(db, device_uuid, current_user)
 
-    if not existing_device or existing_device.user_id != current_user.id:
+    if not existing_device:
         raise HTTPException(status_code=404, detail="Device not found")
         
     for key, value in device_data.dict(exclude_unset=True).items():
         setattr(existing_device, key, value)
         
-    db.commit()
-    db.refresh(existing_device)
+    await db.commit()
+    await db.refresh(existing_device)
     
     # Invalidação de Cache
-    clear_cache(f"user_devices:{str(current_user.id)}")
+    await clear_cache_async(build_cache_key("user_devices", current_user.id))
+    await invalidate_rule_index()
     return existing_device
 
 @router.delete("/devices/{device_uuid}", status_code=status.HTTP_204_NO_CONTENT, tags=["Devices"])
-def delete_device(
+async def delete_device(
     device_uuid: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    existing_device = db.query(Device).filter(Device.uuid == device_uuid).first()
+    existing_device = await get_owned_device(db, device_uuid, current_user)
 
-    if not existing_device or existing_device.user_id != current_user.id:
+    if not existing_device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    db.delete(existing_device)
-    db.commit()
+    await db.delete(existing_device)
+    await db.commit()
     
     # Invalidação de Cache
-    clear_cache(f"user_devices:{str(current_user.id)}")
+    await clear_cache_async(build_cache_key("user_devices", current_user.id))
+    await invalidate_rule_index()
+    await invalidate_ingest_key(existing_device.uuid)
+    await remove_latest_device(current_user.id, existing_device.uuid)
     return
 
+@router.post("/devices/{device_uuid}/ingest-token", response_model=IngestTokenResponse, tags=["Devices"])
+async def issue_ingest_token(
+    device_uuid: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Gera (ou rotaciona) o token de ingestão do dispositivo; o token anterior deixa de valer
+    device = await get_owned_device(db, device_uuid, current_user)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    token, key_hash = generate_ingest_token(device.uuid)
+    await db.merge(DeviceIngestKey(device_uuid=device.uuid, key_hash=key_hash, created_at=datetime.utcnow()))
+    await db.commit()
+
+    await invalidate_ingest_key(device.uuid)
+    return {"device_uuid": device.uuid, "ingest_token": token}
+
 @router.get("/devices/{device_uuid}/historical", response_model=HistoricalDataResponse, tags=["Devices"])
-def get_historical_data(
+async def get_historical_data(
     device_uuid: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     period: str = "last_24h"
 ):
-    cache_key = f"historical:{device_uuid}:{period}"
-    
-    if period == "last_24h":
-        cached_data = get_cache(cache_key)
-        if cached_data:
-            print(f"[CACHE HIT] Histórico 24h para {device_uuid}")
-            return cached_data
-
-    device = db.query(Device).filter(Device.uuid == device_uuid, Device.user_id == current_user.id).first()
+    device = await get_owned_device(db, device_uuid, current_user)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found or not owned by user.")
-
-# Calculo período de tempo para o filtro
-    if period == "last_24h":
-        time_limit = datetime.utcnow() - timedelta(hours=24)
-        interval_seconds = 60 * 60 # Agrupamento por hora
-    elif period == "last_7d":
-        time_limit = datetime.utcnow() - timedelta(days=7)
-        interval_seconds = 60 * 60 * 12 # Agrupamento por 12 horas
-    elif period == "last_30d":
-        time_limit = datetime.utcnow() - timedelta(days=30)
-        interval_seconds = 60 * 60 * 24 # Agrupamento por 24 horas
-    else:
+    if period not in HISTORICAL_PERIODS:
         raise HTTPException(status_code=400, detail="Invalid period. Use 'last_24h', 'last_7d', or 'last_30d'.")
 
-    # Consulta com agregação
-    historical_telemetry_raw = db.query(
-        func.floor(func.extract("epoch", Telemetry.boot_date) / interval_seconds).label("time_bucket"),
-        func.avg(Telemetry.cpu_usage).label("avg_cpu"),
-        func.avg(Telemetry.ram_usage).label("avg_ram"),
-        func.avg(Telemetry.temperature).label("avg_temp"),
-        func.min(Telemetry.boot_date).label("min_date") 
-    ).filter(
-        Telemetry.device_uuid == uuid.UUID(device_uuid),
-        Telemetry.boot_date >= time_limit
-    ).group_by("time_bucket").order_by("time_bucket").all()
-
+    async def compute():
+        logger.debug("Recalculando histórico.", extra={"sampled": True, "device_uuid": str(device_uuid), "period": period})
+        return serialize(await query_historical_data(db, device.uuid, period))
+
+    # Resposta em cache curto com single-flight; num miss só o balde ainda aberto vai ao banco
+    payload = await get_or_compute_raw_async(build_cache_key("historical", device.uuid, period), compute)
+    return Response(content=payload, media_type="application/json")
+
+def bucket_start(index: int, interval_seconds: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=index * interval_seconds)
+
+def bucket_index(moment: datetime, interval_seconds: int) -> int:
+    return int((moment - datetime(1970, 1, 1)).total_seconds() // interval_seconds)
+
+async def aggregate_buckets(db: AsyncSession, device_uuid: uuid.UUID, rollup, interval_seconds: int, start: datetime, end: Optional[datetime] = None) -> dict:
+    # Consulta com agregação sobre os baldes pré-calculados (rollups mantidos pelo worker)
+    conditions = [rollup.device_uuid == device_uuid, rollup.bucket_start >= start]
+    if end is not None:
+        conditions.append(rollup.bucket_start < end)
+
+    historical_telemetry_raw = (await db.execute(select(
+        func.floor(func.extract("epoch", rollup.bucket_start) / interval_seconds).label("time_bucket"),
+        (func.sum(rollup.cpu_usage_sum) / func.nullif(func.sum(rollup.cpu_usage_count), 0)).label("avg_cpu"),
+        (func.sum(rollup.ram_usage_sum) / func.nullif(func.sum(rollup.ram_usage_count), 0)).label("avg_ram"),
+        (func.sum(rollup.temperature_sum) / func.nullif(func.sum(rollup.temperature_count), 0)).label("avg_temp"),
+        func.min(rollup.bucket_start).label("min_date") 
+    ).where(*conditions).group_by("time_bucket").order_by("time_bucket"))).all()
+
+    return {int(t.time_bucket): [t.min_date, t.avg_cpu, t.avg_ram, t.avg_temp] for t in historical_telemetry_raw}
+
+async def query_historical_data(db: AsyncSession, device_uuid: uuid.UUID, period: str) -> dict:
+    window, interval_seconds, rollup = HISTORICAL_PERIODS[period]
+    now = datetime.utcnow()
+
+    # Janela alinhada ao agrupamento: o primeiro balde entra inteiro, então todo balde fechado é reaproveitável
+    first_index = bucket_index(now - window, interval_seconds)
+    # Baldes que terminaram antes da tolerância para telemetria atrasada não mudam mais
+    open_index = max(bucket_index(now - timedelta(seconds=settings.HISTORICAL_LATE_DATA_SECONDS), interval_seconds), first_index)
+    closed_indices = list(range(first_index, open_index))
+
+    buckets = await get_closed_buckets(device_uuid, period, closed_indices)
+    missing = [index for index in closed_indices if index not in buckets]
+    if missing:
+        # Uma consulta cobre todos os baldes fechados ainda fora do cache (inclusive os vazios)
+        computed = await aggregate_buckets(
+            db, device_uuid, rollup, interval_seconds,
+            bucket_start(missing[0], interval_seconds), bucket_start(open_index, interval_seconds)
+        )
+        closed = {index: computed.get(index) for index in missing}
+        buckets.update(closed)
+        await store_closed_buckets(device_uuid, period, closed, first_index, int(window.total_seconds()) + interval_seconds)
+
+    # Só o balde aberto (e os ainda sujeitos a atraso) é recalculado a cada miss
+    buckets.update(await aggregate_buckets(db, device_uuid, rollup, interval_seconds, bucket_start(open_index, interval_seconds)))
+
+    rows = [buckets[index] for index in sorted(buckets) if buckets[index] is not None]
     historical_data = {
-        "timestamps": [t.min_date for t in historical_telemetry_raw],
-        "cpu_usage": [t.avg_cpu for t in historical_telemetry_raw if t.avg_cpu is not None],
-        "ram_usage": [t.avg_ram for t in historical_telemetry_raw if t.avg_ram is not None],
-        "temperature": [t.avg_temp for t in historical_telemetry_raw if t.avg_temp is not None]
+        "timestamps": [t[0] for t in rows],
+        "cpu_usage": [t[1] for t in rows if t[1] is not None],
+        "ram_usage": [t[2] for t in rows if t[2] is not None],
+        "temperature": [t[3] for t in rows if t[3] is not None]
     }
 
-    if period == "last_24h":
-        print(f"[CACHE MISS] Salvando Histórico 24h para {device_uuid}")
-        set_cache(cache_key, historical_data, ttl_seconds=30)
-
     return historical_data
 
 @router.get("/devices/{device_uuid}/latest-telemetry-list", response_model=List[TelemetryResponse], tags=["Devices"])
-def get_latest_telemetry_list(
+async def get_latest_telemetry_list(
     device_uuid: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     limit: int = 20 # Parâmetro para limitar o número de registros
 ):
 
     #Retorna a lista das últimas telemetrias para um dispositivo específico do usuário
-    device = db.query(Device).filter(Device.uuid == device_uuid, Device.user_id == current_user.id).first()
+    device = await get_owned_device(db, device_uuid, current_user)
     
     if not device:
         raise HTTPException(status_code=404, detail="Device not found or not owned by user.")
 
     # Busca as últimas 'limit' telemetrias para o dispositivo, ordenando pela data de boot
-    telemetries = db.query(Telemetry).filter(
-        Telemetry.device_uuid == uuid.UUID(device_uuid)
+    telemetries = (await db.scalars(select(Telemetry).where(
+        Telemetry.device_uuid == device.uuid
     ).order_by(
         Telemetry.boot_date.desc()
-    ).limit(limit).all()
+    ).limit(limit))).all()
 
     # FastAPI/Pydantic se encarrega da conversão para List[TelemetryResponse]
     return telemetries
\ No newline at end of file
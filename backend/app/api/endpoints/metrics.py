@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from ...database.base import engine, async_engine
+from ...database.pool import sync_pool_metrics, async_pool_metrics
+
+router = APIRouter()
+
+# Métricas no formato de exposição do Prometheus
+@router.get("/metrics", tags=["Metrics"])
+def get_prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# Ocupação e tempo de espera dos pools de conexão do backend
+@router.get("/metrics/db-pool", tags=["Metrics"])
+def get_db_pool_metrics():
+    return {
+        "sync": sync_pool_metrics.snapshot(engine.pool),
+        "async": async_pool_metrics.snapshot(async_engine.sync_engine.pool),
+    }
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ...database.base import get_db
 from ...database.models import Notification, User
 from pydantic import BaseModel, field_validator
@@ -7,12 +8,13 @@ from typing import List, Optional
 import uuid
 from datetime import datetime
 from .devices import get_current_user
+from ...services.rule_index import invalidate_rule_index
 
 router = APIRouter()
 
 # Modelos Pydantic para validação
 class NotificationCreate(BaseModel):
-    device_uuid: Optional[str] = None
+    device_uuid: Optional[uuid.UUID] = None
     parameter: str
     operator: str = ">"
     threshold: float
@@ -41,10 +43,10 @@ class NotificationResponse(BaseModel):
 
 # Rota para criar uma notificação
 @router.post("/notifications", response_model=NotificationResponse, tags=["Notifications"])
-def create_notification(
+async def create_notification(
     notification: NotificationCreate,
     user: User = Depends(get_current_user), # Rota protegida
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     new_notification = Notification(
         user_id=user.id,
@@ -55,12 +57,15 @@ def create_notification(
         message=notification.message
     )
     db.add(new_notification)
-    db.commit()
-    db.refresh(new_notification)
+    await db.commit()
+    await db.refresh(new_notification)
+
+    # Recompila o índice de regras na próxima avaliação
+    await invalidate_rule_index()
     return new_notification
 
 # Rota para listar as notificações de um usuário
 @router.get("/notifications", response_model=List[NotificationResponse], tags=["Notifications"])
-def get_user_notifications(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    notifications = db.query(Notification).filter(Notification.user_id == user.id).all()
+async def get_user_notifications(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    notifications = (await db.scalars(select(Notification).where(Notification.user_id == user.id))).all()
     return notifications
\ No newline at end of file
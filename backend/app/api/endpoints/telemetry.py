@@ -1,15 +1,129 @@
-from fastapi import APIRouter, HTTPException
-from ...services.messaging_service import publish_telemetry_message
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional
+import json
+import uuid
+from ...core.config import settings
+from ...database.base import get_db
+from ...services.messaging_service import publish_telemetry_message, publish_telemetry_batch
+from ...services.ingest_auth import verify_ingest_token, verify_ingest_tokens
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+
+# --- Modelos Pydantic para validação ---
+class TelemetryIn(BaseModel):
+    device_uuid: uuid.UUID
+    cpu_usage: Optional[float] = None
+    ram_usage: Optional[float] = None
+    disk_free: Optional[float] = None
+    temperature: Optional[float] = None
+    latency: Optional[float] = None
+    connectivity: Optional[int] = None
+    boot_date: Optional[datetime] = None
+
+def is_same_device(device_uuid: uuid.UUID, value) -> bool:
+    try:
+        return device_uuid == uuid.UUID(str(value))
+    except ValueError:
+        return False
+
 @router.post("/telemetry")
-def receive_telemetry_data(data: dict):
+async def receive_telemetry_data(
+    data: dict,
+    x_device_token: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    # O token de ingestão precisa pertencer ao dispositivo informado no payload
+    if settings.TELEMETRY_REQUIRE_DEVICE_TOKEN:
+        device_uuid = await verify_ingest_token(db, x_device_token)
+        if device_uuid is None or not is_same_device(device_uuid, data.get("device_uuid")):
+            raise HTTPException(status_code=401, detail="Invalid device token")
+
     try:
-        publish_telemetry_message(data)
+        await publish_telemetry_message(data)
         return {"status": "success", "message": "Dados de telemetria recebidos e enviados para a fila."}
     except HTTPException as e:
         return {"status": "error", "message": e.detail}
     except Exception as e:
-        print(f"[ERRO] Falha ao enviar mensagem: {e}")
-        return {"status": "error", "message": "Erro interno ao processar os dados."}
\ No newline at end of file
+        logger.exception("Falha ao enviar mensagem: %s", e)
+        return {"status": "error", "message": "Erro interno ao processar os dados."}
+
+def parse_batch_body(raw_body: bytes, content_type: str) -> list:
+    # Converte o corpo em uma lista de itens (JSON array ou NDJSON, um objeto por linha)
+    if content_type.split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+        try:
+            lines = raw_body.decode("utf-8").splitlines()
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Body must be UTF-8 encoded.")
+        items = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(line) # Mantém a posição; será rejeitado na validação
+        return items
+
+    try:
+        items = json.loads(raw_body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body.")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of telemetry items.")
+    return items
+
+@router.post("/telemetry/batch")
+async def receive_telemetry_batch(
+    request: Request,
+    x_device_token: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    items = parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+
+    if len(items) > settings.TELEMETRY_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.TELEMETRY_BATCH_MAX_ITEMS} items.")
+
+    # Validação em uma única passada, guardando o resultado de cada item
+    results = []
+    validated = [] # (resultado, telemetria, token do item)
+    for index, item in enumerate(items):
+        try:
+            telemetry = TelemetryIn.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "invalid", "errors": e.errors(include_url=False, include_input=False)})
+            continue
+        result = {"index": index, "status": "queued"}
+        results.append(result)
+        # Cada item usa o próprio device_token ou o X-Device-Token da requisição
+        validated.append((result, telemetry, item.get("device_token") or x_device_token))
+
+    if settings.TELEMETRY_REQUIRE_DEVICE_TOKEN:
+        # Todas as chaves do lote são verificadas com no máximo uma consulta
+        authenticated = await verify_ingest_tokens(db, [token for _, _, token in validated])
+        for (result, telemetry, _), device_uuid in zip(validated, authenticated):
+            if device_uuid != telemetry.device_uuid:
+                result["status"] = "unauthorized"
+        validated = [entry for entry in validated if entry[0]["status"] == "queued"]
+
+    valid_messages = [telemetry.model_dump(mode="json", exclude_none=True) for _, telemetry, _ in validated]
+
+    try:
+        await publish_telemetry_batch(valid_messages)
+    except HTTPException as e:
+        for result in results:
+            if result["status"] == "queued":
+                result["status"] = "error"
+        return {"status": "error", "message": e.detail, "accepted": 0, "rejected": len(items), "results": results}
+
+    accepted = len(valid_messages)
+    rejected = len(items) - accepted
+    status = "success" if rejected == 0 else ("partial" if accepted else "error")
+    return {"status": status, "accepted": accepted, "rejected": rejected, "results": results}
@@ -3,18 +3,111 @@ import os
 class Settings:
     # Configurações do Banco de Dados
     DATABASE_URL: str = os.environ.get("DATABASE_URL", "postgresql://testeiotdb:iotdb2025@db:5432/iotdb")
+    # URL da engine assíncrona; por padrão a mesma base com o driver asyncpg
+    ASYNC_DATABASE_URL: str = os.environ.get(
+        "ASYNC_DATABASE_URL",
+        DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+    )
+    # Pool de conexões (vale para as engines síncrona e assíncrona)
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: float = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Conexão via PgBouncer (modo transação): NullPool e sem prepared statements
+    DB_PGBOUNCER: bool = os.environ.get("DB_PGBOUNCER", "false").lower() == "true"
 
     # Configurações do RabbitMQ
     RABBITMQ_HOST: str = os.environ.get("RABBITMQ_HOST", "rabbitmq")
     RABBITMQ_QUEUE: str = os.environ.get("RABBITMQ_QUEUE", "telemetry_queue")
+    # Exchange fanout: cada grupo de consumidores tem sua própria fila durável
+    RABBITMQ_EXCHANGE: str = os.environ.get("RABBITMQ_EXCHANGE", "telemetry_exchange")
+    RABBITMQ_NOTIFICATION_QUEUE: str = os.environ.get("RABBITMQ_NOTIFICATION_QUEUE", "telemetry_notifications_queue")
+    RABBITMQ_PUBLISH_TIMEOUT: float = float(os.environ.get("RABBITMQ_PUBLISH_TIMEOUT", 5))
+    RABBITMQ_PUBLISHER_MAX_PENDING: int = int(os.environ.get("RABBITMQ_PUBLISHER_MAX_PENDING", 10000))
+    RABBITMQ_PUBLISHER_RETRY_DELAY: float = float(os.environ.get("RABBITMQ_PUBLISHER_RETRY_DELAY", 1))
+    # Mensagens por transação do publicador (publicações pendentes são agrupadas até esse limite)
+    RABBITMQ_PUBLISHER_MAX_BATCH: int = int(os.environ.get("RABBITMQ_PUBLISHER_MAX_BATCH", 1000))
+
+    # Limite de itens por requisição em POST /telemetry/batch
+    TELEMETRY_BATCH_MAX_ITEMS: int = int(os.environ.get("TELEMETRY_BATCH_MAX_ITEMS", 1000))
+    # Exige o token de ingestão do dispositivo (X-Device-Token) em POST /telemetry
+    TELEMETRY_REQUIRE_DEVICE_TOKEN: bool = os.environ.get("TELEMETRY_REQUIRE_DEVICE_TOKEN", "true").lower() == "true"
+    # Cache em memória das chaves de ingestão (hash por dispositivo)
+    INGEST_KEY_CACHE_SIZE: int = int(os.environ.get("INGEST_KEY_CACHE_SIZE", 100000))
+    INGEST_KEY_CACHE_TTL_SECONDS: float = float(os.environ.get("INGEST_KEY_CACHE_TTL_SECONDS", 300))
 
     # Chave para o JWT
     SECRET_KEY: str = os.environ.get("SECRET_KEY", "gisele1409")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Autorização só pelas claims do token (id e username), sem consultar o banco
+    AUTH_STATELESS: bool = os.environ.get("AUTH_STATELESS", "true").lower() == "true"
+    # Cache LRU de usuários usado quando a consulta ao banco é necessária (0 desativa)
+    AUTH_USER_CACHE_SIZE: int = int(os.environ.get("AUTH_USER_CACHE_SIZE", 1024))
+    AUTH_USER_CACHE_TTL_SECONDS: float = float(os.environ.get("AUTH_USER_CACHE_TTL_SECONDS", 60))
+    # Cópia local dos tokens revogados; acima desse tamanho a consulta volta a ir ao Redis
+    REVOKED_TOKENS_LOCAL_SIZE: int = int(os.environ.get("REVOKED_TOKENS_LOCAL_SIZE", 100000))
+    # bcrypt: custo do hash e processos dedicados (0 = threads do próprio processo)
+    BCRYPT_ROUNDS: int = int(os.environ.get("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    # Hashes simultâneos em /login e /register; excedentes esperam até o timeout e recebem 503
+    PASSWORD_HASH_MAX_CONCURRENCY: int = int(os.environ.get("PASSWORD_HASH_MAX_CONCURRENCY", 4))
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", 5))
     
     # Configurações do Redis
     REDIS_HOST: str = os.environ.get("REDIS_HOST", "redis")
     REDIS_PORT: int = int(os.environ.get("REDIS_PORT", 6379))
+    REDIS_MAX_CONNECTIONS: int = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_SOCKET_TIMEOUT: float = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 1))
+    # Cache em memória (L1) na frente do Redis; 0 itens desativa
+    CACHE_L1_MAX_ITEMS: int = int(os.environ.get("CACHE_L1_MAX_ITEMS", 10000))
+    CACHE_L1_TTL_SECONDS: float = float(os.environ.get("CACHE_L1_TTL_SECONDS", 5))
+    CACHE_INVALIDATION_RETRY_SECONDS: float = float(os.environ.get("CACHE_INVALIDATION_RETRY_SECONDS", 5))
+    # Por quanto tempo o ouvinte de invalidação é considerado conectado sem dar sinal de vida
+    CACHE_INVALIDATION_LEASE_SECONDS: float = float(os.environ.get("CACHE_INVALIDATION_LEASE_SECONDS", 5))
+    # Single-flight: só uma requisição (em todas as réplicas) recalcula uma chave expirada
+    CACHE_LOCK_TIMEOUT_SECONDS: float = float(os.environ.get("CACHE_LOCK_TIMEOUT_SECONDS", 10))
+    CACHE_LOCK_WAIT_SECONDS: float = float(os.environ.get("CACHE_LOCK_WAIT_SECONDS", 2))
+    CACHE_LOCK_POLL_SECONDS: float = float(os.environ.get("CACHE_LOCK_POLL_SECONDS", 0.05))
+    # Stale-while-revalidate: por quanto tempo após o TTL o valor vencido ainda pode ser servido (0 desativa)
+    CACHE_STALE_SECONDS: int = int(os.environ.get("CACHE_STALE_SECONDS", 30))
+    CACHE_DEFAULT_TTL_SECONDS: int = int(os.environ.get("CACHE_DEFAULT_TTL_SECONDS", 3600))
+    # TTL do cache por namespace, ex.: "historical=30,user_devices=60"
+    CACHE_TTLS: dict = {
+        namespace.strip(): int(ttl)
+        for namespace, _, ttl in (
+            item.partition("=") for item in os.environ.get(
+                "CACHE_TTLS", "user_devices=60,historical=30"
+            ).split(",") if item.strip()
+        )
+    }
+
+    # Telemetria pode chegar atrasada (boot_date informado pelo dispositivo): baldes do histórico
+    # só são considerados fechados, e cacheados sem expiração, depois dessa tolerância
+    HISTORICAL_LATE_DATA_SECONDS: int = int(os.environ.get("HISTORICAL_LATE_DATA_SECONDS", 3600))
+
+    # Recarga periódica do índice de regras de notificação (segundos)
+    RULE_INDEX_TTL_SECONDS: float = float(os.environ.get("RULE_INDEX_TTL_SECONDS", 60))
+    # Avaliação de notificações em lote
+    NOTIFICATION_BATCH_SIZE: int = int(os.environ.get("NOTIFICATION_BATCH_SIZE", 200))
+    NOTIFICATION_FLUSH_INTERVAL_MS: int = int(os.environ.get("NOTIFICATION_FLUSH_INTERVAL_MS", 100))
+
+    # Particionamento da telemetria por boot_date (somente PostgreSQL)
+    TELEMETRY_PARTITIONING: bool = os.environ.get("TELEMETRY_PARTITIONING", "true").lower() == "true"
+    TELEMETRY_PARTITION_INTERVAL: str = os.environ.get("TELEMETRY_PARTITION_INTERVAL", "day") # "day" ou "week"
+    TELEMETRY_PARTITION_PREMAKE: int = int(os.environ.get("TELEMETRY_PARTITION_PREMAKE", 7))
+    TELEMETRY_PARTITION_MAINTENANCE_SECONDS: float = float(os.environ.get("TELEMETRY_PARTITION_MAINTENANCE_SECONDS", 3600))
+    # Migra uma tabela de telemetria comum já existente para a versão particionada
+    TELEMETRY_PARTITION_MIGRATE: bool = os.environ.get("TELEMETRY_PARTITION_MIGRATE", "false").lower() == "true"
+    # Dias de telemetria bruta mantidos (0 = sem retenção). Os rollups não são afetados.
+    TELEMETRY_RETENTION_DAYS: int = int(os.environ.get("TELEMETRY_RETENTION_DAYS", 0))
+
+    # Logs: nível, formato ("json" ou "text"), fração mantida das linhas por mensagem (DEBUG amostrado)
+    # e tamanho da fila entre quem registra e a thread que escreve (cheia = linha descartada)
+    LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.environ.get("LOG_FORMAT", "json")
+    LOG_SAMPLE_RATE: float = float(os.environ.get("LOG_SAMPLE_RATE", 0.01))
+    LOG_QUEUE_SIZE: int = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
 
 settings = Settings()
\ No newline at end of file
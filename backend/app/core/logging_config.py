@@ -0,0 +1,14 @@
+from shared import logging_config as shared_logging
+from shared.logging_config import JsonFormatter, SamplingFilter, NonBlockingQueueHandler
+from .config import settings
+
+# Logs estruturados (JSON) compartilhados com o worker e o simulador: ver shared/logging_config.py
+
+def setup_logging(service: str):
+    shared_logging.setup_logging(
+        service,
+        level=settings.LOG_LEVEL,
+        log_format=settings.LOG_FORMAT,
+        sample_rate=settings.LOG_SAMPLE_RATE,
+        queue_size=settings.LOG_QUEUE_SIZE,
+    )
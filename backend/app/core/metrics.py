@@ -0,0 +1,120 @@
+import time
+from prometheus_client import Counter, Histogram, Gauge, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy import event
+
+# Métricas do backend no formato do Prometheus (expostas em GET /metrics).
+# Rótulos só com valores de cardinalidade limitada: rota (modelo do caminho), namespace do cache etc.
+
+# Baldes para operações de milissegundos a segundos
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP por rota",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+cache_lookups = Counter(
+    "cache_lookups_total", "Consultas ao cache por namespace e resultado (l1, redis, stale, miss, error)",
+    ["namespace", "result"],
+)
+publish_seconds = Histogram(
+    "rabbitmq_publish_duration_seconds", "Tempo até a confirmação do broker por publicação",
+    ["result"], buckets=LATENCY_BUCKETS,
+)
+publish_batch_size = Histogram(
+    "rabbitmq_publish_batch_size", "Mensagens por publicação", buckets=BATCH_SIZE_BUCKETS,
+)
+publisher_pending = Gauge(
+    "rabbitmq_publisher_pending", "Publicações aguardando a thread do publicador",
+)
+consumer_lag_seconds = Histogram(
+    "rabbitmq_consumer_lag_seconds", "Tempo entre a publicação e o processamento da mensagem",
+    ["consumer"], buckets=LATENCY_BUCKETS,
+)
+notification_batch_size = Histogram(
+    "notification_batch_size", "Mensagens por lote avaliado pelo processador de notificações",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+notification_batch_seconds = Histogram(
+    "notification_batch_duration_seconds", "Tempo de avaliação de um lote de notificações",
+    buckets=LATENCY_BUCKETS,
+)
+alerts_emitted = Counter("alerts_emitted_total", "Alertas disparados pelas regras de notificação")
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Tempo de execução das consultas ao banco",
+    ["engine", "operation"], buckets=LATENCY_BUCKETS,
+)
+
+# --- HTTP ---
+class PrometheusMiddleware:
+    # Middleware ASGI puro: mede a requisição inteira e rotula pelo modelo da rota (/devices/{device_uuid}),
+    # nunca pelo caminho concreto
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status[0])
+            ).observe(time.perf_counter() - start)
+
+# --- Cache ---
+def record_cache_lookup(key: str, result: str, count: int = 1):
+    if count:
+        cache_lookups.labels(key.split(":", 1)[0], result).inc(count)
+
+# --- Banco de dados ---
+def instrument_engine(engine, name: str):
+    # Tempo de cada comando via eventos do SQLAlchemy; a operação é o primeiro verbo do SQL
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            operation = (statement.split(None, 1) or ["OTHER"])[0].upper()
+            db_query_seconds.labels(name, operation).observe(time.perf_counter() - starts.pop())
+
+class PoolCollector:
+    # Ocupação e espera dos pools (PoolMetrics) lidas no momento da coleta
+    def __init__(self, pools: dict):
+        # nome -> (PoolMetrics, função que devolve o pool atual da engine)
+        self.pools = pools
+
+    def collect(self):
+        gauges = {
+            field: GaugeMetricFamily(f"db_pool_{field}", f"Conexões do pool ({field})", labels=["engine"])
+            for field in ("size", "checked_out", "overflow", "checked_in")
+        }
+        counters = {
+            "checkouts": CounterMetricFamily("db_pool_checkouts", "Checkouts de conexões do pool", labels=["engine"]),
+            "wait_seconds_total": CounterMetricFamily("db_pool_wait_seconds", "Espera acumulada por conexões", labels=["engine"]),
+            "timeouts": CounterMetricFamily("db_pool_timeouts", "Checkouts que esgotaram o pool_timeout", labels=["engine"]),
+        }
+        for name, (metrics, get_pool) in self.pools.items():
+            stats = metrics.snapshot(get_pool())
+            for field, family in {**gauges, **counters}.items():
+                family.add_metric([name], stats[field])
+        yield from gauges.values()
+        yield from counters.values()
+
+def register_pool_collector(pools: dict):
+    REGISTRY.register(PoolCollector(pools))
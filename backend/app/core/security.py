@@ -1,4 +1,8 @@
+import asyncio
 import bcrypt
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -9,14 +13,57 @@ SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-def hash_password(password: str) -> str:
+# Pool de processos para o bcrypt (CPU-bound) e limite de hashes simultâneos
+password_pool = None
+password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+
+class PasswordHashBusy(Exception):
+    # Fila de hashes cheia: o chamador deve responder 503
+    pass
+
+def hash_password(password: str, rounds: int = None) -> str:
     # Faz o hash da senha usando bcrypt
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # Compara a senha em texto puro com o hash
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def start_password_pool():
+    # "spawn" evita herdar as threads do servidor no fork
+    global password_pool
+    if password_pool is None and settings.PASSWORD_HASH_WORKERS > 0:
+        password_pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+def stop_password_pool():
+    global password_pool
+    if password_pool is not None:
+        password_pool.shutdown(wait=False, cancel_futures=True)
+        password_pool = None
+
+async def run_password_task(fn, *args):
+    # Executa o bcrypt fora do loop de eventos, respeitando o limite de concorrência
+    try:
+        await asyncio.wait_for(password_slots.acquire(), timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusy()
+    try:
+        start_password_pool()
+        return await asyncio.get_running_loop().run_in_executor(password_pool, fn, *args)
+    finally:
+        password_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    # O custo vai explícito: o processo filho não herda alterações nas configurações
+    return await run_password_task(hash_password, password, settings.BCRYPT_ROUNDS)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     # Cria um token de acesso JWT
     to_encode = data.copy()
@@ -24,7 +71,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifica o token na lista de revogação (logout)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
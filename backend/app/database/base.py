@@ -1,24 +1,49 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from ..core.config import settings
-from typing import Generator
+from ..core.metrics import instrument_engine, register_pool_collector
+from .pool import engine_options, sync_pool_metrics, async_pool_metrics
+from typing import AsyncGenerator
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
+# Engine síncrona: inicialização, manutenção e threads (processador de notificações)
+engine = create_engine(DATABASE_URL, **engine_options(sync_pool_metrics))
+
+# Engine assíncrona (asyncpg) usada pelos endpoints
+async_engine = create_async_engine(settings.ASYNC_DATABASE_URL, **engine_options(async_pool_metrics, async_driver=True))
+
+# Tempo das consultas e ocupação dos pools expostos em /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+register_pool_collector({
+    "sync": (sync_pool_metrics, lambda: engine.pool),
+    "async": (async_pool_metrics, lambda: async_engine.sync_engine.pool),
+})
 
 Base = declarative_base()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Função para obter a sessão do banco de dados
-def get_db() -> Generator:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Função para criar todas as tabelas
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from .partitioning import create_partitioned_telemetry, is_enabled
+
+    if is_enabled(engine):
+        # A telemetria particionada é criada por DDL próprio; as demais tabelas vêm do create_all
+        telemetry = Base.metadata.tables["telemetry"]
+        Base.metadata.create_all(bind=engine, tables=[t for t in Base.metadata.sorted_tables if t is not telemetry])
+        create_partitioned_telemetry(engine)
+    Base.metadata.create_all(bind=engine)
+
+    # create_all não adiciona índices novos em tabelas já existentes
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
\ No newline at end of file
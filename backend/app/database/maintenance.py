@@ -0,0 +1,107 @@
+# Backfill único das tabelas mantidas pelo worker, para bancos com histórico anterior a elas.
+# Roda como comando avulso, fora da inicialização da API (na pasta do backend):
+#   python -m app.database.maintenance
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+from .base import SessionLocal, create_tables
+from .models import (
+    Device, Telemetry, DeviceLatestTelemetry,
+    ROLLUP_METRICS, TelemetryRollupHourly, TelemetryRollupDaily
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Trava consultiva para que duas execuções do backfill não concorram
+BACKFILL_LOCK_ID = 7_204_311
+
+def lock_backfill(db: Session):
+    # Liberada no commit da transação
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": BACKFILL_LOCK_ID})
+
+def insert_missing(db: Session, model):
+    # INSERT que ignora chaves já gravadas pelos workers (ON CONFLICT DO NOTHING)
+    dialect_insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(db.get_bind().dialect.name)
+    return dialect_insert(model).on_conflict_do_nothing() if dialect_insert else insert(model)
+
+def backfill_latest_telemetry(db: Session):
+    # Popula device_latest_telemetry a partir do histórico quando a tabela ainda está vazia
+    lock_backfill(db)
+    if db.query(DeviceLatestTelemetry.device_uuid).first() is not None:
+        db.rollback()
+        return
+
+    # Para cada dispositivo, o id da telemetria mais recente (índice device_uuid, boot_date DESC)
+    newer = aliased(Telemetry)
+    latest_id_per_device = select(
+        select(newer.id).where(
+            newer.device_uuid == Device.uuid
+        ).order_by(newer.boot_date.desc()).limit(1).correlate(Device).scalar_subquery()
+    ).select_from(Device)
+
+    db.execute(insert_missing(db, DeviceLatestTelemetry).from_select(
+        ["device_uuid", "telemetry_id", "cpu_usage", "ram_usage", "disk_free",
+         "temperature", "latency", "connectivity", "boot_date"],
+        select(
+            Telemetry.device_uuid, Telemetry.id, Telemetry.cpu_usage, Telemetry.ram_usage, Telemetry.disk_free,
+            Telemetry.temperature, Telemetry.latency, Telemetry.connectivity, Telemetry.boot_date
+        ).where(Telemetry.id.in_(latest_id_per_device))
+    ))
+    db.commit()
+
+
+def backfill_rollups(db: Session, chunk_size: int = 5000):
+    # Gera os agregados horários e diários a partir do histórico quando ainda estão vazios.
+    # Depois disso o worker os mantém incrementalmente a cada lote gravado. Rode com os workers
+    # parados: baldes que um worker já tenha criado são mantidos, sem somar o histórico a eles.
+    for model in (TelemetryRollupHourly, TelemetryRollupDaily):
+        lock_backfill(db)
+        if db.query(model.device_uuid).first() is not None:
+            db.rollback()
+            continue
+
+        bucket = func.floor(func.extract("epoch", Telemetry.boot_date) / model.bucket_seconds).label("bucket")
+        aggregates = []
+        for metric in ROLLUP_METRICS:
+            column = getattr(Telemetry, metric)
+            aggregates += [func.sum(column), func.min(column), func.max(column), func.count(column)]
+
+        query = db.query(Telemetry.device_uuid, bucket, *aggregates).filter(
+            Telemetry.boot_date.isnot(None)
+        ).group_by(Telemetry.device_uuid, bucket)
+
+        chunk = []
+        for row in query.yield_per(chunk_size):
+            values = {
+                "device_uuid": row[0],
+                "bucket_start": EPOCH + timedelta(seconds=int(row[1]) * model.bucket_seconds),
+            }
+            for i, metric in enumerate(ROLLUP_METRICS):
+                metric_sum, metric_min, metric_max, metric_count = row[2 + i * 4: 6 + i * 4]
+                values.update({
+                    f"{metric}_sum": metric_sum,
+                    f"{metric}_min": metric_min,
+                    f"{metric}_max": metric_max,
+                    f"{metric}_count": metric_count,
+                })
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                db.execute(insert_missing(db, model), chunk)
+                chunk = []
+        if chunk:
+            db.execute(insert_missing(db, model), chunk)
+        db.commit()
+
+def main():
+    create_tables()
+    db = SessionLocal()
+    try:
+        backfill_latest_telemetry(db)
+        backfill_rollups(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
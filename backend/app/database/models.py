@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON, Index
+from sqlalchemy.orm import relationship, declared_attr
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime
 import uuid
@@ -43,7 +43,64 @@ class Telemetry(Base):
     connectivity = Column(Integer)
     boot_date = Column(DateTime)
     device_uuid = Column(UUID(as_uuid=True), ForeignKey('devices.uuid'), nullable=False, index=True)
+
+    __table_args__ = (
+        # Atende "última telemetria por dispositivo" e consultas por período
+        Index('ix_telemetry_device_uuid_boot_date', 'device_uuid', boot_date.desc()),
+    )
     
+# --- Última Telemetria por Dispositivo ---
+# Mantida pelo worker a cada gravação (upsert), evita varrer o histórico no dashboard
+class DeviceLatestTelemetry(Base):
+    __tablename__ = 'device_latest_telemetry'
+
+    device_uuid = Column(UUID(as_uuid=True), ForeignKey('devices.uuid'), primary_key=True)
+    telemetry_id = Column(Integer, nullable=False)
+    cpu_usage = Column(Float)
+    ram_usage = Column(Float)
+    disk_free = Column(Float)
+    temperature = Column(Float)
+    latency = Column(Float)
+    connectivity = Column(Integer)
+    boot_date = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# --- Chave de Ingestão por Dispositivo ---
+# Credencial de longa duração usada em POST /telemetry; guarda apenas o HMAC do segredo
+class DeviceIngestKey(Base):
+    __tablename__ = 'device_ingest_keys'
+
+    device_uuid = Column(UUID(as_uuid=True), ForeignKey('devices.uuid', ondelete='CASCADE'), primary_key=True)
+    key_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# --- Agregados de Telemetria (rollups) ---
+# Métricas agregadas por balde de tempo: soma, mínimo, máximo e contagem de cada métrica.
+# Mantidos incrementalmente pelo worker; a média é soma / contagem.
+ROLLUP_METRICS = ("cpu_usage", "ram_usage", "disk_free", "temperature", "latency")
+
+class TelemetryRollupMixin:
+    @declared_attr
+    def device_uuid(cls):
+        return Column(UUID(as_uuid=True), ForeignKey('devices.uuid'), primary_key=True)
+
+    bucket_start = Column(DateTime, primary_key=True)
+
+for _metric in ROLLUP_METRICS:
+    setattr(TelemetryRollupMixin, f"{_metric}_sum", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_min", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_max", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_count", Column(Integer))
+del _metric
+
+class TelemetryRollupHourly(TelemetryRollupMixin, Base):
+    __tablename__ = 'telemetry_rollup_hourly'
+    bucket_seconds = 60 * 60
+
+class TelemetryRollupDaily(TelemetryRollupMixin, Base):
+    __tablename__ = 'telemetry_rollup_daily'
+    bucket_seconds = 60 * 60 * 24
+
 # --- Modelo de Notificação ---
 class Notification(Base):
     __tablename__ = "notifications"
@@ -0,0 +1,216 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Particionamento nativo do PostgreSQL da tabela de telemetria por faixa de boot_date.
+# Cada partição cobre um dia ou uma semana (telemetry_pAAAAMMDD); linhas fora das faixas
+# criadas caem em telemetry_default. A retenção remove partições inteiras (DROP TABLE)
+# e apaga da partição default as linhas anteriores ao limite.
+
+PARENT_TABLE = "telemetry"
+DEFAULT_PARTITION = "telemetry_default"
+# Faixa declarada da partição, como devolvida por pg_get_expr(relpartbound, oid)
+PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# Trava consultiva para que apenas uma réplica execute a manutenção por vez
+MAINTENANCE_LOCK_ID = 7_204_310
+
+CREATE_PARTITIONED_TELEMETRY = f"""
+CREATE TABLE {PARENT_TABLE} (
+    id SERIAL NOT NULL,
+    cpu_usage DOUBLE PRECISION,
+    ram_usage DOUBLE PRECISION,
+    disk_free DOUBLE PRECISION,
+    temperature DOUBLE PRECISION,
+    latency DOUBLE PRECISION,
+    connectivity INTEGER,
+    boot_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    device_uuid UUID NOT NULL REFERENCES devices (uuid),
+    PRIMARY KEY (id, boot_date)
+) PARTITION BY RANGE (boot_date)
+"""
+
+def is_enabled(engine: Engine) -> bool:
+    return settings.TELEMETRY_PARTITIONING and engine.dialect.name == "postgresql"
+
+def partition_step() -> timedelta:
+    return timedelta(weeks=1) if settings.TELEMETRY_PARTITION_INTERVAL == "week" else timedelta(days=1)
+
+def partition_start(moment: datetime) -> datetime:
+    # Início da partição que contém o instante (semanas começam na segunda-feira)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if settings.TELEMETRY_PARTITION_INTERVAL == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+def partition_name(start: datetime) -> str:
+    return f"telemetry_p{start:%Y%m%d}"
+
+def table_kind(connection, table_name: str):
+    # 'p' = particionada, 'r' = tabela comum, None = inexistente
+    return connection.execute(
+        text("SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+             "WHERE c.relname = :name AND n.nspname = current_schema()"),
+        {"name": table_name}
+    ).scalar()
+
+def partition_ranges(connection) -> list:
+    # (nome, início, fim) das partições anexadas, lidos do catálogo: a faixa real de cada uma,
+    # mesmo que tenha sido criada com outro TELEMETRY_PARTITION_INTERVAL. A default fica de fora.
+    rows = connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :parent"
+    ), {"parent": PARENT_TABLE}).all()
+    ranges = []
+    for name, bound in rows:
+        match = PARTITION_BOUND.search(bound or "")
+        if match:
+            ranges.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return ranges
+
+def create_partitioned_telemetry(engine: Engine):
+    # Cria a tabela pai particionada (antes do create_all) ou migra uma tabela comum existente
+    if not is_enabled(engine):
+        return
+
+    with engine.begin() as connection:
+        kind = table_kind(connection, PARENT_TABLE)
+        if kind == "p":
+            return
+        if kind == "r":
+            if not settings.TELEMETRY_PARTITION_MIGRATE:
+                logger.warning("Tabela 'telemetry' existente não é particionada. "
+                               "Defina TELEMETRY_PARTITION_MIGRATE=true para migrá-la.")
+                return
+            migrate_legacy_telemetry(connection)
+            return
+
+        connection.execute(text(CREATE_PARTITIONED_TELEMETRY))
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        logger.info("Tabela 'telemetry' criada com particionamento por boot_date.")
+
+def migrate_legacy_telemetry(connection):
+    # Renomeia a tabela comum, cria a particionada e copia o histórico para as partições
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO telemetry_legacy"))
+    # Libera o nome da chave primária para a nova tabela
+    connection.execute(text("ALTER TABLE telemetry_legacy RENAME CONSTRAINT telemetry_pkey TO telemetry_legacy_pkey"))
+    connection.execute(text(CREATE_PARTITIONED_TELEMETRY))
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+
+    oldest, newest = connection.execute(text("SELECT min(boot_date), max(boot_date) FROM telemetry_legacy")).one()
+    if oldest is not None:
+        start = partition_start(oldest)
+        while start <= newest:
+            create_partition(connection, start)
+            start += partition_step()
+
+    connection.execute(text(
+        f"INSERT INTO {PARENT_TABLE} (id, cpu_usage, ram_usage, disk_free, temperature, latency, connectivity, boot_date, device_uuid) "
+        "SELECT id, cpu_usage, ram_usage, disk_free, temperature, latency, connectivity, boot_date, device_uuid "
+        "FROM telemetry_legacy WHERE boot_date IS NOT NULL"
+    ))
+    # Continua a sequência de ids a partir do maior id migrado
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), COALESCE((SELECT max(id) FROM {PARENT_TABLE}), 0) + 1, false)"
+    ))
+    connection.execute(text("DROP TABLE telemetry_legacy"))
+    logger.info("Histórico migrado para a tabela particionada.")
+
+def create_partition(connection, start: datetime):
+    # Cria a partição [start, start + intervalo). Linhas dessa faixa que já estejam na
+    # partição default são movidas antes do ATTACH (senão o PostgreSQL recusa a operação).
+    name = partition_name(start)
+    if table_kind(connection, name) is not None:
+        return
+    end = start + partition_step()
+    # Faixa já coberta por uma partição de outro intervalo (ex.: semanal antes da troca para diário)
+    if any(lower < end and start < upper for _, lower, upper in partition_ranges(connection)):
+        return
+    bounds = {"start": start, "end": end}
+
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE boot_date >= :start AND boot_date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    connection.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+    ))
+
+def create_upcoming_partitions(connection, now: datetime):
+    start = partition_start(now)
+    for _ in range(settings.TELEMETRY_PARTITION_PREMAKE + 1):
+        create_partition(connection, start)
+        start += partition_step()
+
+def retention_cutoff(now: datetime):
+    # Limite de retenção; None quando a retenção está desativada
+    if settings.TELEMETRY_RETENTION_DAYS <= 0:
+        return None
+    return now - timedelta(days=settings.TELEMETRY_RETENTION_DAYS)
+
+def drop_expired_partitions(connection, now: datetime) -> list:
+    # Remove partições cujo intervalo terminou antes do limite de retenção
+    cutoff = retention_cutoff(now)
+    if cutoff is None:
+        return []
+
+    dropped = []
+    for name, _, end in partition_ranges(connection):
+        if end <= cutoff:
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+def delete_expired_default_rows(connection, now: datetime) -> int:
+    # Linhas antigas que caíram na partição default (ex.: boot_date anterior às partições criadas)
+    cutoff = retention_cutoff(now)
+    if cutoff is None:
+        return 0
+    return connection.execute(
+        text(f"DELETE FROM {DEFAULT_PARTITION} WHERE boot_date < :cutoff"), {"cutoff": cutoff}
+    ).rowcount
+
+def run_partition_maintenance(engine: Engine, now: datetime = None):
+    # Cria as próximas partições e aplica a retenção (uma réplica por vez)
+    if not is_enabled(engine):
+        return
+    now = now or datetime.utcnow()
+
+    with engine.begin() as connection:
+        if table_kind(connection, PARENT_TABLE) != "p":
+            return
+        if not connection.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+            return
+        create_upcoming_partitions(connection, now)
+        dropped = drop_expired_partitions(connection, now)
+        if dropped:
+            logger.info("Partições removidas pela retenção: %s", ", ".join(dropped))
+        deleted = delete_expired_default_rows(connection, now)
+        if deleted:
+            logger.info("Linhas removidas da partição default pela retenção: %d", deleted)
+
+def start_partition_maintenance(engine: Engine):
+    # Thread em segundo plano que repete a manutenção periodicamente
+    if not is_enabled(engine):
+        return
+
+    def loop():
+        while True:
+            try:
+                run_partition_maintenance(engine)
+            except Exception as e:
+                logger.exception("Falha na manutenção de partições: %s", e)
+            time.sleep(settings.TELEMETRY_PARTITION_MAINTENANCE_SECONDS)
+
+    threading.Thread(target=loop, name="partition-maintenance", daemon=True).start()
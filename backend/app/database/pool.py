@@ -0,0 +1,29 @@
+import uuid
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from shared.pool_metrics import PoolMetrics, measured_pool
+from ..core.config import settings
+
+def engine_options(metrics: PoolMetrics, async_driver: bool = False) -> dict:
+    # Argumentos de create_engine/create_async_engine a partir das configurações
+    if settings.DB_PGBOUNCER:
+        # PgBouncer (modo transação) faz o pooling: sem pool local e sem prepared statements
+        options = {"poolclass": NullPool}
+        if async_driver:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return options
+
+    return {
+        "poolclass": measured_pool(AsyncAdaptedQueuePool if async_driver else QueuePool, metrics),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
@@ -1,17 +1,31 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database.base import get_db
 from .database.models import User
 from .core.security import decode_access_token
 from .core.config import settings
+from .core.ttl_cache import TTLCache
+from .services.token_revocation import is_token_revoked
 from typing import Optional
 from jose import JWTError, jwt
 import uuid
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+class AuthenticatedUser:
+    # Usuário autenticado montado a partir das claims do token ou do cache
+    __slots__ = ("id", "username")
+
+    def __init__(self, id: uuid.UUID, username: str):
+        self.id = id
+        self.username = username
+
+# Usuários já consultados no banco (tokens sem a claim username ou modo stateful)
+user_cache = TTLCache(maxsize=settings.AUTH_USER_CACHE_SIZE, ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -32,8 +46,23 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except ValueError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_uuid).first()
-    if user is None:
+    jti = payload.get("jti")
+    if jti and await is_token_revoked(jti):
+        raise credentials_exception
+
+    # Modo stateless: a assinatura do token basta, sem ida ao banco
+    username = payload.get("username")
+    if settings.AUTH_STATELESS and username:
+        return AuthenticatedUser(user_uuid, username)
+
+    user = user_cache.get(user_uuid)
+    if user is not None:
+        return user
+
+    db_user = await db.scalar(select(User).where(User.id == user_uuid))
+    if db_user is None:
         raise credentials_exception
     
+    user = AuthenticatedUser(db_user.id, db_user.username)
+    user_cache.set(user_uuid, user)
     return user
\ No newline at end of file
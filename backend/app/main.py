@@ -1,12 +1,20 @@
+import logging
 import asyncio
 import threading
 import time
 import socketio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.endpoints import telemetry, auth, devices, notifications
-from .database.base import create_tables
-from .services import notification_processor
+from .api.endpoints import telemetry, auth, devices, notifications, metrics
+from .database.base import create_tables, engine, async_engine
+from .database.partitioning import run_partition_maintenance, start_partition_maintenance
+from .services import notification_processor, messaging_service, cache_service
+from .core.security import start_password_pool, stop_password_pool
+from .core.metrics import PrometheusMiddleware
+from .core.logging_config import setup_logging
+
+setup_logging("backend")
+logger = logging.getLogger(__name__)
 
 sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
 
@@ -23,12 +31,15 @@ fastapi_app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latência por rota (externo ao CORS: mede a resposta completa)
+fastapi_app.add_middleware(PrometheusMiddleware)
 
 # Inclui os routers
 fastapi_app.include_router(telemetry.router)
 fastapi_app.include_router(auth.router, prefix="/api/v1")
 fastapi_app.include_router(devices.router, prefix="/api/v1")
 fastapi_app.include_router(notifications.router, prefix="/api/v1")
+fastapi_app.include_router(metrics.router)
 
 fastapi_app.mount("/socket.io", socketio.ASGIApp(sio))
 
@@ -42,6 +53,9 @@ def get_main_loop_and_start_processor():
     global main_event_loop
     main_event_loop = asyncio.get_event_loop()
     create_tables()
+    # Partições do período atual e seguintes precisam existir antes da primeira gravação
+    run_partition_maintenance(engine)
+    start_partition_maintenance(engine)
 
     # Inicia a thread
     thread = threading.Thread(
@@ -50,7 +64,21 @@ def get_main_loop_and_start_processor():
         daemon=True
     )
     thread.start()
-    print("[INIT] Processador de Notificações iniciado em thread separada.")
+    logger.info("Processador de notificações iniciado em thread separada.")
+
+    # Publicador persistente de telemetria (conexão reaproveitada entre requisições)
+    messaging_service.publisher.start()
+    # Invalidação do cache em memória disparada por qualquer réplica
+    cache_service.start_invalidation_listener()
+
+    # Processos do bcrypt sobem antes do primeiro login
+    start_password_pool()
+
+@fastapi_app.on_event("shutdown")
+async def stop_publisher():
+    messaging_service.publisher.stop()
+    stop_password_pool()
+    await async_engine.dispose()
 
 
 @sio.on('connect')
@@ -58,10 +86,10 @@ async def connect(sid, environ, auth):
     user_id = auth.get('userId')
     if user_id:
         await sio.enter_room(sid, str(user_id)) 
-        print(f"[SOCKET.IO DEBUG] Conexão recebida. SID: {sid}, Auth Payload: {auth}")
-        print(f"[SOCKET.IO] Cliente {sid} ENTROU na sala {user_id}")
+        # O payload de autenticação não vai para o log
+        logger.debug("Cliente Socket.IO entrou na sala do usuário.", extra={"sid": sid, "user_id": user_id})
     else:
-        print(f"[SOCKET.IO] Cliente {sid} conectado sem autenticação.")
+        logger.info("Cliente Socket.IO conectado sem autenticação.", extra={"sid": sid})
 
 # Exponha a instância do FastAPI para o Uvicorn
 app = fastapi_app
@@ -1,48 +1,348 @@
+import logging
+import asyncio
 import redis
-import json
+import redis.asyncio as aioredis
+import orjson
+import threading
+import time
 import uuid
-from datetime import datetime
-from fastapi import HTTPException
+from typing import Optional
 from ..core.config import settings
+from ..core.ttl_cache import TTLCache
+from ..core.metrics import record_cache_lookup
 
-# --- Função de Serialização Personalizada ---
-def custom_json_serializer(obj):
-    if isinstance(obj, uuid.UUID):
-        return str(obj)
-    if isinstance(obj, datetime):
-        # Usar o formato ISO 8601
-        return obj.isoformat()
+logger = logging.getLogger(__name__)
 
-    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+# Chaves no formato "<namespace>:<identificador>"; o TTL padrão vem do namespace (CACHE_TTLS).
+# Valores serializados com orjson (UUID e datetime nativos, bytes em vez de str).
+# Nível 1: LRU em memória na frente do Redis, invalidado em todas as réplicas via pub/sub.
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+# --- Serialização ---
+def serialize(value: any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+def deserialize(raw: bytes) -> any:
+    return orjson.loads(raw)
+
+def cache_key(namespace: str, *parts) -> str:
+    return ":".join([namespace, *(str(part) for part in parts)])
+
+def namespace_ttl(key: str) -> int:
+    return settings.CACHE_TTLS.get(key.split(":", 1)[0], settings.CACHE_DEFAULT_TTL_SECONDS)
+
+# --- Cache em memória (L1) ---
+class CachedValue:
+    # Bytes serializados e o valor decodificado (decodificado uma única vez, sob demanda)
+    __slots__ = ("raw", "_value")
+    MISSING = object()
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._value = CachedValue.MISSING
+
+    def value(self):
+        if self._value is CachedValue.MISSING:
+            self._value = deserialize(self.raw)
+        return self._value
+
+local_cache = TTLCache(maxsize=settings.CACHE_L1_MAX_ITEMS, ttl_seconds=settings.CACHE_L1_TTL_SECONDS)
+
+# Estado em memória de outros módulos invalidado pelo mesmo canal:
+# namespace -> (descarta um identificador, descarta tudo, recarrega do Redis ao reconectar)
+local_namespaces = {}
+
+def register_local_namespace(namespace: str, drop, clear, resync=None):
+    local_namespaces[namespace] = (drop, clear, resync)
+
+def drop_local(key: str):
+    local_cache.delete(key)
+    namespace, _, identifier = key.partition(":")
+    if namespace in local_namespaces:
+        local_namespaces[namespace][0](identifier)
+
+def clear_local():
+    local_cache.clear()
+    for _, clear, _ in local_namespaces.values():
+        clear()
+
+def resync_local():
+    # Chamado pelo ouvinte com a assinatura já ativa: nada publicado a partir daqui se perde
+    for _, _, resync in local_namespaces.values():
+        if resync is not None:
+            resync()
+
+def remember(key: str, raw: bytes, ttl_seconds: Optional[int] = None) -> CachedValue:
+    # O L1 nunca guarda por mais tempo que o próprio Redis
+    entry = CachedValue(raw)
+    local_cache.set(key, entry, ttl_seconds=min(settings.CACHE_L1_TTL_SECONDS, ttl_seconds or namespace_ttl(key)))
+    return entry
 
 # --- Configuração do Redis ---
-redis_client = redis.StrictRedis(
+redis_client = redis.Redis(connection_pool=redis.ConnectionPool(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=0,
-    decode_responses=True
-)
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    health_check_interval=30
+))
 
-def set_cache(key: str, value: any, ttl_seconds: int = 3600):
+# Cliente assíncrono para os endpoints async (não bloqueia o loop de eventos)
+async_redis_client = aioredis.Redis(connection_pool=aioredis.ConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=0,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    health_check_interval=30
+))
+
+# --- API assíncrona ---
+def record_many_lookups(keys: list, entries: list, missing: list):
+    # Resultado de uma consulta em lote, contado por chave (as chaves de um lote costumam ser do mesmo namespace)
+    counts = {}
+    missing = set(missing)
+    for i, key in enumerate(keys):
+        result = "l1" if i not in missing else ("redis" if entries[i] is not None else "miss")
+        label = (key.split(":", 1)[0], result)
+        counts[label] = counts.get(label, 0) + 1
+    for (namespace, result), count in counts.items():
+        record_cache_lookup(namespace, result, count)
+
+async def get_cached_entry_async(key: str) -> Optional[CachedValue]:
+    entry = local_cache.get(key)
+    if entry is not None:
+        record_cache_lookup(key, "l1")
+        return entry
     try:
-        value_json = json.dumps(value, default=custom_json_serializer)
-        # Salva no Redis com um tempo de expiração
-        redis_client.setex(key, ttl_seconds, value_json)
+        raw = await async_redis_client.get(key)
     except Exception as e:
-        print(f"Erro ao salvar no cache: {e}")
-        
-def get_cache(key: str) -> any:
-    try:
-        cached_value = redis_client.get(key)
-        if cached_value:
-            return json.loads(cached_value)
+        record_cache_lookup(key, "error")
+        logger.warning("Erro ao buscar no cache: %s", e)
         return None
+    record_cache_lookup(key, "redis" if raw else "miss")
+    return remember(key, raw) if raw else None
+
+async def set_cache_raw_async(key: str, raw: bytes, ttl_seconds: Optional[int] = None):
+    remember(key, raw, ttl_seconds)
+    try:
+        await async_redis_client.setex(key, ttl_seconds or namespace_ttl(key), raw)
     except Exception as e:
-        print(f"Erro ao buscar no cache: {e}")
-        return None
+        logger.warning("Erro ao salvar no cache: %s", e)
+
+async def get_cache_async(key: str) -> any:
+    entry = await get_cached_entry_async(key)
+    return entry.value() if entry is not None else None
+
+async def set_cache_async(key: str, value: any, ttl_seconds: Optional[int] = None):
+    await set_cache_raw_async(key, serialize(value), ttl_seconds)
+
+async def clear_cache_async(*keys: str):
+    if not keys:
+        return
+    for key in keys:
+        drop_local(key)
+    try:
+        await async_redis_client.delete(*keys)
+        await async_redis_client.publish(INVALIDATION_CHANNEL, serialize(list(keys)))
+    except Exception as e:
+        logger.warning("Erro ao limpar o cache: %s", e)
+
+async def get_many_async(keys: list) -> list:
+    # L1 primeiro; as chaves restantes em um único MGET. None para chaves ausentes.
+    entries = [local_cache.get(key) for key in keys]
+    missing = [i for i, entry in enumerate(entries) if entry is None]
+    if missing:
+        try:
+            for i, raw in zip(missing, await async_redis_client.mget([keys[i] for i in missing])):
+                if raw:
+                    entries[i] = remember(keys[i], raw)
+        except Exception as e:
+            logger.warning("Erro ao buscar no cache: %s", e)
+    record_many_lookups(keys, entries, missing)
+    return [entry.value() if entry is not None else None for entry in entries]
 
-def clear_cache(key: str):
+async def set_many_async(values: dict, ttl_seconds: Optional[int] = None):
+    # Todos os SETEX em um pipeline (uma ida e volta)
+    if not values:
+        return
     try:
-        redis_client.delete(key)
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                raw = serialize(value)
+                remember(key, raw, ttl_seconds)
+                pipe.setex(key, ttl_seconds or namespace_ttl(key), raw)
+            await pipe.execute()
     except Exception as e:
-        print(f"Erro ao limpar o cache: {e}")
+        logger.warning("Erro ao salvar no cache: %s", e)
+
+# --- Single-flight e stale-while-revalidate ---
+# Cálculos em andamento neste processo (chave -> Future); requisições concorrentes aguardam o mesmo resultado
+inflight = {}
+
+# Só libera o lock se ele ainda for nosso (pode ter expirado e sido pego por outra réplica)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+async def read_entry_async(key: str, record: bool = True):
+    # Retorna (bytes, fresco?). No Redis a entrada vive CACHE_STALE_SECONDS além do TTL;
+    # nesse intervalo final ela é considerada vencida.
+    raw, fresh, result = await lookup_entry_async(key)
+    if record:
+        record_cache_lookup(key, result)
+    return raw, fresh
+
+async def lookup_entry_async(key: str):
+    entry = local_cache.get(key)
+    if entry is not None:
+        return entry.raw, True, "l1"
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, pttl = await pipe.execute()
+    except Exception as e:
+        logger.warning("Erro ao buscar no cache: %s", e)
+        return None, False, "error"
+    if not raw:
+        return None, False, "miss"
+    if pttl < 0:
+        remember(key, raw)
+        return raw, True, "redis"
+    fresh_seconds = pttl / 1000 - settings.CACHE_STALE_SECONDS
+    if fresh_seconds > 0:
+        remember(key, raw, fresh_seconds)
+        return raw, True, "redis"
+    return raw, False, "stale"
+
+async def store_entry_async(key: str, raw: bytes, ttl_seconds: Optional[int] = None):
+    ttl = ttl_seconds or namespace_ttl(key)
+    remember(key, raw, ttl)
+    try:
+        await async_redis_client.setex(key, ttl + settings.CACHE_STALE_SECONDS, raw)
+    except Exception as e:
+        logger.warning("Erro ao salvar no cache: %s", e)
+
+async def acquire_lock_async(key: str) -> Optional[str]:
+    # Lock entre réplicas (SET NX com expiração). Sem Redis, cada processo calcula sozinho.
+    token = uuid.uuid4().hex
+    try:
+        acquired = await async_redis_client.set(f"lock:{key}", token, nx=True, px=int(settings.CACHE_LOCK_TIMEOUT_SECONDS * 1000))
+        return token if acquired else None
+    except Exception as e:
+        logger.warning("Erro ao obter lock do cache: %s", e)
+        return token
+
+async def release_lock_async(key: str, token: str):
+    try:
+        await async_redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+    except Exception as e:
+        logger.warning("Erro ao liberar lock do cache: %s", e)
+
+async def wait_for_peer_async(key: str) -> Optional[bytes]:
+    # Outra réplica está calculando: aguarda o valor aparecer por até CACHE_LOCK_WAIT_SECONDS
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CACHE_LOCK_WAIT_SECONDS
+    while loop.time() < deadline:
+        await asyncio.sleep(settings.CACHE_LOCK_POLL_SECONDS)
+        # As consultas da espera não entram na taxa de acerto
+        raw, _ = await read_entry_async(key, record=False)
+        if raw is not None:
+            return raw
+    return None
+
+async def recompute_async(key: str, compute, ttl_seconds: Optional[int], stale: Optional[bytes]) -> bytes:
+    token = await acquire_lock_async(key)
+    if token is None:
+        # Outra réplica já está recalculando: serve o valor vencido ou espera pelo novo
+        if stale is not None:
+            return stale
+        raw = await wait_for_peer_async(key)
+        if raw is not None:
+            return raw
+        # A outra réplica não terminou a tempo: calcula mesmo sem o lock
+    try:
+        raw = await compute()
+        await store_entry_async(key, raw, ttl_seconds)
+        return raw
+    finally:
+        if token is not None:
+            await release_lock_async(key, token)
+
+async def get_or_compute_raw_async(key: str, compute, ttl_seconds: Optional[int] = None) -> bytes:
+    # compute() é uma corrotina que devolve o valor já serializado (bytes).
+    # Só uma requisição recalcula a chave; as demais aguardam ou recebem o valor vencido.
+    raw, fresh = await read_entry_async(key)
+    if fresh:
+        return raw
+
+    future = inflight.get(key)
+    if future is not None:
+        return raw if raw is not None else await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await recompute_async(key, compute, ttl_seconds, stale=raw)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        # Marca a exceção como lida caso ninguém esteja aguardando
+        future.exception()
+        raise
+    finally:
+        inflight.pop(key, None)
+        if not future.done():
+            future.cancel()
+
+# --- Invalidação entre réplicas ---
+# Renovado a cada volta do ouvinte; vencido = ouvinte desconectado ou travado
+listener_alive_until = 0.0
+
+def listener_connected() -> bool:
+    return time.monotonic() < listener_alive_until
+
+def handle_invalidation(data: bytes):
+    for key in deserialize(data):
+        drop_local(key)
+
+def listen_for_invalidations():
+    # Escuta o canal de invalidação e descarta as chaves dos caches locais; reconecta após falhas
+    global listener_alive_until
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidações perdidas enquanto desconectado: descarta os caches locais inteiros
+            clear_local()
+            resync_local()
+            while True:
+                listener_alive_until = time.monotonic() + settings.CACHE_INVALIDATION_LEASE_SECONDS
+                message = pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    handle_invalidation(message["data"])
+        except Exception as e:
+            listener_alive_until = 0.0
+            logger.warning("Falha no canal de invalidação do cache: %s. Reconectando...", e)
+            clear_local()
+        finally:
+            # Devolve a conexão da assinatura antes de abrir outra
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+        time.sleep(settings.CACHE_INVALIDATION_RETRY_SECONDS)
+
+def start_invalidation_listener():
+    # Sem caches locais não há o que invalidar
+    if settings.CACHE_L1_MAX_ITEMS <= 0 and not local_namespaces:
+        return
+    threading.Thread(target=listen_for_invalidations, name="cache-invalidation", daemon=True).start()
@@ -0,0 +1,46 @@
+import logging
+from typing import Optional
+from .cache_service import async_redis_client, cache_key, serialize, deserialize
+from ..core.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Baldes fechados do histórico (não recebem mais telemetria) ficam em um hash por dispositivo e período:
+# campo = índice do balde (epoch // intervalo), valor = [min_date, avg_cpu, avg_ram, avg_temp] ou null.
+NAMESPACE = "historical_buckets"
+
+def buckets_key(device_uuid, period: str) -> str:
+    return cache_key(NAMESPACE, device_uuid, period)
+
+async def get_closed_buckets(device_uuid, period: str, indices: list) -> dict:
+    # Um único HMGET; índices ausentes do cache não aparecem no resultado
+    if not indices:
+        return {}
+    try:
+        values = await async_redis_client.hmget(buckets_key(device_uuid, period), indices)
+    except Exception as e:
+        record_cache_lookup(NAMESPACE, "error", len(indices))
+        logger.warning("Erro ao buscar no cache: %s", e)
+        return {}
+    buckets = {index: deserialize(raw) for index, raw in zip(indices, values) if raw is not None}
+    # Contado por balde
+    record_cache_lookup(NAMESPACE, "redis", len(buckets))
+    record_cache_lookup(NAMESPACE, "miss", len(indices) - len(buckets))
+    return buckets
+
+async def store_closed_buckets(device_uuid, period: str, buckets: dict, first_index: int, ttl_seconds: int):
+    # Grava os baldes recém-fechados e descarta os que saíram da janela do período
+    if not buckets:
+        return
+    key = buckets_key(device_uuid, period)
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={index: serialize(value) for index, value in buckets.items()})
+            pipe.expire(key, ttl_seconds)
+            pipe.hkeys(key)
+            _, _, fields = await pipe.execute()
+        expired = [field for field in fields if int(field) < first_index]
+        if expired:
+            await async_redis_client.hdel(key, *expired)
+    except Exception as e:
+        logger.warning("Erro ao salvar no cache: %s", e)
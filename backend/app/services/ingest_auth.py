@@ -0,0 +1,91 @@
+import hashlib
+import hmac
+import secrets
+import uuid
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.ttl_cache import TTLCache
+from ..database.models import DeviceIngestKey
+from .cache_service import cache_key, clear_cache_async, get_many_async, set_many_async, register_local_namespace
+
+# Token de ingestão: "<device_uuid>.<segredo>". O banco guarda HMAC-SHA256(SECRET_KEY, segredo);
+# a verificação é um HMAC em memória contra o hash em cache, sem JWT nem consulta por requisição.
+# Hashes fora do cache local vêm do Redis (compartilhado entre réplicas) e, por fim, do banco.
+NO_KEY = "" # Dispositivo sem chave (cache negativo)
+
+key_cache = TTLCache(maxsize=settings.INGEST_KEY_CACHE_SIZE, ttl_seconds=settings.INGEST_KEY_CACHE_TTL_SECONDS)
+# Rotação e remoção de chaves chegam às demais réplicas pelo canal de invalidação do cache
+register_local_namespace("ingest_key", lambda identifier: key_cache.delete(uuid.UUID(identifier)), key_cache.clear)
+
+def hash_ingest_secret(secret: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), secret.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def generate_ingest_token(device_uuid: uuid.UUID):
+    # Retorna (token para o dispositivo, hash a ser gravado)
+    secret = secrets.token_urlsafe(32)
+    return f"{device_uuid}.{secret}", hash_ingest_secret(secret)
+
+def split_ingest_token(token: str):
+    # Separa o UUID do dispositivo e o segredo; None se o formato for inválido
+    device_part, _, secret = (token or "").partition(".")
+    if not secret:
+        return None
+    try:
+        return uuid.UUID(device_part), secret
+    except ValueError:
+        return None
+
+async def load_key_hashes(db: AsyncSession, device_uuids: set) -> dict:
+    # Hashes das chaves, consultando o banco só para dispositivos fora do cache
+    hashes, missing = {}, []
+    for device_uuid in device_uuids:
+        cached = key_cache.get(device_uuid)
+        if cached is None:
+            missing.append(device_uuid)
+        else:
+            hashes[device_uuid] = cached
+
+    if not missing:
+        return hashes
+
+    # Um MGET para todos os que faltam
+    shared = await get_many_async([cache_key("ingest_key", device_uuid) for device_uuid in missing])
+    unknown = []
+    for device_uuid, key_hash in zip(missing, shared):
+        if key_hash is None:
+            unknown.append(device_uuid)
+        else:
+            hashes[device_uuid] = key_hash
+            key_cache.set(device_uuid, key_hash)
+
+    if unknown:
+        rows = (await db.execute(
+            select(DeviceIngestKey.device_uuid, DeviceIngestKey.key_hash).where(DeviceIngestKey.device_uuid.in_(unknown))
+        )).all()
+        found = dict(rows)
+        loaded = {}
+        for device_uuid in unknown:
+            hashes[device_uuid] = found.get(device_uuid, NO_KEY)
+            key_cache.set(device_uuid, hashes[device_uuid])
+            loaded[cache_key("ingest_key", device_uuid)] = hashes[device_uuid]
+        # Todos os SETEX em um pipeline
+        await set_many_async(loaded, ttl_seconds=max(int(settings.INGEST_KEY_CACHE_TTL_SECONDS), 1))
+    return hashes
+
+def token_matches(token_parts, key_hash: str) -> bool:
+    return bool(key_hash) and hmac.compare_digest(hash_ingest_secret(token_parts[1]), key_hash)
+
+async def verify_ingest_tokens(db: AsyncSession, tokens: list) -> list:
+    # Verifica vários tokens de uma vez; retorna o UUID do dispositivo autenticado ou None para cada um
+    parsed = [split_ingest_token(token) if isinstance(token, str) else None for token in tokens]
+    hashes = await load_key_hashes(db, {parts[0] for parts in parsed if parts})
+    return [parts[0] if parts and token_matches(parts, hashes[parts[0]]) else None for parts in parsed]
+
+async def verify_ingest_token(db: AsyncSession, token: Optional[str]) -> Optional[uuid.UUID]:
+    return (await verify_ingest_tokens(db, [token]))[0]
+
+async def invalidate_ingest_key(device_uuid: uuid.UUID):
+    # Remove o hash do Redis e do cache local e avisa as demais réplicas
+    await clear_cache_async(cache_key("ingest_key", device_uuid))
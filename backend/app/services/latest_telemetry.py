@@ -0,0 +1,49 @@
+import logging
+from typing import Optional
+from shared.latest_telemetry import NAMESPACE, MERGE_SCRIPT, latest_key
+from shared import latest_telemetry as shared_latest
+from .cache_service import async_redis_client
+from ..core.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Última telemetria por usuário em um hash do Redis (formato em shared/latest_telemetry.py).
+# O worker grava cada lote assim que o persiste; o endpoint só faz HGETALL.
+COMPLETE_FIELD = shared_latest.COMPLETE_FIELD.encode()
+
+def build_payload(fields: dict) -> bytes:
+    # Junta os JSONs já serializados em um objeto {device_uuid: leitura}, sem decodificar nada
+    items = [b'"' + field + b'":' + value for field, value in fields.items() if field != COMPLETE_FIELD]
+    return b"{" + b",".join(items) + b"}"
+
+async def read_latest_payload(user_id) -> Optional[bytes]:
+    # None quando o hash não existe ou está incompleto (ex.: Redis reiniciado)
+    try:
+        fields = await async_redis_client.hgetall(latest_key(user_id))
+    except Exception as e:
+        record_cache_lookup(NAMESPACE, "error")
+        logger.warning("Erro ao buscar no cache: %s", e)
+        return None
+    if COMPLETE_FIELD not in fields:
+        record_cache_lookup(NAMESPACE, "miss")
+        return None
+    record_cache_lookup(NAMESPACE, "redis")
+    return build_payload(fields)
+
+async def load_latest_payload(user_id, entries: dict) -> Optional[bytes]:
+    # Mescla as leituras do banco (device_uuid -> (boot_date, json)) sem sobrescrever as mais novas do worker
+    args = ["1"]
+    for device_uuid, (boot_date, raw) in entries.items():
+        args += [device_uuid, boot_date or "", raw]
+    try:
+        flat = await async_redis_client.eval(MERGE_SCRIPT, 1, latest_key(user_id), *args)
+    except Exception as e:
+        logger.warning("Erro ao salvar no cache: %s", e)
+        return None
+    return build_payload(dict(zip(flat[::2], flat[1::2])))
+
+async def remove_latest_device(user_id, device_uuid):
+    try:
+        await async_redis_client.hdel(latest_key(user_id), str(device_uuid))
+    except Exception as e:
+        logger.warning("Erro ao limpar o cache: %s", e)
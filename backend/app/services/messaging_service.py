@@ -1,40 +1,227 @@
+import logging
+import asyncio
 import pika
 import json
-import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
 from ..core.config import settings
+from ..core.metrics import publish_seconds, publish_batch_size, publisher_pending
 from fastapi import HTTPException
 
+logger = logging.getLogger(__name__)
+
+# Cabeçalho AMQP com o instante da publicação (usado para medir o atraso dos consumidores)
+PUBLISHED_AT_HEADER = "published_at"
+
+def declare_telemetry_topology(channel):
+    # Exchange fanout com uma fila durável por grupo de consumidores:
+    # o worker (persistência) e o processador de notificações recebem todas as mensagens
+    channel.exchange_declare(exchange=settings.RABBITMQ_EXCHANGE, exchange_type='fanout', durable=True)
+    for queue_name in (settings.RABBITMQ_QUEUE, settings.RABBITMQ_NOTIFICATION_QUEUE):
+        channel.queue_declare(queue=queue_name, durable=True)
+        channel.queue_bind(queue=queue_name, exchange=settings.RABBITMQ_EXCHANGE)
+
 def get_rabbitmq_connection():
     # Conecta ao RabbitMQ e retorna a conexão e o canal
     try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.RABBITMQ_HOST))
+        connection = pika.BlockingConnection(pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            heartbeat=60,
+            blocked_connection_timeout=300
+        ))
         channel = connection.channel()
-        channel.queue_declare(queue=settings.RABBITMQ_QUEUE, durable=True)
+        declare_telemetry_topology(channel)
         return connection, channel
     except pika.exceptions.AMQPConnectionError as e:
-        print(f"Erro ao conectar com o RabbitMQ: {e}")
+        logger.error("Erro ao conectar com o RabbitMQ: %s", e)
         return None, None
 
-def publish_telemetry_message(telemetry_data: dict):
-    connection, channel = get_rabbitmq_connection()
-    if not connection or not channel:
-        raise HTTPException(status_code=500, detail="Could not connect to RabbitMQ.")
-    
+class TelemetryPublisher:
+    # Publicador persistente: uma única thread dona da conexão (pika não é thread-safe)
+    # recebe as mensagens por uma fila em memória e as publica em transações AMQP.
+    # As publicações pendentes são agrupadas e cada grupo custa uma única ida e volta (tx.commit);
+    # nada chega às filas antes do commit, então uma falha antes dele permite reenviar o grupo inteiro.
+
+    def __init__(self, max_pending: int, retry_delay: float, max_batch: int = 1000):
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._retry_delay = retry_delay
+        self._max_batch = max_batch
+        self._connection = None
+        self._channel = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="telemetry-publisher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._close()
+
+    def submit(self, bodies: list) -> Future:
+        # Enfileira as mensagens e devolve um Future resolvido após a confirmação do broker
+        self.start()
+        future = Future()
+        try:
+            self._pending.put_nowait((bodies, future))
+        except queue.Full:
+            future.set_exception(RuntimeError("Fila de publicação cheia."))
+        return future
+
+    def _connect(self):
+        connection, channel = get_rabbitmq_connection()
+        if not connection or not channel:
+            return False
+        channel.tx_select()
+        self._connection, self._channel = connection, channel
+        logger.info("Conexão persistente do publicador com o RabbitMQ estabelecida.")
+        return True
+
+    def _close(self):
+        try:
+            if self._connection and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection, self._channel = None, None
+
+    def _publish(self, bodies: list):
+        # Momento da publicação (epoch, float) para os consumidores medirem o atraso da fila
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # Mensagem persistente
+            headers={PUBLISHED_AT_HEADER: time.time()},
+        )
+        # Sem confirmação por mensagem: os frames seguem em sequência e o commit confirma o grupo
+        for body in bodies:
+            self._channel.basic_publish(
+                exchange=settings.RABBITMQ_EXCHANGE,
+                routing_key='',
+                body=body,
+                properties=properties,
+            )
+
+    def _next_group(self, first) -> list:
+        # A publicação recebida mais as que já estiverem esperando, até max_batch mensagens
+        group, size = [first], len(first[0])
+        while size < self._max_batch:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            group.append(item)
+            size += len(item[0])
+        return [(bodies, future) for bodies, future in group if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while self._running:
+            try:
+                first = self._pending.get(timeout=1)
+            except queue.Empty:
+                # Mantém os heartbeats da conexão ociosa em dia
+                if self._connection and self._connection.is_open:
+                    try:
+                        self._connection.process_data_events(time_limit=0)
+                    except pika.exceptions.AMQPError:
+                        self._close()
+                continue
+
+            group = self._next_group(first)
+            if group:
+                self._publish_group(group)
+
+    def _publish_group(self, group: list):
+        def fail(e):
+            for _, future in group:
+                future.set_exception(e)
+
+        # Uma tentativa com a conexão atual e uma após reconectar
+        for attempt in range(2):
+            committing = False
+            try:
+                if not self._channel or not self._channel.is_open:
+                    if not self._connect():
+                        raise pika.exceptions.AMQPConnectionError("RabbitMQ indisponível")
+                self._publish([body for bodies, _ in group for body in bodies])
+                committing = True
+                self._channel.tx_commit()
+                for bodies, future in group:
+                    future.set_result(len(bodies))
+                return
+            except pika.exceptions.AMQPError as e:
+                logger.warning("Falha na conexão do publicador com o RabbitMQ: %s. Reconectando...", e)
+                self._close()
+                # Queda durante o commit: o broker pode ter aplicado a transação, e reenviar duplicaria o grupo
+                if committing or attempt == 1:
+                    fail(e)
+                    return
+                time.sleep(self._retry_delay)
+            except Exception as e:
+                fail(e)
+                return
+
+publisher = TelemetryPublisher(
+    max_pending=settings.RABBITMQ_PUBLISHER_MAX_PENDING,
+    retry_delay=settings.RABBITMQ_PUBLISHER_RETRY_DELAY,
+    max_batch=settings.RABBITMQ_PUBLISHER_MAX_BATCH
+)
+
+publisher_pending.set_function(publisher._pending.qsize)
+
+async def wait_published(bodies: list):
+    # Aguarda a confirmação do publicador sem bloquear o loop de eventos
+    publish_batch_size.observe(len(bodies))
+    start = time.perf_counter()
+    result = "error"
+    future = publisher.submit(bodies)
+    try:
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=settings.RABBITMQ_PUBLISH_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Ainda na fila: cancela, e a thread do publicador descarta (o cliente pode reenviar sem duplicar).
+            # Já em publicação: o resultado do commit é que vale, então aguarda em vez de relatar falha.
+            if future.cancel():
+                result = "timeout"
+                raise
+            await asyncio.wrap_future(future)
+        result = "ok"
+    finally:
+        publish_seconds.labels(result).observe(time.perf_counter() - start)
+
+def consumer_lag(properties) -> Optional[float]:
+    # Segundos desde a publicação; None para mensagens sem o cabeçalho
+    published_at = (properties.headers or {}).get(PUBLISHED_AT_HEADER) if properties else None
+    if published_at is None:
+        return None
+    return max(time.time() - float(published_at), 0.0)
+
+async def publish_telemetry_message(telemetry_data: dict):
     try:
         message_body = json.dumps(telemetry_data)
-        
-        channel.basic_publish(
-            exchange='', 
-            routing_key=settings.RABBITMQ_QUEUE,
-            body=message_body,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # Mensagem persistente
-            )
-        )
-        print(f"Mensagem enviada para a fila: {message_body}")
+        await wait_published([message_body])
+        logger.debug("Mensagem enviada para a fila.", extra={"sampled": True, "device_uuid": telemetry_data.get("device_uuid")})
     except Exception as e:
-        print(f"Erro ao publicar a mensagem no RabbitMQ: {e}")
+        logger.error("Erro ao publicar a mensagem no RabbitMQ: %s", e)
         raise HTTPException(status_code=500, detail="Failed to publish message.")
-    finally:
-        if connection:
-            connection.close()
\ No newline at end of file
+
+async def publish_telemetry_batch(messages: list):
+    # Publica um lote inteiro em uma única ida à thread do publicador
+    if not messages:
+        return
+    try:
+        bodies = [json.dumps(message) for message in messages]
+        await wait_published(bodies)
+        logger.debug("Lote enviado para a fila.", extra={"sampled": True, "messages": len(bodies)})
+    except Exception as e:
+        logger.error("Erro ao publicar o lote no RabbitMQ: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to publish message batch.")
@@ -1,37 +1,27 @@
+import logging
 import pika
 import json
 import uuid
-from sqlalchemy import and_
 from sqlalchemy.orm import Session
 from ..database.base import SessionLocal
-from ..database.models import Notification, Device
 from ..core.config import settings
+from ..core.metrics import alerts_emitted, consumer_lag_seconds, notification_batch_size, notification_batch_seconds
+from .messaging_service import declare_telemetry_topology, consumer_lag
+from .rule_index import rule_index, OPERATORS
 import asyncio
 import threading 
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 # Variável global para a instância do SocketIO
 sio_instance = None 
 main_loop_instance = None
 
-def compare_values(telemetry_value: float, operator: str, threshold: float) -> bool:
-    # Função segura para comparar valores
-    val = float(telemetry_value)
-    thresh = float(threshold)
-
-    if operator == '>':
-        return val > thresh
-    elif operator == '<':
-        return val < thresh
-    elif operator == '==':
-        return val == thresh
-    elif operator == '>=':
-        return val >= thresh
-    elif operator == '<=':
-        return val <= thresh
-    elif operator == '!=':
-        return val != thresh
-    else:
-        return False
+# Mensagens aguardando avaliação em lote: (delivery_tag, mensagem)
+pending_messages = []
+flush_timer = None
 
 async def emit_alert(sio, user_id, message, device_uuid):
     # Função assíncrona para emitir a notificação via SocketIO
@@ -40,7 +30,7 @@ async def emit_alert(sio, user_id, message, device_uuid):
         {'message': message, 'device_uuid': device_uuid},
         to=str(user_id) # Envia para a ROOM do usuário
     )
-    print(f"[SOCKET.IO EMITIDO] Evento 'new_notification' enviado para room: {user_id}")
+    logger.debug("Evento 'new_notification' enviado.", extra={"sampled": True, "user_id": user_id})
 
 def check_notification_rules(db: Session, telemetry_data: dict):
     # Verifica se alguma regra de notificação é acionada e dispara o WebSocket
@@ -49,55 +39,160 @@ def check_notification_rules(db: Session, telemetry_data: dict):
     try:
         # Conversão segura do UUID
         device_uuid = uuid.UUID(telemetry_data.get('device_uuid'))
-    except ValueError:
-        print(f"[ALERTA] UUID inválido no payload: {telemetry_data.get('device_uuid')}")
+    except (ValueError, TypeError, AttributeError):
+        logger.warning("UUID inválido no payload: %s", telemetry_data.get('device_uuid'))
         return
     
-    device = db.query(Device).filter(Device.uuid == device_uuid).first()
+    # Regras vêm do índice em memória: sem consultas ao banco no caso comum
+    device, rules = rule_index.lookup(db, device_uuid)
     if not device:
-        print(f"[ALERTA] Dispositivo não encontrado: {device_uuid}")
+        logger.warning("Dispositivo não encontrado: %s", device_uuid)
         return
-
-    # Consulta as regras aplicáveis
-    rules = db.query(Notification).filter(
-        and_(
-            Notification.user_id == device.user_id,
-            Notification.device_uuid.in_([device_uuid, None])
-        )
-    ).all()
     
     for rule in rules:
         telemetry_value = telemetry_data.get(rule.parameter)
         
         if isinstance(telemetry_value, (int, float)):
-            if compare_values(telemetry_value, rule.operator, rule.threshold):
-                
-                alert_message = f"ALERTA: {rule.message} | Device: {device.name} | {rule.parameter} é {telemetry_value}"
-                print(f"[ALERTA EMITIDO] {alert_message}")
-
-                # --- LÓGICA DE DISPARO DO WEBSOCKET ---
-                if sio_instance and main_loop_instance:
-                     future = asyncio.run_coroutine_threadsafe(
-                        emit_alert(
-                            sio_instance,
-                            rule.user_id,
-                            alert_message,
-                            str(device_uuid)
-                            ),
-                            main_loop_instance # Usa o loop global
-                    )
+            if rule.matches(telemetry_value):
+                dispatch_alert(rule, device, telemetry_value)
 
-def rabbitmq_callback(ch, method, properties, body):
-    # Função de callback do RabbitMQ
-    telemetry_data = json.loads(body)
-    
+def dispatch_alert(rule, device, telemetry_value):
+    # Monta a mensagem do alerta e agenda a emissão no loop principal
+    alert_message = f"ALERTA: {rule.message} | Device: {device.name} | {rule.parameter} é {telemetry_value}"
+    logger.info(alert_message, extra={"user_id": rule.user_id, "device_uuid": str(device.uuid)})
+    alerts_emitted.inc()
+
+    # --- LÓGICA DE DISPARO DO WEBSOCKET ---
+    if sio_instance and main_loop_instance:
+         future = asyncio.run_coroutine_threadsafe(
+            emit_alert(
+                sio_instance,
+                rule.user_id,
+                alert_message,
+                str(device.uuid)
+                ),
+                main_loop_instance # Usa o loop global
+        )
+
+def expand_rule_pairs(keys, rule_ids, message_keys):
+    # Para cada mensagem, encontra (via searchsorted) o intervalo de regras com a mesma chave
+    # e expande os pares (mensagem, regra) sem laços em Python
+    left = np.searchsorted(keys, message_keys, side='left')
+    counts = np.searchsorted(keys, message_keys, side='right') - left
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    message_idx = np.repeat(np.arange(len(message_keys)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return message_idx, rule_ids[np.repeat(left, counts) + offsets]
+
+def evaluate_rules_batch(db: Session, telemetry_batch: list) -> list:
+    # Avalia todas as regras contra um bloco de mensagens com comparações vetorizadas.
+    # Retorna os pares acionados como (índice da mensagem, regra, dispositivo, valor).
+    rule_index.ensure_loaded(db)
+    devices, user_codes, device_codes, table = rule_index.vector_state()
+
+    count = len(telemetry_batch)
+    message_users = np.full(count, -2, dtype=np.int64)
+    message_devices = np.full(count, -2, dtype=np.int64)
+    message_device_entries = [None] * count
+    resolved = {} # device_uuid (texto) -> (dispositivo, código do usuário, código do dispositivo)
+    for i, telemetry_data in enumerate(telemetry_batch):
+        device_uuid_str = telemetry_data.get('device_uuid')
+        entry = resolved.get(device_uuid_str) if isinstance(device_uuid_str, str) else None
+        if entry is None:
+            try:
+                device_uuid = uuid.UUID(device_uuid_str)
+            except (ValueError, TypeError, AttributeError):
+                continue
+            device = devices.get(device_uuid)
+            if device is None:
+                continue
+            entry = (device, user_codes[device.user_id], device_codes[device_uuid])
+            resolved[device_uuid_str] = entry
+        message_device_entries[i], message_users[i], message_devices[i] = entry
+
+    # Uma coluna por parâmetro usado nas regras; NaN para valores ausentes ou não numéricos
+    nan = float('nan')
+    values = np.array(
+        [[value if isinstance(value, (int, float)) else nan
+          for value in map(telemetry_data.get, table.parameters)]
+         for telemetry_data in telemetry_batch],
+        dtype=np.float64
+    ).reshape(count, len(table.parameters))
+
+    # Pares aplicáveis: regras do dispositivo primeiro, depois as globais do usuário
+    device_msgs, device_rules = expand_rule_pairs(table.device_keys, table.device_rule_ids, message_devices)
+    user_msgs, user_rules = expand_rule_pairs(table.user_keys, table.user_rule_ids, message_users)
+    message_idx = np.concatenate((device_msgs, user_msgs))
+    rule_ids = np.concatenate((device_rules, user_rules))
+    if message_idx.size == 0:
+        return []
+
+    pair_values = values[message_idx, table.parameter_codes[rule_ids]]
+    pair_thresholds = table.thresholds[rule_ids]
+    pair_operators = table.operator_codes[rule_ids]
+
+    # Uma comparação vetorizada por operador
+    hits = np.zeros(message_idx.size, dtype=bool)
+    for code, compare in enumerate(OPERATORS.values()):
+        mask = pair_operators == code
+        if mask.any():
+            hits[mask] = compare(pair_values[mask], pair_thresholds[mask])
+    hits &= ~np.isnan(pair_values)
+
+    hit_positions = np.nonzero(hits)[0]
+    hit_positions = hit_positions[np.argsort(message_idx[hit_positions], kind='stable')]
+
+    triggered = []
+    for i, rule_id in zip(message_idx[hit_positions].tolist(), rule_ids[hit_positions].tolist()):
+        rule = table.rules[rule_id]
+        triggered.append((i, rule, message_device_entries[i], telemetry_batch[i].get(rule.parameter)))
+    return triggered
+
+def check_notification_rules_batch(db: Session, telemetry_batch: list):
+    # Caminho em lote: avalia o bloco inteiro e dispara os alertas acionados
+    for _, rule, device, telemetry_value in evaluate_rules_batch(db, telemetry_batch):
+        dispatch_alert(rule, device, telemetry_value)
+
+def flush_pending(ch):
+    # Avalia o bloco acumulado e confirma todas as mensagens de uma vez
+    global pending_messages, flush_timer
+    if flush_timer is not None:
+        ch.connection.remove_timeout(flush_timer)
+        flush_timer = None
+    if not pending_messages:
+        return
+
+    batch, pending_messages = pending_messages, []
+    notification_batch_size.observe(len(batch))
+    start = time.perf_counter()
     db: Session = SessionLocal()
     try:
-        check_notification_rules(db, telemetry_data)
+        check_notification_rules_batch(db, [message for _, message in batch])
+    except Exception as e:
+        logger.exception("Falha ao avaliar lote de notificações: %s", e)
     finally:
         db.close()
-    
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+        notification_batch_seconds.observe(time.perf_counter() - start)
+        ch.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+
+def rabbitmq_callback(ch, method, properties, body):
+    # Função de callback do RabbitMQ: acumula mensagens para avaliação em lote
+    global flush_timer
+    lag = consumer_lag(properties)
+    if lag is not None:
+        consumer_lag_seconds.labels("notifications").observe(lag)
+    try:
+        telemetry_data = json.loads(body)
+    except ValueError:
+        telemetry_data = {}
+    pending_messages.append((method.delivery_tag, telemetry_data))
+
+    if len(pending_messages) >= settings.NOTIFICATION_BATCH_SIZE:
+        flush_pending(ch)
+    elif flush_timer is None:
+        flush_timer = ch.connection.call_later(settings.NOTIFICATION_FLUSH_INTERVAL_MS / 1000, lambda: flush_pending(ch))
 
 
 def start_notification_listener(sio_app, loop_app):
@@ -109,13 +204,14 @@ def start_notification_listener(sio_app, loop_app):
     try:
         connection = pika.BlockingConnection(pika.ConnectionParameters(host=settings.RABBITMQ_HOST))
         channel = connection.channel()
-        channel.queue_declare(queue=settings.RABBITMQ_QUEUE, durable=True)
+        declare_telemetry_topology(channel)
+        channel.basic_qos(prefetch_count=settings.NOTIFICATION_BATCH_SIZE)
         
-        print("Backend está ouvindo a fila de telemetria para notificações.")
+        logger.info("Ouvindo a fila '%s' para notificações.", settings.RABBITMQ_NOTIFICATION_QUEUE)
         channel.basic_consume(
-            queue=settings.RABBITMQ_QUEUE,
+            queue=settings.RABBITMQ_NOTIFICATION_QUEUE,
             on_message_callback=rabbitmq_callback
         )
         channel.start_consuming()
     except Exception as e:
-        print(f"Erro no processador de notificações: {e}")
\ No newline at end of file
+        logger.exception("Erro no processador de notificações: %s", e)
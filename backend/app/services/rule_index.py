@@ -0,0 +1,166 @@
+import operator
+import threading
+import time
+import numpy as np
+from sqlalchemy.orm import Session
+from ..database.models import Notification, Device
+from ..core.config import settings
+from .cache_service import clear_cache_async, register_local_namespace
+
+# Operadores suportados pelas regras de notificação
+OPERATORS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '==': operator.eq,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+}
+
+class CompiledRule:
+    # Regra de notificação com o comparador já resolvido
+    __slots__ = ("id", "user_id", "device_uuid", "parameter", "operator", "threshold", "message", "matches")
+
+    def __init__(self, rule: Notification):
+        self.id = rule.id
+        self.user_id = rule.user_id
+        self.device_uuid = rule.device_uuid
+        self.parameter = rule.parameter
+        self.operator = rule.operator
+        self.threshold = float(rule.threshold)
+        self.message = rule.message
+
+        compare = OPERATORS.get(rule.operator)
+        threshold = self.threshold
+        if compare is None:
+            self.matches = lambda value: False
+        else:
+            self.matches = lambda value: compare(value, threshold)
+
+class DeviceEntry:
+    __slots__ = ("uuid", "user_id", "name")
+
+    def __init__(self, uuid, user_id, name):
+        self.uuid = uuid
+        self.user_id = user_id
+        self.name = name
+
+class RuleTable:
+    # Regras em arrays NumPy para avaliação vetorizada. Regras de dispositivo ficam ordenadas
+    # pelo código do dispositivo e regras globais pelo código do usuário, permitindo expandir
+    # os pares (mensagem, regra) aplicáveis com searchsorted em vez de uma matriz densa.
+    __slots__ = ("rules", "parameters", "thresholds", "parameter_codes", "operator_codes",
+                 "device_keys", "device_rule_ids", "user_keys", "user_rule_ids")
+
+    def __init__(self, rules, user_codes, device_codes):
+        self.rules = rules
+        self.parameters = sorted({r.parameter for r in rules})
+        parameter_codes = {parameter: code for code, parameter in enumerate(self.parameters)}
+        operator_codes = {symbol: code for code, symbol in enumerate(OPERATORS)}
+
+        self.thresholds = np.array([r.threshold for r in rules], dtype=np.float64)
+        self.parameter_codes = np.array([parameter_codes[r.parameter] for r in rules], dtype=np.int64)
+        self.operator_codes = np.array([operator_codes[r.operator] for r in rules], dtype=np.int64)
+
+        device_pairs = sorted((device_codes[r.device_uuid], i) for i, r in enumerate(rules) if r.device_uuid is not None)
+        user_pairs = sorted((user_codes[r.user_id], i) for i, r in enumerate(rules) if r.device_uuid is None)
+        self.device_keys = np.array([k for k, _ in device_pairs], dtype=np.int64)
+        self.device_rule_ids = np.array([i for _, i in device_pairs], dtype=np.int64)
+        self.user_keys = np.array([k for k, _ in user_pairs], dtype=np.int64)
+        self.user_rule_ids = np.array([i for _, i in user_pairs], dtype=np.int64)
+
+class RuleIndex:
+    # Índice em memória: regras por dispositivo e regras globais (device_uuid=None) por usuário.
+    # Montado uma vez a partir do banco e invalidado quando regras ou dispositivos mudam.
+    # Cada invalidação avança a geração; uma carga só vale se nenhuma invalidação ocorreu desde o seu início.
+
+    def __init__(self, ttl_seconds: float):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._device_rules = {}
+        self._user_rules = {}
+        self._vector_state = ({}, {}, {}, RuleTable([], {}, {}))
+        self._generation = 0
+        self._loaded = None # (geração, instante) da última carga
+
+    def invalidate(self):
+        self._generation += 1
+
+    def load(self, db: Session):
+        generation = self._generation
+        devices = [DeviceEntry(*row) for row in db.query(Device.uuid, Device.user_id, Device.name).all()]
+        self.build(devices, db.query(Notification).all(), generation)
+
+    def build(self, devices: list, rules: list, generation: int = None):
+        # Monta o índice a partir de dispositivos (DeviceEntry) e regras (Notification)
+        device_map = {device.uuid: device for device in devices}
+
+        device_rules, user_rules = {}, {}
+        compiled_rules = []
+        for rule in rules:
+            compiled = CompiledRule(rule)
+            compiled_rules.append(compiled)
+            if compiled.device_uuid is None:
+                user_rules.setdefault(compiled.user_id, []).append(compiled)
+            else:
+                device_rules.setdefault(compiled.device_uuid, []).append(compiled)
+
+        # Códigos inteiros para comparar usuários/dispositivos dentro do NumPy
+        user_codes, device_codes = {}, {}
+        for device in devices:
+            user_codes.setdefault(device.user_id, len(user_codes))
+            device_codes.setdefault(device.uuid, len(device_codes))
+
+        vector_rules = []
+        for compiled in compiled_rules:
+            if compiled.operator not in OPERATORS or compiled.user_id not in user_codes:
+                continue
+            if compiled.device_uuid is not None:
+                # Regra de dispositivo só vale para o dono do dispositivo
+                device = device_map.get(compiled.device_uuid)
+                if device is None or device.user_id != compiled.user_id:
+                    continue
+            vector_rules.append(compiled)
+        table = RuleTable(vector_rules, user_codes, device_codes)
+
+        self._devices, self._device_rules, self._user_rules = device_map, device_rules, user_rules
+        # Atribuição única para que o caminho em lote leia um estado consistente
+        self._vector_state = (device_map, user_codes, device_codes, table)
+        self._loaded = (self._generation if generation is None else generation, time.monotonic())
+
+    def is_fresh(self) -> bool:
+        loaded = self._loaded
+        return (loaded is not None and loaded[0] == self._generation
+                and time.monotonic() - loaded[1] < self._ttl_seconds)
+
+    def ensure_loaded(self, db: Session):
+        # Invalidações de outras réplicas chegam pelo canal do cache; o TTL cobre mensagens perdidas
+        if self.is_fresh():
+            return
+        with self._lock:
+            if not self.is_fresh():
+                self.load(db)
+
+    def lookup(self, db: Session, device_uuid):
+        # Retorna o dispositivo e as regras aplicáveis (específicas + globais do usuário)
+        self.ensure_loaded(db)
+        return self.rules_for(device_uuid)
+
+    def rules_for(self, device_uuid):
+        device = self._devices.get(device_uuid)
+        if device is None:
+            return None, []
+        specific = [r for r in self._device_rules.get(device_uuid, ()) if r.user_id == device.user_id]
+        return device, specific + self._user_rules.get(device.user_id, [])
+
+    def vector_state(self):
+        # (dispositivos, códigos de usuário, códigos de dispositivo, tabela de regras)
+        return self._vector_state
+
+rule_index = RuleIndex(ttl_seconds=settings.RULE_INDEX_TTL_SECONDS)
+register_local_namespace("rule_index", lambda _: rule_index.invalidate(), rule_index.invalidate)
+
+async def invalidate_rule_index():
+    # Invalida o índice neste processo e nas demais réplicas
+    await clear_cache_async("rule_index:all")
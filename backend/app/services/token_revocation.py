@@ -0,0 +1,61 @@
+import logging
+import time
+from ..core.config import settings
+from ..core.ttl_cache import TTLCache
+from . import cache_service
+from .cache_service import async_redis_client, redis_client, register_local_namespace
+
+logger = logging.getLogger(__name__)
+
+# Lista de tokens revogados (logout). O Redis compartilha a lista entre as réplicas; cada réplica
+# mantém uma cópia local completa, recarregada do Redis quando o ouvinte de invalidação (re)conecta
+# e atualizada pelas revogações publicadas no canal. Com o ouvinte ativo, o Redis não é consultado.
+REVOKED_NAMESPACE = "revoked_token"
+REVOKED_KEY_PREFIX = f"{REVOKED_NAMESPACE}:"
+
+local_revoked = TTLCache(maxsize=settings.REVOKED_TOKENS_LOCAL_SIZE, ttl_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def mark_revoked(jti: str):
+    # Revogação publicada por outra réplica; a mensagem não traz a expiração, vale a duração do token
+    if local_revoked.get(jti) is None:
+        local_revoked.set(jti, True)
+
+def load_revoked_tokens():
+    # Executado pelo ouvinte ao (re)conectar: revogações feitas enquanto ele estava desconectado
+    keys = list(redis_client.scan_iter(match=f"{REVOKED_KEY_PREFIX}*", count=1000))
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.pttl(key)
+    for key, pttl in zip(keys, pipe.execute()):
+        if pttl > 0:
+            local_revoked.set(key.decode()[len(REVOKED_KEY_PREFIX):], True, ttl_seconds=pttl / 1000)
+
+register_local_namespace(REVOKED_NAMESPACE, mark_revoked, lambda: None, resync=load_revoked_tokens)
+
+async def revoke_token(jti: str, expires_at: float):
+    # Mantém o jti revogado somente até a expiração natural do token
+    ttl_seconds = max(int(expires_at - time.time()), 1)
+    local_revoked.set(jti, True, ttl_seconds=ttl_seconds)
+    try:
+        key = f"{REVOKED_KEY_PREFIX}{jti}"
+        await async_redis_client.setex(key, ttl_seconds, 1)
+        await async_redis_client.publish(cache_service.INVALIDATION_CHANNEL, cache_service.serialize([key]))
+    except Exception as e:
+        logger.warning("Erro ao registrar token revogado: %s", e)
+
+def local_copy_complete() -> bool:
+    # Ouvinte conectado e nenhuma revogação descartada pelo limite de tamanho
+    return cache_service.listener_connected() and len(local_revoked) < local_revoked.maxsize
+
+async def is_token_revoked(jti: str) -> bool:
+    if local_revoked.get(jti):
+        return True
+    if local_copy_complete():
+        return False
+    # Ouvinte desconectado: pergunta ao Redis. Redis indisponível: vale só a lista local
+    # (falha aberta, o token ainda expira normalmente)
+    try:
+        return bool(await async_redis_client.exists(f"{REVOKED_KEY_PREFIX}{jti}"))
+    except Exception as e:
+        logger.warning("Erro ao consultar tokens revogados: %s", e)
+        return False
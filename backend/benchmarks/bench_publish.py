@@ -0,0 +1,72 @@
+# Benchmark do publicador: transações AMQP (tx.select/tx.commit, modo usado pelo TelemetryPublisher)
+# vs. publisher confirms, por tamanho de lote, contra um RabbitMQ real.
+#
+# O publicador usa transações porque o BlockingChannel do pika espera a confirmação de cada
+# basic_publish: com confirms um lote de N mensagens custa N idas e voltas, com transações custa uma
+# (o tx.commit). O ponto fraco das transações é o custo fixo de cada commit; por isso o publicador
+# agrupa as publicações pendentes (RABBITMQ_PUBLISHER_MAX_BATCH). Os lotes pequenos abaixo medem esse custo.
+#
+# Uso (na raiz do repositório, com o RabbitMQ do docker compose exposto):
+#   python -m backend.benchmarks.bench_publish --host localhost --messages 5000 --batch-sizes 1,10,100,1000
+import argparse
+import json
+import time
+import uuid
+import pika
+from backend.benchmarks.latency import LatencyRecorder, print_summary
+
+def open_channel(host: str, mode: str):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    if mode == "tx":
+        channel.tx_select()
+    else:
+        channel.confirm_delivery()
+    return connection, channel
+
+def run_mode(host: str, mode: str, messages: int, batch_size: int) -> dict:
+    # Fila temporária própria: não interfere nos consumidores da aplicação
+    connection, channel = open_channel(host, mode)
+    queue = f"bench_publish_{uuid.uuid4().hex[:8]}"
+    channel.queue_declare(queue=queue, auto_delete=True)
+    if mode == "tx":
+        channel.tx_commit()
+
+    body = json.dumps({"device_uuid": str(uuid.uuid4()), "cpu_usage": 50.0, "boot_date": "2025-10-16T12:00:00Z"})
+    properties = pika.BasicProperties(delivery_mode=2)
+    recorder = LatencyRecorder(f"{mode}_batch_{batch_size}")
+    try:
+        start = time.perf_counter()
+        for offset in range(0, messages, batch_size):
+            count = min(batch_size, messages - offset)
+            batch_start = time.perf_counter()
+            for _ in range(count):
+                channel.basic_publish(exchange="", routing_key=queue, body=body, properties=properties)
+            if mode == "tx":
+                channel.tx_commit()
+            recorder.record(time.perf_counter() - batch_start, count)
+        recorder.elapsed = time.perf_counter() - start
+    finally:
+        channel.queue_delete(queue=queue)
+        if mode == "tx":
+            channel.tx_commit()
+        connection.close()
+    return recorder.summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de publicação no RabbitMQ: transações vs. confirms")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--batch-sizes", default="1,10,100,1000")
+    args = parser.parse_args()
+
+    stages = {}
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        for mode in ("tx", "confirm"):
+            stages[f"{mode}_batch_{batch_size}"] = run_mode(args.host, mode, args.messages, batch_size)
+
+    print(f"Mensagens: {args.messages} por etapa | host: {args.host}")
+    print_summary(stages)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Gerador de frota sintética e histórico de telemetria para testes de escala (somente PostgreSQL)
+#
+# Cria N usuários x M dispositivos e preenche o histórico com curvas diárias, picos e períodos
+# offline, gravando com COPY (telemetria, rollups horários/diários e última telemetria).
+# Usa o banco de DATABASE_URL, como o backend.
+#
+# Uso (na raiz do repositório):
+#   python -m backend.benchmarks.generate_fleet --users 100 --devices-per-user 100 --days 30 --interval-seconds 60
+#   python -m backend.benchmarks.generate_fleet --users 1 --devices-per-user 500 --days 7 --tokens-file tokens.csv
+import argparse
+import csv
+import io
+import math
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import text
+from backend.app.core.security import hash_password
+from backend.app.database.base import engine, create_tables
+from backend.app.database.models import ROLLUP_METRICS
+from backend.app.database import partitioning
+from backend.app.services.ingest_auth import generate_ingest_token
+
+TELEMETRY_COLUMNS = ("device_uuid", "boot_date", "cpu_usage", "ram_usage", "disk_free", "temperature", "latency", "connectivity")
+ROLLUP_COLUMNS = ("device_uuid", "bucket_start") + tuple(
+    f"{metric}_{suffix}" for metric in ROLLUP_METRICS for suffix in ("sum", "min", "max", "count")
+)
+ROLLUP_TABLES = (("telemetry_rollup_hourly", 60 * 60), ("telemetry_rollup_daily", 60 * 60 * 24))
+
+def copy_rows(cursor, table: str, columns: tuple, lines: list):
+    # COPY ... FROM STDIN em formato texto (tabulação como separador)
+    if lines:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", io.StringIO("\n".join(lines) + "\n"))
+
+def epoch_to_text(seconds: np.ndarray, unit: str) -> list:
+    return np.datetime_as_string((seconds * (1000 if unit == "ms" else 1)).astype(np.int64).astype(f"datetime64[{unit}]")).tolist()
+
+def device_history(rng: np.random.Generator, start: float, end: float, interval: float, offline_ratio: float, spike_rate: float) -> dict:
+    # Série de um dispositivo (epoch em segundos): curva diária + ruído, picos raros e janelas offline
+    timestamps = np.arange(start + rng.uniform(0, interval), end, interval)
+
+    # Janelas offline com duração média de 2h, somando ~offline_ratio do período
+    online = np.ones(len(timestamps), dtype=bool)
+    mean_gap = 2 * 60 * 60
+    for _ in range(rng.poisson(offline_ratio * (end - start) / mean_gap)):
+        gap_start = rng.uniform(start, end)
+        online &= ~((timestamps >= gap_start) & (timestamps < gap_start + rng.exponential(mean_gap)))
+    timestamps = timestamps[online]
+    count = len(timestamps)
+
+    # Pico de uso em um horário próprio de cada dispositivo (fuso/rotina diferentes)
+    hours = (timestamps % 86400) / 3600
+    diurnal = (1 - np.cos(2 * math.pi * (hours - rng.uniform(0, 24) + 12) / 24)) / 2
+    spikes = rng.random(count) < spike_rate
+
+    cpu_base = rng.uniform(5, 30)
+    cpu = cpu_base + rng.uniform(15, 50) * diurnal + rng.normal(0, 4, count)
+    cpu[spikes] += rng.uniform(30, 60, spikes.sum())
+    cpu = np.clip(cpu, 0, 100)
+    ram = np.clip(rng.uniform(20, 50) + 0.3 * (cpu - cpu_base) + rng.normal(0, 2, count), 0, 100)
+    # Disco enche devagar ao longo do período
+    disk_start = rng.uniform(40, 95)
+    disk = np.clip(disk_start - rng.uniform(0, 15) * (timestamps - start) / (end - start) + rng.normal(0, 0.2, count), 0, 100)
+    temperature = 28 + 0.35 * cpu + rng.normal(0, 1.5, count)
+    latency = rng.lognormal(math.log(rng.uniform(15, 60)), 0.4, count)
+    latency[spikes] *= rng.uniform(3, 10, spikes.sum())
+    connectivity = (rng.random(count) >= 0.01).astype(int)
+
+    return {
+        "timestamps": timestamps, "cpu_usage": cpu, "ram_usage": ram, "disk_free": disk,
+        "temperature": temperature, "latency": latency, "connectivity": connectivity,
+    }
+
+def telemetry_lines(device_uuid: str, history: dict) -> list:
+    # Uma formatação por linha sobre listas Python (bem mais rápido que formatar coluna a coluna)
+    line = f"{device_uuid}\t%s\t%.2f\t%.2f\t%.2f\t%.2f\t%.1f\t%d"
+    return list(map(line.__mod__, zip(
+        epoch_to_text(history["timestamps"], "ms"),
+        *(history[column].tolist() for column in TELEMETRY_COLUMNS[2:])
+    )))
+
+def rollup_lines(device_uuid: str, history: dict, bucket_seconds: int) -> list:
+    # Soma, mínimo, máximo e contagem por balde; a série é ordenada, então cada balde é contíguo
+    timestamps = history["timestamps"]
+    if not len(timestamps):
+        return []
+    buckets = (timestamps // bucket_seconds).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(buckets)]).tolist()
+    columns = [epoch_to_text(buckets[starts] * bucket_seconds, "s")]
+    for metric in ROLLUP_METRICS:
+        values = history[metric]
+        columns += [
+            np.add.reduceat(values, starts).tolist(),
+            np.minimum.reduceat(values, starts).tolist(),
+            np.maximum.reduceat(values, starts).tolist(),
+            counts,
+        ]
+    line = f"{device_uuid}\t%s" + "\t%.4f\t%.2f\t%.2f\t%d" * len(ROLLUP_METRICS)
+    return list(map(line.__mod__, zip(*columns)))
+
+def generate_devices(task: tuple) -> int:
+    # Executado em um processo próprio: gera e grava o histórico de um grupo de dispositivos
+    device_uuids, seed, start, end, options = task
+    rng = np.random.default_rng(seed)
+    connection = engine.raw_connection()
+    written = 0
+    try:
+        cursor = connection.cursor()
+        telemetry, rollups = [], {table: [] for table, _ in ROLLUP_TABLES}
+
+        def flush():
+            copy_rows(cursor, "telemetry", TELEMETRY_COLUMNS, telemetry)
+            for table, lines in rollups.items():
+                copy_rows(cursor, table, ROLLUP_COLUMNS, lines)
+                lines.clear()
+            telemetry.clear()
+            connection.commit()
+
+        for device_uuid in device_uuids:
+            history = device_history(rng, start, end, options["interval_seconds"], options["offline_ratio"], options["spike_rate"])
+            telemetry += telemetry_lines(device_uuid, history)
+            for table, bucket_seconds in ROLLUP_TABLES:
+                rollups[table] += rollup_lines(device_uuid, history, bucket_seconds)
+            written += len(history["timestamps"])
+            if len(telemetry) >= options["chunk_rows"]:
+                flush()
+        flush()
+    finally:
+        connection.close()
+    engine.dispose()
+    return written
+
+def create_history_partitions(start: datetime, end: datetime):
+    # Com a telemetria particionada, cria as partições do período (senão tudo cai na default)
+    if not partitioning.is_enabled(engine):
+        return
+    with engine.begin() as connection:
+        moment = partitioning.partition_start(start)
+        while moment < end:
+            partitioning.create_partition(connection, moment)
+            moment += partitioning.partition_step()
+
+def create_fleet(args, now: datetime) -> list:
+    # Usuários e dispositivos via COPY; retorna os UUIDs dos dispositivos
+    hashed_password = hash_password(args.password)
+    stamp = now.isoformat()
+    users, devices, keys, tokens = [], [], [], []
+    sn_base = int(time.time() * 1000) % 10 ** 11
+    for u in range(args.users):
+        user_id = str(uuid.uuid4())
+        users.append(f"{user_id}\t{args.username_prefix}{u}\t{hashed_password}\t{stamp}\t{stamp}")
+        for d in range(args.devices_per_user):
+            device_uuid = uuid.uuid4()
+            sn = f"{(sn_base + len(devices)) % 10 ** 12:012d}"
+            devices.append(f"{device_uuid}\tgen-{u}-{d}\tRack {d % 40}\t{sn}\tDispositivo sintético\t{user_id}\t{stamp}\t{stamp}")
+            if args.tokens_file:
+                token, key_hash = generate_ingest_token(device_uuid)
+                keys.append(f"{device_uuid}\t{key_hash}\t{stamp}")
+                tokens.append((str(device_uuid), f"{args.username_prefix}{u}", token))
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        copy_rows(cursor, "users", ("id", "username", "hashed_password", "created_at", "updated_at"), users)
+        copy_rows(cursor, "devices", ("uuid", "name", "location", "sn", "description", "user_id", "created_at", "updated_at"), devices)
+        copy_rows(cursor, "device_ingest_keys", ("device_uuid", "key_hash", "created_at"), keys)
+        connection.commit()
+    finally:
+        connection.close()
+
+    if args.tokens_file:
+        with open(args.tokens_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["device_uuid", "username", "ingest_token"])
+            writer.writerows(tokens)
+    return [line.split("\t", 1)[0] for line in devices]
+
+def fill_latest_telemetry(device_uuids: list):
+    # Última telemetria dos dispositivos gerados (índice device_uuid, boot_date DESC)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO device_latest_telemetry "
+            "(device_uuid, telemetry_id, cpu_usage, ram_usage, disk_free, temperature, latency, connectivity, boot_date, updated_at) "
+            "SELECT DISTINCT ON (device_uuid) device_uuid, id, cpu_usage, ram_usage, disk_free, temperature, latency, "
+            "connectivity, boot_date, now() FROM telemetry WHERE device_uuid = ANY(CAST(:uuids AS uuid[])) "
+            "ORDER BY device_uuid, boot_date DESC "
+            "ON CONFLICT (device_uuid) DO NOTHING"
+        ), {"uuids": device_uuids})
+        for table in ("telemetry", "telemetry_rollup_hourly", "telemetry_rollup_daily", "device_latest_telemetry"):
+            connection.execute(text(f"ANALYZE {table}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera usuários, dispositivos e histórico de telemetria sintéticos")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--devices-per-user", type=int, default=100)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval-seconds", type=float, default=60, help="intervalo entre heartbeats de um dispositivo")
+    parser.add_argument("--offline-ratio", type=float, default=0.02, help="fração aproximada do tempo offline")
+    parser.add_argument("--spike-rate", type=float, default=0.002, help="probabilidade de pico por leitura")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--chunk-rows", type=int, default=200000, help="linhas por COPY/commit")
+    parser.add_argument("--username-prefix", default="gen_user_")
+    parser.add_argument("--password", default="gen_pass")
+    parser.add_argument("--tokens-file", help="CSV com os tokens de ingestão dos dispositivos criados")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=args.days)
+    create_tables()
+    create_history_partitions(start, now)
+
+    began = time.perf_counter()
+    device_uuids = create_fleet(args, now)
+    print(f"[INFO] {args.users} usuários e {len(device_uuids)} dispositivos criados.")
+
+    # Grupos de dispositivos distribuídos entre os processos (cada um com sua conexão e seu COPY)
+    options = {key: getattr(args, key) for key in ("interval_seconds", "offline_ratio", "spike_rate", "chunk_rows")}
+    epoch_start, epoch_end = (start - datetime(1970, 1, 1)).total_seconds(), (now - datetime(1970, 1, 1)).total_seconds()
+    groups = [device_uuids[i::args.processes * 4] for i in range(args.processes * 4)]
+    tasks = [(group, args.seed + i, epoch_start, epoch_end, options) for i, group in enumerate(groups) if group]
+    written = 0
+    # Os processos filhos não podem herdar conexões abertas do pool
+    engine.dispose()
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        for rows in executor.map(generate_devices, tasks):
+            written += rows
+            elapsed = time.perf_counter() - began
+            print(f"[INFO] {written:,} telemetrias gravadas ({written / elapsed:,.0f} linhas/s)")
+
+    fill_latest_telemetry(device_uuids)
+    print(f"[FIM] {written:,} telemetrias em {time.perf_counter() - began:.1f}s.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Registro de latências por etapa dos benchmarks: percentis exatos e histograma em baldes logarítmicos
+import math
+
+# Limites superiores (ms) dos baldes do histograma: 0,05ms dobrando até ~52s
+HISTOGRAM_BOUNDS_MS = [0.05 * 2 ** k for k in range(21)]
+
+class LatencyRecorder:
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = []
+        self.items = 0
+        self.elapsed = 0.0 # tempo de parede da etapa (definido por quem mede)
+
+    def record(self, seconds: float, items: int = 1):
+        self.samples.append(seconds)
+        self.items += items
+
+    def percentile(self, p: float) -> float:
+        # Nearest-rank, em milissegundos
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)] * 1000
+
+    def histogram(self) -> dict:
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for seconds in self.samples:
+            milliseconds = seconds * 1000
+            index = next((i for i, bound in enumerate(HISTOGRAM_BOUNDS_MS) if milliseconds <= bound), len(HISTOGRAM_BOUNDS_MS))
+            counts[index] += 1
+        # Último balde = acima do maior limite
+        return {"le_ms": [round(bound, 3) for bound in HISTOGRAM_BOUNDS_MS] + ["inf"], "counts": counts}
+
+    def summary(self) -> dict:
+        return {
+            "operations": len(self.samples),
+            "items": self.items,
+            "elapsed_seconds": round(self.elapsed, 4),
+            "throughput_items_per_second": round(self.items / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(max(self.samples, default=0.0) * 1000, 3),
+            "histogram": self.histogram(),
+        }
+
+def print_summary(stages: dict, baseline: dict = None):
+    # Tabela por etapa; com um resultado anterior, mostra a variação percentual
+    def delta(stage: str, field: str, value: float) -> str:
+        previous = (baseline or {}).get(stage, {}).get(field)
+        if not previous:
+            return ""
+        return f" ({(value - previous) / previous * 100:+.1f}%)"
+
+    for stage, result in stages.items():
+        if "skipped" in result:
+            print(f"{stage:<16} ignorada: {result['skipped']}")
+            continue
+        print(
+            f"{stage:<16} {result['throughput_items_per_second']:>10,.0f} itens/s{delta(stage, 'throughput_items_per_second', result['throughput_items_per_second'])}"
+            f" | p50 {result['p50_ms']:.2f}ms{delta(stage, 'p50_ms', result['p50_ms'])}"
+            f" | p95 {result['p95_ms']:.2f}ms{delta(stage, 'p95_ms', result['p95_ms'])}"
+            f" | p99 {result['p99_ms']:.2f}ms{delta(stage, 'p99_ms', result['p99_ms'])}"
+        )
@@ -1,8 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator, Generator
 from backend.app.main import fastapi_app
 from backend.app.database.base import Base, get_db
 from backend.app.core.config import settings
@@ -16,6 +17,10 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Mesmo arquivo SQLite acessado pelos endpoints assíncronos (aiosqlite)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 1. Fixture para isolar o ambiente de Teste/DB
 @pytest.fixture(scope="function", autouse=True)
 def setup_test_environment(monkeypatch):
@@ -27,9 +32,15 @@ def setup_test_environment(monkeypatch):
     Base.metadata.drop_all(bind=engine)
 
 # Função de sobrescrita de dependência
-def override_get_db() -> Generator[Session, None, None]:
+async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+# Sessão síncrona para preparar dados diretamente no banco de teste
+@pytest.fixture(scope="module")
+def sync_db() -> Generator[Session, None, None]:
+    db = TestingSessionLocal()
     try:
-        db = TestingSessionLocal()
         yield db
     finally:
         db.close()
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+import uuid
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from backend.app.core.config import settings
+from backend.app.services import cache_service
+
+@pytest.fixture(autouse=True)
+def empty_local_cache():
+    # Cada teste começa com o L1 vazio
+    cache_service.local_cache.clear()
+    yield
+    cache_service.local_cache.clear()
+
+# --- Testes do Serviço de Cache ---
+def test_serialization_round_trip_keeps_json_shape():
+    # UUID e datetime viram texto ISO, como no serializador anterior
+    device_uuid = uuid.uuid4()
+    value = {"device_uuid": device_uuid, "boot_date": datetime(2025, 10, 16, 12, 30, 15, 123456), "cpu_usage": 10.5}
+    assert cache_service.deserialize(cache_service.serialize(value)) == {
+        "device_uuid": str(device_uuid), "boot_date": "2025-10-16T12:30:15.123456", "cpu_usage": 10.5
+    }
+
+def test_ttl_comes_from_namespace():
+    with patch.object(settings, "CACHE_TTLS", {"latest_telemetry": 30}), patch.object(settings, "CACHE_DEFAULT_TTL_SECONDS", 600):
+        assert cache_service.namespace_ttl(cache_service.cache_key("latest_telemetry", "abc")) == 30
+        assert cache_service.namespace_ttl("outro:abc") == 600
+
+def test_cache_errors_are_treated_as_miss():
+    client = MagicMock()
+    client.get = AsyncMock(side_effect=ConnectionError("redis fora"))
+    with patch.object(cache_service, "async_redis_client", client):
+        assert asyncio.run(cache_service.get_cache_async("k:1")) is None
+
+def test_local_cache_hit_skips_redis():
+    client = AsyncMock()
+    with patch.object(cache_service, "async_redis_client", client):
+        asyncio.run(cache_service.set_cache_async("user_devices:1", [1, 2]))
+        assert asyncio.run(cache_service.get_cache_async("user_devices:1")) == [1, 2]
+    client.get.assert_not_called()
+
+def test_set_many_uses_a_single_pipeline():
+    client = MagicMock()
+    pipe = MagicMock(execute=AsyncMock())
+    client.pipeline.return_value.__aenter__.return_value = pipe
+    with patch.object(cache_service, "async_redis_client", client):
+        asyncio.run(cache_service.set_many_async({"user_devices:1": [1], "user_devices:2": [2]}, ttl_seconds=5))
+
+    client.pipeline.assert_called_once_with(transaction=False)
+    assert pipe.setex.call_count == 2
+    pipe.execute.assert_awaited_once()
+
+def test_get_many_only_fetches_local_misses():
+    client = MagicMock()
+    client.mget = AsyncMock(return_value=[cache_service.serialize({"b": 2}), None])
+    cache_service.remember("k:1", cache_service.serialize({"a": 1}))
+    with patch.object(cache_service, "async_redis_client", client):
+        assert asyncio.run(cache_service.get_many_async(["k:1", "k:2", "k:3"])) == [{"a": 1}, {"b": 2}, None]
+    client.mget.assert_awaited_once_with(["k:2", "k:3"])
+
+def test_clear_cache_publishes_invalidation():
+    client = AsyncMock()
+    cache_service.remember("k:1", cache_service.serialize(1))
+    with patch.object(cache_service, "async_redis_client", client):
+        asyncio.run(cache_service.clear_cache_async("k:1"))
+    assert cache_service.local_cache.get("k:1") is None
+    client.publish.assert_awaited_once_with(cache_service.INVALIDATION_CHANNEL, cache_service.serialize(["k:1"]))
+
+def test_invalidation_message_drops_local_entries():
+    # Mensagem recebida de outra réplica
+    cache_service.remember("k:1", cache_service.serialize(1))
+    cache_service.remember("k:2", cache_service.serialize(2))
+    cache_service.handle_invalidation(cache_service.serialize(["k:1"]))
+    assert cache_service.local_cache.get("k:1") is None
+    assert cache_service.local_cache.get("k:2").value() == 2
+
+def test_invalidation_listener_closes_pubsub_before_reconnecting():
+    client = MagicMock()
+    pubsubs = [MagicMock(), MagicMock()]
+    client.pubsub.side_effect = pubsubs
+    for pubsub in pubsubs:
+        pubsub.get_message.side_effect = ConnectionError("redis fora")
+
+    class Stop(Exception):
+        pass
+
+    with patch.object(cache_service, "redis_client", client), \
+         patch.object(cache_service.time, "sleep", side_effect=[None, Stop()]):
+        with pytest.raises(Stop):
+            cache_service.listen_for_invalidations()
+
+    # Uma assinatura por tentativa, cada uma fechada após a falha
+    assert client.pubsub.call_count == 2
+    for pubsub in pubsubs:
+        pubsub.close.assert_called_once()
+
+def test_invalidation_message_drops_ingest_key_hash():
+    # Rotação da chave de ingestão feita em outra réplica
+    from backend.app.services import ingest_auth
+    device_uuid = uuid.uuid4()
+    ingest_auth.key_cache.set(device_uuid, "hash-antigo")
+    cache_service.handle_invalidation(cache_service.serialize([f"ingest_key:{device_uuid}"]))
+    assert ingest_auth.key_cache.get(device_uuid) is None
+
+def test_invalidate_ingest_key_publishes_to_replicas():
+    from backend.app.services import ingest_auth
+    device_uuid = uuid.uuid4()
+    ingest_auth.key_cache.set(device_uuid, "hash-antigo")
+    client = AsyncMock()
+    with patch.object(cache_service, "async_redis_client", client):
+        asyncio.run(ingest_auth.invalidate_ingest_key(device_uuid))
+    assert ingest_auth.key_cache.get(device_uuid) is None
+    client.publish.assert_awaited_once_with(cache_service.INVALIDATION_CHANNEL, cache_service.serialize([f"ingest_key:{device_uuid}"]))
+
+def test_ingest_key_hashes_shared_through_redis():
+    # Réplica com o cache local frio: um MGET no Redis e o banco só para os que faltam
+    from backend.app.services import ingest_auth
+    cached, unknown = uuid.uuid4(), uuid.uuid4()
+    client = MagicMock()
+    client.mget = AsyncMock(return_value=[cache_service.serialize("hash-redis"), None])
+    pipe = MagicMock(execute=AsyncMock())
+    client.pipeline.return_value.__aenter__.return_value = pipe
+    db = AsyncMock()
+    db.execute.return_value.all = Mock(return_value=[(unknown, "hash-banco")])
+    ingest_auth.key_cache.clear()
+
+    with patch.object(cache_service, "async_redis_client", client):
+        hashes = asyncio.run(ingest_auth.load_key_hashes(db, [cached, unknown]))
+
+    assert hashes == {cached: "hash-redis", unknown: "hash-banco"}
+    db.execute.assert_awaited_once()
+    pipe.setex.assert_called_once_with(f"ingest_key:{unknown}", 300, cache_service.serialize("hash-banco"))
+    assert ingest_auth.key_cache.get(cached) == "hash-redis"
+
+def test_concurrent_misses_compute_once():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[1]"
+
+    async def run():
+        return await asyncio.gather(*(cache_service.get_or_compute_raw_async("k:1", compute) for _ in range(5)))
+
+    with patch.object(cache_service, "read_entry_async", AsyncMock(return_value=(None, False))), \
+         patch.object(cache_service, "acquire_lock_async", AsyncMock(return_value="token")), \
+         patch.object(cache_service, "release_lock_async", AsyncMock()) as release, \
+         patch.object(cache_service, "store_entry_async", AsyncMock()) as store:
+        assert asyncio.run(run()) == [b"[1]"] * 5
+
+    assert len(calls) == 1
+    store.assert_awaited_once_with("k:1", b"[1]", None)
+    release.assert_awaited_once_with("k:1", "token")
+
+def test_stale_value_served_while_other_replica_recomputes():
+    compute = AsyncMock()
+    with patch.object(cache_service, "read_entry_async", AsyncMock(return_value=(b"velho", False))), \
+         patch.object(cache_service, "acquire_lock_async", AsyncMock(return_value=None)):
+        assert asyncio.run(cache_service.get_or_compute_raw_async("k:1", compute)) == b"velho"
+    compute.assert_not_awaited()
@@ -23,17 +23,44 @@ class MockCacheService:
 # Instância do mock
 mock_cache = MockCacheService()
 
-# Função que sobrescreve as chamadas reais
-def override_get_cache(key: str):
+# Funções que sobrescrevem as chamadas reais (os endpoints usam a API assíncrona do cache)
+async def override_get_cache(key: str):
     return mock_cache.get_cache(key)
 
-def override_set_cache(key: str, value: dict, ttl_seconds: int):
+async def override_set_cache(key: str, value: dict, ttl_seconds: int = None):
     return mock_cache.set_cache(key, value, ttl_seconds)
 
-def override_clear_cache(key: str):
-    return mock_cache.clear_cache(key)
+async def override_get_or_compute(key: str, compute, ttl_seconds: int = None):
+    # Sem cache: sempre calcula
+    return await compute()
+
+async def override_read_latest(user_id):
+    return None
+
+async def override_load_latest(user_id, entries: dict):
+    return None
+
+async def override_remove_latest(user_id, device_uuid):
+    return None
+
+async def override_get_closed_buckets(device_uuid, period: str, indices: list):
+    return {}
+
+async def override_store_closed_buckets(device_uuid, period: str, buckets: dict, first_index: int, ttl_seconds: int):
+    return None
+
+async def override_clear_cache(*keys: str):
+    for key in keys:
+        mock_cache.clear_cache(key)
+    return True
 
 # Aplica a sobrescrita aos endpoints ANTES de rodar os testes
-devices_endpoint.get_cache = override_get_cache
-devices_endpoint.set_cache = override_set_cache
-devices_endpoint.clear_cache = override_clear_cache
+devices_endpoint.get_cache_async = override_get_cache
+devices_endpoint.set_cache_async = override_set_cache
+devices_endpoint.get_or_compute_raw_async = override_get_or_compute
+devices_endpoint.clear_cache_async = override_clear_cache
+devices_endpoint.get_closed_buckets = override_get_closed_buckets
+devices_endpoint.store_closed_buckets = override_store_closed_buckets
+devices_endpoint.read_latest_payload = override_read_latest
+devices_endpoint.load_latest_payload = override_load_latest
+devices_endpoint.remove_latest_device = override_remove_latest
@@ -0,0 +1,119 @@
+import asyncio
+import time
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from fastapi import HTTPException
+from backend.app import dependencies
+from backend.app.core.config import settings
+from backend.app.core.security import create_access_token, decode_access_token
+from backend.app.database.models import User
+from backend.app.services import cache_service, token_revocation
+
+@pytest.fixture(autouse=True)
+def isolated_auth_state():
+    # Sem Redis nos testes: a lista local de revogação e o cache de usuários começam vazios
+    dependencies.user_cache.clear()
+    token_revocation.local_revoked.clear()
+    with patch.object(token_revocation, "async_redis_client", AsyncMock(exists=AsyncMock(return_value=0))):
+        yield
+
+def make_db(user=None):
+    db = Mock()
+    db.scalar = AsyncMock(return_value=user)
+    return db
+
+# --- Testes de Autenticação Stateless ---
+def test_stateless_token_skips_database():
+    user_id = uuid.uuid4()
+    token = create_access_token({"sub": str(user_id), "username": "alice"})
+    db = make_db()
+
+    user = asyncio.run(dependencies.get_current_user(token, db))
+
+    assert user.id == user_id and user.username == "alice"
+    db.scalar.assert_not_called()
+
+def test_token_without_username_uses_user_cache():
+    # Tokens antigos (sem username) consultam o banco uma vez e depois usam o cache
+    user_id = uuid.uuid4()
+    token = create_access_token({"sub": str(user_id)})
+    db = make_db(User(id=user_id, username="bob"))
+
+    for _ in range(3):
+        user = asyncio.run(dependencies.get_current_user(token, db))
+
+    assert user.username == "bob"
+    db.scalar.assert_awaited_once()
+
+def test_stateful_mode_queries_database():
+    user_id = uuid.uuid4()
+    token = create_access_token({"sub": str(user_id), "username": "carol"})
+    with patch.object(settings, "AUTH_STATELESS", False):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(dependencies.get_current_user(token, make_db(None)))
+    assert exc_info.value.status_code == 401
+
+def test_revoked_token_is_rejected():
+    token = create_access_token({"sub": str(uuid.uuid4()), "username": "dave"})
+    payload = decode_access_token(token)
+    asyncio.run(token_revocation.revoke_token(payload["jti"], payload["exp"]))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(dependencies.get_current_user(token, make_db()))
+    assert exc_info.value.status_code == 401
+
+def test_revocation_checked_in_redis_and_fails_open_on_error():
+    token = create_access_token({"sub": str(uuid.uuid4()), "username": "erin"})
+    jti = decode_access_token(token)["jti"]
+
+    # Revogado por outra réplica: só o Redis sabe
+    with patch.object(token_revocation, "async_redis_client", AsyncMock(exists=AsyncMock(return_value=1))) as client:
+        with pytest.raises(HTTPException):
+            asyncio.run(dependencies.get_current_user(token, make_db()))
+    client.exists.assert_awaited_once_with(f"{token_revocation.REVOKED_KEY_PREFIX}{jti}")
+
+    # Redis fora do ar: o token é aceito
+    with patch.object(token_revocation, "async_redis_client", AsyncMock(exists=AsyncMock(side_effect=ConnectionError("down")))):
+        user = asyncio.run(dependencies.get_current_user(token, make_db()))
+    assert user.username == "erin"
+
+def test_connected_listener_answers_from_local_copy():
+    token = create_access_token({"sub": str(uuid.uuid4()), "username": "frank"})
+    jti = decode_access_token(token)["jti"]
+
+    with patch.object(cache_service, "listener_alive_until", float("inf")):
+        # Nenhuma ida ao Redis enquanto o ouvinte está conectado
+        user = asyncio.run(dependencies.get_current_user(token, make_db()))
+        assert user.username == "frank"
+        token_revocation.async_redis_client.exists.assert_not_called()
+
+        # Revogação publicada por outra réplica chega pelo canal de invalidação
+        cache_service.handle_invalidation(cache_service.serialize([f"{token_revocation.REVOKED_KEY_PREFIX}{jti}"]))
+        with pytest.raises(HTTPException):
+            asyncio.run(dependencies.get_current_user(token, make_db()))
+
+def test_revocation_is_published_to_replicas():
+    client = AsyncMock()
+    with patch.object(token_revocation, "async_redis_client", client):
+        asyncio.run(token_revocation.revoke_token("jti-1", time.time() + 60))
+    key = f"{token_revocation.REVOKED_KEY_PREFIX}jti-1"
+    client.publish.assert_awaited_once_with(cache_service.INVALIDATION_CHANNEL, cache_service.serialize([key]))
+
+def test_reconnecting_listener_reloads_revocations_from_redis():
+    # Revogações feitas enquanto o ouvinte estava desconectado
+    client = MagicMock()
+    client.scan_iter.return_value = [b"revoked_token:a", b"revoked_token:b"]
+    client.pipeline.return_value.execute.return_value = [60000, -2]
+    with patch.object(token_revocation, "redis_client", client):
+        cache_service.resync_local()
+    assert token_revocation.local_revoked.get("a") is True
+    assert token_revocation.local_revoked.get("b") is None
+
+def test_disconnected_listener_falls_back_to_redis():
+    with patch.object(cache_service, "listener_alive_until", 0.0):
+        assert token_revocation.local_copy_complete() is False
+    with patch.object(cache_service, "listener_alive_until", float("inf")), \
+         patch.object(token_revocation.local_revoked, "maxsize", 0):
+        # Cópia local cheia: revogações podem ter sido descartadas
+        assert token_revocation.local_copy_complete() is False
@@ -1,10 +1,12 @@
+import asyncio
 import pytest
 from httpx import Client
 from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
 import uuid
+from backend.app.api.endpoints import devices as devices_endpoint
 from backend.app.database.models import Telemetry
-from backend.app.database.base import get_db
-from backend.app.main import fastapi_app
+from backend.app.database.maintenance import backfill_latest_telemetry, backfill_rollups
 
 # Dados básicos para criar um dispositivo
 DUMMY_DEVICE_DATA = {
@@ -16,14 +18,13 @@ DUMMY_DEVICE_DATA = {
 
 # Fixture para configurar dados de telemetria no banco de dados de teste
 @pytest.fixture(scope="module")
-def setup_telemetry_data(authenticated_client: Client):
+def setup_telemetry_data(authenticated_client: Client, sync_db):
     # Cria um dispositivo e insere dados de telemetria mockados
     response = authenticated_client.post("/api/v1/devices", json=DUMMY_DEVICE_DATA)
     device_uuid = response.json()["uuid"]
     
-    # Sobrescreve a dependência get_db para obter a sessão de teste
-    db_generator = fastapi_app.dependency_overrides.get(get_db)
-    db = next(db_generator())
+    # Os endpoints usam a sessão assíncrona; os dados são inseridos pela sessão síncrona de teste
+    db = sync_db
     
     telemetry_list = []
     current_time = datetime.utcnow()
@@ -47,7 +48,10 @@ def setup_telemetry_data(authenticated_client: Client):
     
     db.add_all(telemetry_list)
     db.commit()
-    db.close()
+
+    # Em produção o worker mantém a última telemetria e os rollups a cada gravação
+    backfill_latest_telemetry(db)
+    backfill_rollups(db)
 
     return device_uuid
 
@@ -91,3 +95,21 @@ def test_get_latest_telemetry_dashboard(authenticated_client: Client, setup_tele
     device_data = latest_telemetry[setup_telemetry_data]
     assert "cpu_usage" in device_data
     assert "device_uuid" == setup_telemetry_data
+
+def test_historical_recomputes_only_open_buckets():
+    # Com todos os baldes fechados em cache, só o balde aberto vai ao banco
+    def cached(device_uuid, period, indices):
+        return {index: [f"dia {index}", 50.0, 30.0, 40.0] for index in indices}
+
+    aggregate = AsyncMock(return_value={10**6: ["hoje", 60.0, 35.0, 45.0]})
+    with patch.object(devices_endpoint, "get_closed_buckets", AsyncMock(side_effect=cached)), \
+         patch.object(devices_endpoint, "store_closed_buckets", AsyncMock()) as store, \
+         patch.object(devices_endpoint, "aggregate_buckets", aggregate):
+        data = asyncio.run(devices_endpoint.query_historical_data(None, uuid.uuid4(), "last_30d"))
+
+    # Uma única consulta, sem limite final: a partir do balde aberto
+    aggregate.assert_awaited_once()
+    assert len(aggregate.call_args[0]) == 5
+    store.assert_not_awaited()
+    assert data["timestamps"][-1] == "hoje"
+    assert len(data["timestamps"]) >= 30
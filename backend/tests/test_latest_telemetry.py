@@ -0,0 +1,28 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+from backend.app.services import latest_telemetry
+
+# --- Testes da Última Telemetria no Redis ---
+def test_payload_joins_serialized_readings():
+    fields = {b"abc": b'{"cpu_usage":1.0}', b"def": b'{"cpu_usage":2.0}', latest_telemetry.COMPLETE_FIELD: b"1"}
+    assert json.loads(latest_telemetry.build_payload(fields)) == {"abc": {"cpu_usage": 1.0}, "def": {"cpu_usage": 2.0}}
+
+def test_incomplete_hash_is_a_miss():
+    # Só as leituras gravadas pelo worker, sem a carga inicial do banco
+    client = MagicMock()
+    client.hgetall = AsyncMock(return_value={b"abc": b"{}"})
+    with patch.object(latest_telemetry, "async_redis_client", client):
+        assert asyncio.run(latest_telemetry.read_latest_payload("user")) is None
+
+def test_load_merges_and_returns_hash_contents():
+    client = MagicMock()
+    client.eval = AsyncMock(return_value=[b"abc", b'{"id":2}', b"_complete", b"1"])
+    with patch.object(latest_telemetry, "async_redis_client", client):
+        payload = asyncio.run(latest_telemetry.load_latest_payload("user", {"abc": ("2025-10-16T10:00:00", b'{"id":1}')}))
+
+    # O valor mais novo gravado pelo worker prevalece sobre o lido do banco
+    assert json.loads(payload) == {"abc": {"id": 2}}
+    args = client.eval.call_args[0]
+    assert args[2] == "latest_telemetry_hash:user"
+    assert args[3:] == ("1", "abc", "2025-10-16T10:00:00", b'{"id":1}')
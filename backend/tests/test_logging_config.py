@@ -0,0 +1,35 @@
+import json
+import logging
+import queue
+from backend.app.core.logging_config import JsonFormatter, SamplingFilter, NonBlockingQueueHandler
+
+def make_record(msg="Lote de %d mensagens", args=(3,), level=logging.INFO, **extra):
+    record = logging.LogRecord("backend.app.teste", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+# --- Testes dos Logs Estruturados ---
+def test_json_formatter_includes_extra_fields():
+    line = JsonFormatter("backend").format(make_record(device_uuid="abc", sampled=True))
+    entry = json.loads(line)
+    assert entry["msg"] == "Lote de 3 mensagens"
+    assert entry["level"] == "INFO"
+    assert entry["service"] == "backend"
+    assert entry["device_uuid"] == "abc"
+    # A marcação de amostragem não vai para a saída
+    assert "sampled" not in entry
+
+def test_sampling_filter_only_drops_sampled_lines():
+    assert SamplingFilter(0.0).filter(make_record()) is True
+    assert SamplingFilter(0.0).filter(make_record(sampled=True)) is False
+    assert SamplingFilter(1.0).filter(make_record(sampled=True)) is True
+
+def test_queue_handler_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+
+    assert handler.dropped == 1
+    record = handler.queue.get_nowait()
+    # Mensagem já resolvida: o listener não depende dos argumentos originais
+    assert record.msg == "Lote de 3 mensagens" and record.args is None
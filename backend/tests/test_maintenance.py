@@ -0,0 +1,42 @@
+import uuid
+from datetime import datetime
+from backend.app.database import maintenance
+from backend.app.database.models import Device, Telemetry, DeviceLatestTelemetry, TelemetryRollupDaily
+
+def add_device_with_history(db) -> uuid.UUID:
+    device_uuid = uuid.uuid4()
+    db.add(Device(uuid=device_uuid, name="Sensor", location="Lab", sn=str(device_uuid.int)[:12], description="Backfill", user_id=uuid.uuid4()))
+    db.add_all([
+        Telemetry(device_uuid=device_uuid, cpu_usage=cpu, boot_date=datetime(2025, 10, 16, hour))
+        for hour, cpu in ((10, 20.0), (11, 40.0))
+    ])
+    db.commit()
+    return device_uuid
+
+# --- Testes do Backfill ---
+def test_backfill_latest_telemetry_uses_newest_reading(sync_db):
+    device_uuid = add_device_with_history(sync_db)
+    maintenance.backfill_latest_telemetry(sync_db)
+
+    latest = sync_db.get(DeviceLatestTelemetry, device_uuid)
+    assert (latest.cpu_usage, latest.boot_date) == (40.0, datetime(2025, 10, 16, 11))
+
+def test_backfill_insert_keeps_rows_written_by_workers(sync_db):
+    # Um worker gravou a última telemetria depois da verificação de tabela vazia
+    device_uuid = add_device_with_history(sync_db)
+    sync_db.add(DeviceLatestTelemetry(device_uuid=device_uuid, telemetry_id=99, cpu_usage=70.0, boot_date=datetime(2025, 10, 16, 12)))
+    sync_db.commit()
+
+    sync_db.execute(maintenance.insert_missing(sync_db, DeviceLatestTelemetry), [
+        {"device_uuid": device_uuid, "telemetry_id": 2, "cpu_usage": 40.0, "boot_date": datetime(2025, 10, 16, 11)}
+    ])
+    sync_db.commit()
+
+    assert sync_db.get(DeviceLatestTelemetry, device_uuid).telemetry_id == 99
+
+def test_backfill_rollups_aggregates_history(sync_db):
+    device_uuid = add_device_with_history(sync_db)
+    maintenance.backfill_rollups(sync_db)
+
+    daily = sync_db.get(TelemetryRollupDaily, {"device_uuid": device_uuid, "bucket_start": datetime(2025, 10, 16)})
+    assert (daily.cpu_usage_sum, daily.cpu_usage_min, daily.cpu_usage_max, daily.cpu_usage_count) == (60.0, 20.0, 40.0, 2)
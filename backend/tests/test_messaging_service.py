@@ -0,0 +1,125 @@
+import asyncio
+import pika
+import pytest
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+from fastapi import HTTPException
+from backend.app.core.config import settings
+from backend.app.services import messaging_service
+from backend.app.services.messaging_service import TelemetryPublisher
+
+def make_connection():
+    connection = Mock()
+    connection.is_open = True
+    channel = Mock()
+    channel.is_open = True
+    return connection, channel
+
+@pytest.fixture
+def publisher():
+    pub = TelemetryPublisher(max_pending=10, retry_delay=0)
+    yield pub
+    pub.stop()
+
+# --- Testes do Publicador Persistente ---
+def test_publisher_reuses_connection(publisher):
+    # Várias publicações devem usar a mesma conexão
+    connection, channel = make_connection()
+    with patch.object(messaging_service, 'get_rabbitmq_connection', return_value=(connection, channel)) as mock_connect:
+        for i in range(3):
+            assert publisher.submit([f'{{"n": {i}}}']).result(timeout=5) == 1
+
+    mock_connect.assert_called_once()
+    channel.tx_select.assert_called_once()
+    assert channel.basic_publish.call_count == 3
+    assert channel.tx_commit.call_count == 3
+
+def test_publisher_reconnects_after_failure(publisher):
+    # Se a conexão cair, o publicador reconecta e reenvia a mensagem
+    broken_connection, broken_channel = make_connection()
+    broken_channel.basic_publish.side_effect = pika.exceptions.StreamLostError("conexão perdida")
+    connection, channel = make_connection()
+
+    with patch.object(messaging_service, 'get_rabbitmq_connection', side_effect=[(broken_connection, broken_channel), (connection, channel)]):
+        assert publisher.submit(['{}']).result(timeout=5) == 1
+
+    channel.basic_publish.assert_called_once()
+
+def test_pending_publications_share_one_commit(publisher):
+    # Publicações que chegam enquanto a thread está ocupada vão na mesma transação
+    connection, channel = make_connection()
+    futures = [Future(), Future()]
+    publisher._pending.put((['{"n": 1}', '{"n": 2}'], futures[0]))
+    publisher._pending.put((['{"n": 3}'], futures[1]))
+
+    with patch.object(messaging_service, 'get_rabbitmq_connection', return_value=(connection, channel)):
+        publisher.start()
+        assert [f.result(timeout=5) for f in futures] == [2, 1]
+
+    assert channel.basic_publish.call_count == 3
+    channel.tx_commit.assert_called_once()
+
+def test_publisher_does_not_republish_after_failed_commit(publisher):
+    # A transação pode ter sido aplicada: reenviar duplicaria a telemetria
+    connection, channel = make_connection()
+    channel.tx_commit.side_effect = pika.exceptions.StreamLostError("conexão perdida")
+
+    with patch.object(messaging_service, 'get_rabbitmq_connection', return_value=(connection, channel)) as mock_connect:
+        with pytest.raises(pika.exceptions.StreamLostError):
+            publisher.submit(['{}', '{}']).result(timeout=5)
+
+    mock_connect.assert_called_once()
+    assert channel.basic_publish.call_count == 2
+
+def test_publisher_reports_unavailable_broker(publisher):
+    # Sem broker disponível o Future termina com erro
+    with patch.object(messaging_service, 'get_rabbitmq_connection', return_value=(None, None)):
+        with pytest.raises(pika.exceptions.AMQPConnectionError):
+            publisher.submit(['{}']).result(timeout=5)
+
+def test_publish_telemetry_message_raises_http_error():
+    # Falhas de publicação viram HTTP 500 para o endpoint
+    failing = Mock()
+    failing.submit.side_effect = RuntimeError("Fila de publicação cheia.")
+    with patch.object(messaging_service, 'publisher', failing):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(messaging_service.publish_telemetry_message({"device_uuid": "x"}))
+    assert exc_info.value.status_code == 500
+
+def test_topology_binds_one_queue_per_consumer_group():
+    # Worker e processador de notificações precisam de filas próprias ligadas ao mesmo exchange
+    channel = Mock()
+    messaging_service.declare_telemetry_topology(channel)
+
+    channel.exchange_declare.assert_called_once_with(exchange=settings.RABBITMQ_EXCHANGE, exchange_type='fanout', durable=True)
+    bound_queues = {c.kwargs['queue'] for c in channel.queue_bind.call_args_list}
+    assert bound_queues == {settings.RABBITMQ_QUEUE, settings.RABBITMQ_NOTIFICATION_QUEUE}
+
+def test_timed_out_submission_is_cancelled_and_skipped(publisher):
+    # Publicação que esgotou o tempo ainda na fila: o cliente recebe erro e ela nunca é enviada
+    pending = Future()
+    with patch.object(messaging_service.publisher, "submit", return_value=pending), \
+         patch.object(settings, "RABBITMQ_PUBLISH_TIMEOUT", 0.01):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(messaging_service.wait_published(['{}']))
+    assert pending.cancelled()
+
+    connection, channel = make_connection()
+    publisher._pending.put((['{"n": 1}'], pending))
+    with patch.object(messaging_service, 'get_rabbitmq_connection', return_value=(connection, channel)):
+        assert publisher.submit(['{"n": 2}']).result(timeout=5) == 1
+    assert channel.basic_publish.call_count == 1
+
+def test_submission_already_publishing_waits_for_commit():
+    # Já retirada da fila pela thread: o tempo esgotado não vira erro, vale o resultado do commit
+    running = Future()
+    running.set_running_or_notify_cancel()
+
+    async def scenario():
+        asyncio.get_running_loop().call_later(0.05, running.set_result, 1)
+        await messaging_service.wait_published(['{}'])
+
+    with patch.object(messaging_service.publisher, "submit", return_value=running), \
+         patch.object(settings, "RABBITMQ_PUBLISH_TIMEOUT", 0.01):
+        asyncio.run(scenario())
+    assert running.result() == 1
@@ -0,0 +1,46 @@
+import asyncio
+import pika
+from unittest.mock import AsyncMock, Mock, patch
+from prometheus_client import REGISTRY
+from backend.app.services import cache_service, messaging_service
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+# --- Testes das Métricas do Prometheus ---
+def test_metrics_endpoint_exposes_route_latency_and_pool(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="/metrics/db-pool", status="200")
+    assert client.get("/metrics/db-pool").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # Rotulado pelo modelo da rota, não pelo caminho concreto
+    assert sample("http_request_duration_seconds_count", method="GET", route="/metrics/db-pool", status="200") == before + 1
+    assert 'db_pool_checked_out{engine="async"}' in response.text
+
+def test_cache_lookups_counted_per_namespace():
+    cache_service.local_cache.clear()
+    before = {result: sample("cache_lookups_total", namespace="user_devices", result=result) for result in ("l1", "redis", "miss")}
+    client = AsyncMock()
+    client.get.side_effect = lambda key: b"[1]" if key == "user_devices:1" else None
+    with patch.object(cache_service, "async_redis_client", client):
+        asyncio.run(cache_service.get_cache_async("user_devices:1"))
+        asyncio.run(cache_service.get_cache_async("user_devices:2"))
+        # Segunda leitura da chave encontrada sai do L1
+        asyncio.run(cache_service.get_cache_async("user_devices:1"))
+    cache_service.local_cache.clear()
+
+    assert sample("cache_lookups_total", namespace="user_devices", result="redis") == before["redis"] + 1
+    assert sample("cache_lookups_total", namespace="user_devices", result="miss") == before["miss"] + 1
+    assert sample("cache_lookups_total", namespace="user_devices", result="l1") == before["l1"] + 1
+
+def test_published_messages_carry_timestamp_for_consumer_lag():
+    publisher = messaging_service.TelemetryPublisher(max_pending=1, retry_delay=0)
+    publisher._channel = channel = Mock()
+    publisher._publish(['{"n": 1}'])
+    properties = channel.basic_publish.call_args.kwargs["properties"]
+
+    lag = messaging_service.consumer_lag(pika.BasicProperties(headers={"published_at": properties.headers["published_at"] - 2}))
+    assert 2 <= lag < 3
+    assert messaging_service.consumer_lag(pika.BasicProperties()) is None
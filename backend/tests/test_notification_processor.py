@@ -1,40 +1,50 @@
 import pytest
-from unittest.mock import Mock, patch
-from backend.app.services.notification_processor import check_notification_rules, compare_values
+from unittest.mock import Mock, AsyncMock, patch
+from backend.app.services.notification_processor import check_notification_rules, evaluate_rules_batch
+from backend.app.services import cache_service
+from backend.app.services.rule_index import rule_index
 from backend.app.database.models import Notification, Device
 from sqlalchemy.orm import Session
 import uuid
+import asyncio
 
 # Dados básicos de teste
 TEST_USER_ID = uuid.uuid4()
 TEST_DEVICE_UUID = uuid.uuid4()
 ANOTHER_DEVICE_UUID = uuid.uuid4()
 
-@pytest.fixture
-def mock_db_session():
+# --- Testes do Processador de Notificações ---
+def make_db_session(devices, rules):
+    # Sessão mockada com os dados usados para montar o índice de regras
     session = Mock(spec=Session)
+    def query(*entities):
+        result = Mock()
+        if entities[0] is Notification:
+            result.all.return_value = rules
+        else:
+            result.all.return_value = [(d.uuid, d.user_id, d.name) for d in devices]
+        return result
+    session.query.side_effect = query
     return session
 
-# --- Testes de Lógica de Comparação ---
-def test_compare_values_greater_than():
-    assert compare_values(80, '>', 70) is True
-def test_compare_values_less_than():
-    assert compare_values(70, '<', 80) is True
-def test_compare_values_equals():
-    assert compare_values(70, '==', 70) is True
-def test_compare_values_not_equals():
-    assert compare_values(71, '!=', 70) is True
-def test_compare_values_greater_or_equals():
-    assert compare_values(70, '>=', 70) is True
-def test_compare_values_less_or_equals():
-    assert compare_values(70, '<=', 70) is True
+@pytest.fixture(autouse=True)
+def fresh_rule_index():
+    rule_index.invalidate()
+    yield
+    rule_index.invalidate()
 
+@pytest.fixture
+def mock_sio_instance():
+    # Executa a corrotina de emissão imediatamente, sem depender do loop principal
+    sio = Mock()
+    sio.emit = AsyncMock()
+    with patch('backend.app.services.notification_processor.sio_instance', sio), \
+         patch('backend.app.services.notification_processor.main_loop_instance', Mock()), \
+         patch('backend.app.services.notification_processor.asyncio.run_coroutine_threadsafe', side_effect=lambda coro, loop: asyncio.run(coro)):
+        yield sio
 
-# --- Testes do Processador de Notificações ---
-@patch('backend.app.services.notification_processor.sio_instance')
-def test_check_rules_trigger_and_emit(mock_sio_instance, mock_db_session):
+def test_check_rules_trigger_and_emit(mock_sio_instance):
     # Testa se o processador aciona a regra e emite o evento via SocketIO.
-    mock_sio_instance.emit = Mock()
     
     # Mocka o Dispositivo
     mock_device = Device(user_id=TEST_USER_ID, uuid=TEST_DEVICE_UUID, name="Sensor X")
@@ -50,8 +60,7 @@ def test_check_rules_trigger_and_emit(mock_sio_instance, mock_db_session):
     )
     
     # Configura a Sessão do DB
-    mock_db_session.query.return_value.filter.return_value.first.return_value = mock_device
-    mock_db_session.query.return_value.filter.return_value.all.return_value = [mock_rule]
+    mock_db_session = make_db_session([mock_device], [mock_rule])
 
     # Dados de telemetria que ACIONAM a regra (CPU > 80.0)
     telemetry_data = {
@@ -68,15 +77,12 @@ def test_check_rules_trigger_and_emit(mock_sio_instance, mock_db_session):
     # Verifica o payload
     args, kwargs = mock_sio_instance.emit.call_args
     assert args[0] == 'new_notification'
-    assert kwargs['room'] == str(TEST_USER_ID)
+    assert kwargs['to'] == str(TEST_USER_ID)
     assert 'ALERTA: CPU ALTA' in args[1]['message']
 
 
-@patch('backend.app.services.notification_processor.sio_instance')
-def test_check_rules_global_device_uuid_none(mock_sio_instance, mock_db_session):
+def test_check_rules_global_device_uuid_none(mock_sio_instance):
     # Testa se uma regra global (device_uuid=None) é acionada por um dispositivo qualquer.
-    mock_sio_instance.emit = Mock() 
-    
     mock_device = Device(user_id=TEST_USER_ID, uuid=ANOTHER_DEVICE_UUID, name="Global Device")
     
     # Regra Global: device_uuid é None
@@ -89,8 +95,7 @@ def test_check_rules_global_device_uuid_none(mock_sio_instance, mock_db_session)
         message="Temperatura Geral Alta"
     )
     
-    mock_db_session.query.return_value.filter.return_value.first.return_value = mock_device
-    mock_db_session.query.return_value.filter.return_value.all.return_value = [mock_global_rule]
+    mock_db_session = make_db_session([mock_device], [mock_global_rule])
 
     telemetry_data = {
         "device_uuid": str(ANOTHER_DEVICE_UUID),
@@ -104,5 +109,99 @@ def test_check_rules_global_device_uuid_none(mock_sio_instance, mock_db_session)
     
     # Verifica o room e o device_uuid
     args, kwargs = mock_sio_instance.emit.call_args
-    assert kwargs['room'] == str(TEST_USER_ID)
+    assert kwargs['to'] == str(TEST_USER_ID)
     assert args[1]['device_uuid'] == str(ANOTHER_DEVICE_UUID)
+
+
+def test_rule_index_avoids_db_in_steady_state(mock_sio_instance):
+    # Depois de montado, o índice avalia novas mensagens sem consultar o banco
+    mock_device = Device(user_id=TEST_USER_ID, uuid=TEST_DEVICE_UUID, name="Sensor X")
+    mock_rule = Notification(user_id=TEST_USER_ID, device_uuid=TEST_DEVICE_UUID, parameter="cpu_usage", operator=">=", threshold=90.0, message="CPU")
+    mock_db_session = make_db_session([mock_device], [mock_rule])
+
+    for cpu in (95.0, 10.0, 90.0):
+        check_notification_rules(mock_db_session, {"device_uuid": str(TEST_DEVICE_UUID), "cpu_usage": cpu})
+
+    assert mock_db_session.query.call_count == 2 # Apenas a carga inicial (dispositivos + regras)
+    assert mock_sio_instance.emit.call_count == 2
+
+    # Após invalidação (ex.: nova regra criada) o índice é recarregado
+    rule_index.invalidate()
+    check_notification_rules(mock_db_session, {"device_uuid": str(TEST_DEVICE_UUID), "cpu_usage": 10.0})
+    assert mock_db_session.query.call_count == 4
+
+
+def test_invalidation_during_load_is_not_lost():
+    # Regra criada enquanto o índice lia o banco: a carga em andamento não pode ser marcada como atual
+    mock_device = Device(user_id=TEST_USER_ID, uuid=TEST_DEVICE_UUID, name="Sensor X")
+    mock_db_session = make_db_session([mock_device], [])
+    query = mock_db_session.query.side_effect
+    def racing_query(*entities):
+        if entities[0] is Notification and mock_db_session.query.call_count == 2:
+            rule_index.invalidate()
+        return query(*entities)
+    mock_db_session.query.side_effect = racing_query
+
+    rule_index.ensure_loaded(mock_db_session)
+    assert not rule_index.is_fresh()
+    rule_index.ensure_loaded(mock_db_session)
+    assert rule_index.is_fresh()
+    assert mock_db_session.query.call_count == 4
+
+
+def test_rule_index_invalidated_by_other_replicas():
+    rule_index.build([], [])
+    assert rule_index.is_fresh()
+    cache_service.handle_invalidation(cache_service.serialize(["rule_index:all"]))
+    assert not rule_index.is_fresh()
+
+
+def test_batch_evaluation_matches_per_message_path():
+    # O caminho vetorizado deve acionar exatamente os mesmos pares (mensagem, regra)
+    other_user = uuid.uuid4()
+    devices = [
+        Device(user_id=TEST_USER_ID, uuid=TEST_DEVICE_UUID, name="Sensor X"),
+        Device(user_id=TEST_USER_ID, uuid=ANOTHER_DEVICE_UUID, name="Sensor Y"),
+        Device(user_id=other_user, uuid=uuid.uuid4(), name="Sensor Z"),
+    ]
+    rules = [
+        Notification(id=1, user_id=TEST_USER_ID, device_uuid=TEST_DEVICE_UUID, parameter="cpu_usage", operator=">", threshold=80.0, message="CPU"),
+        Notification(id=2, user_id=TEST_USER_ID, device_uuid=None, parameter="temperature", operator=">=", threshold=50.0, message="TEMP"),
+        Notification(id=3, user_id=other_user, device_uuid=None, parameter="ram_usage", operator="<", threshold=20.0, message="RAM"),
+        Notification(id=4, user_id=TEST_USER_ID, device_uuid=ANOTHER_DEVICE_UUID, parameter="latency", operator="!=", threshold=10.0, message="LAT"),
+    ]
+    mock_db_session = make_db_session(devices, rules)
+
+    batch = [
+        {"device_uuid": str(TEST_DEVICE_UUID), "cpu_usage": 95.0, "temperature": 50.0, "ram_usage": 5.0},
+        {"device_uuid": str(ANOTHER_DEVICE_UUID), "cpu_usage": 99.0, "temperature": 20.0, "latency": 12.0},
+        {"device_uuid": str(devices[2].uuid), "ram_usage": 10.0, "temperature": 90.0},
+        {"device_uuid": str(ANOTHER_DEVICE_UUID), "latency": "n/a"}, # Valor não numérico é ignorado
+        {"device_uuid": "uuid-invalido", "cpu_usage": 99.0},
+    ]
+
+    triggered = evaluate_rules_batch(mock_db_session, batch)
+    batch_pairs = [(i, rule.id) for i, rule, _, _ in triggered]
+
+    per_message_pairs = []
+    for i, telemetry_data in enumerate(batch):
+        with patch('backend.app.services.notification_processor.dispatch_alert') as mock_dispatch:
+            check_notification_rules(mock_db_session, telemetry_data)
+        per_message_pairs += [(i, call.args[0].id) for call in mock_dispatch.call_args_list]
+
+    assert sorted(batch_pairs) == sorted(per_message_pairs)
+    assert sorted(batch_pairs) == [(0, 1), (0, 2), (1, 4), (2, 3)]
+
+
+# --- Testes de Lógica de Comparação (caminho vetorizado) ---
+@pytest.mark.parametrize("operator, hit, miss", [
+    ('>', 80, 70), ('<', 60, 70), ('==', 70, 71), ('!=', 71, 70), ('>=', 70, 69), ('<=', 70, 71),
+])
+def test_batch_evaluation_operators(operator, hit, miss):
+    # Cada operador comparado pelo numpy contra o limite 70
+    device = Device(user_id=TEST_USER_ID, uuid=TEST_DEVICE_UUID, name="Sensor X")
+    rule = Notification(id=1, user_id=TEST_USER_ID, device_uuid=TEST_DEVICE_UUID, parameter="cpu_usage", operator=operator, threshold=70.0, message="CPU")
+    batch = [{"device_uuid": str(TEST_DEVICE_UUID), "cpu_usage": value} for value in (hit, miss)]
+
+    triggered = evaluate_rules_batch(make_db_session([device], [rule]), batch)
+    assert [(i, value) for i, _, _, value in triggered] == [(0, hit)]
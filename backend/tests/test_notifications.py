@@ -0,0 +1,20 @@
+import uuid
+import pytest
+from httpx import Client
+from backend.app.main import fastapi_app
+from backend.app.api.endpoints.devices import get_current_user
+from backend.app.database.models import User
+
+@pytest.fixture
+def logged_user():
+    fastapi_app.dependency_overrides[get_current_user] = lambda: User(id=uuid.uuid4(), username="rules_user")
+    yield
+    fastapi_app.dependency_overrides.pop(get_current_user, None)
+
+def test_create_notification_rejects_invalid_device_uuid(client: Client, logged_user):
+    # UUID malformado é erro de validação (422), não erro interno
+    response = client.post("/api/v1/notifications", json={
+        "device_uuid": "not-a-uuid", "parameter": "cpu_usage", "threshold": 90.0, "message": "CPU alta"
+    })
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "device_uuid"]
@@ -0,0 +1,82 @@
+from datetime import datetime
+from unittest.mock import Mock, patch
+from backend.app.core.config import settings
+from backend.app.database import partitioning
+
+def make_connection(partitions):
+    # partitions: (nome, expressão de pg_get_expr(relpartbound, oid))
+    connection = Mock()
+    connection.execute.return_value.all.return_value = partitions
+    return connection
+
+def bound(start, end):
+    return f"FOR VALUES FROM ('{start} 00:00:00') TO ('{end} 00:00:00')"
+
+# --- Testes do Particionamento de Telemetria ---
+def test_partitioning_is_disabled_outside_postgres():
+    engine = Mock()
+    engine.dialect.name = "sqlite"
+    assert partitioning.is_enabled(engine) is False
+
+def test_daily_partition_bounds():
+    with patch.object(settings, "TELEMETRY_PARTITION_INTERVAL", "day"):
+        start = partitioning.partition_start(datetime(2025, 10, 16, 15, 42))
+    assert start == datetime(2025, 10, 16)
+    assert partitioning.partition_name(start) == "telemetry_p20251016"
+
+def test_weekly_partitions_start_on_monday():
+    with patch.object(settings, "TELEMETRY_PARTITION_INTERVAL", "week"):
+        # 16/10/2025 é uma quinta-feira
+        assert partitioning.partition_start(datetime(2025, 10, 16, 15, 42)) == datetime(2025, 10, 13)
+
+def test_retention_drops_only_expired_partitions():
+    connection = make_connection([
+        ("telemetry_p20250701", bound("2025-07-01", "2025-07-02")),
+        ("telemetry_p20250720", bound("2025-07-20", "2025-07-21")),
+        ("telemetry_p20251016", bound("2025-10-16", "2025-10-17")),
+        ("telemetry_default", "DEFAULT"),
+    ])
+    with patch.object(settings, "TELEMETRY_PARTITION_INTERVAL", "day"), \
+         patch.object(settings, "TELEMETRY_RETENTION_DAYS", 90):
+        dropped = partitioning.drop_expired_partitions(connection, datetime(2025, 10, 16))
+
+    # Limite: 18/07/2025. A partição default nunca é removida.
+    assert dropped == ["telemetry_p20250701"]
+
+def test_retention_uses_the_partition_real_bounds():
+    # Partição semanal criada antes da troca para intervalo diário: vale o limite do catálogo
+    connection = make_connection([("telemetry_p20250714", bound("2025-07-14", "2025-07-21"))])
+    with patch.object(settings, "TELEMETRY_PARTITION_INTERVAL", "day"), \
+         patch.object(settings, "TELEMETRY_RETENTION_DAYS", 90):
+        assert partitioning.drop_expired_partitions(connection, datetime(2025, 10, 16)) == []
+        assert partitioning.drop_expired_partitions(connection, datetime(2025, 10, 19)) == ["telemetry_p20250714"]
+
+def test_create_partition_skips_ranges_covered_by_another_interval():
+    connection = make_connection([("telemetry_p20251013", bound("2025-10-13", "2025-10-20"))])
+    connection.execute.return_value.scalar.return_value = None
+    with patch.object(settings, "TELEMETRY_PARTITION_INTERVAL", "day"):
+        partitioning.create_partition(connection, datetime(2025, 10, 16))
+
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert not any(statement.startswith(("CREATE TABLE", "ALTER TABLE")) for statement in statements)
+
+def test_retention_disabled_keeps_everything():
+    connection = make_connection([("telemetry_p20200101", bound("2020-01-01", "2020-01-02"))])
+    with patch.object(settings, "TELEMETRY_RETENTION_DAYS", 0):
+        assert partitioning.drop_expired_partitions(connection, datetime(2025, 10, 16)) == []
+    connection.execute.assert_not_called()
+
+def test_retention_deletes_expired_rows_from_default_partition():
+    connection = Mock()
+    connection.execute.return_value.rowcount = 3
+    with patch.object(settings, "TELEMETRY_RETENTION_DAYS", 90):
+        assert partitioning.delete_expired_default_rows(connection, datetime(2025, 10, 16)) == 3
+
+    statement, params = connection.execute.call_args.args
+    assert str(statement) == "DELETE FROM telemetry_default WHERE boot_date < :cutoff"
+    assert params == {"cutoff": datetime(2025, 7, 18)}
+
+    connection.reset_mock()
+    with patch.object(settings, "TELEMETRY_RETENTION_DAYS", 0):
+        assert partitioning.delete_expired_default_rows(connection, datetime(2025, 10, 16)) == 0
+    connection.execute.assert_not_called()
@@ -0,0 +1,34 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool, NullPool
+from backend.app.core.config import settings
+from backend.app.database.pool import PoolMetrics, measured_pool, engine_options
+
+# --- Testes do Pool de Conexões ---
+def test_measured_pool_records_waits_and_timeouts():
+    metrics = PoolMetrics()
+    engine = create_engine("sqlite://", poolclass=measured_pool(QueuePool, metrics), pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+    connection = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+
+    stats = metrics.snapshot(engine.pool)
+    assert stats["checked_out"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["wait_seconds_max"] >= 0.05
+    connection.close()
+
+def test_engine_options_follow_settings():
+    with patch.object(settings, "DB_PGBOUNCER", False), patch.object(settings, "DB_POOL_SIZE", 7):
+        options = engine_options(PoolMetrics())
+    assert options["pool_size"] == 7
+    assert issubclass(options["poolclass"], QueuePool)
+
+def test_pgbouncer_mode_disables_local_pool_and_prepared_statements():
+    with patch.object(settings, "DB_PGBOUNCER", True):
+        options = engine_options(PoolMetrics(), async_driver=True)
+    assert options["poolclass"] is NullPool
+    assert options["connect_args"]["statement_cache_size"] == 0
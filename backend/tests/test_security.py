@@ -0,0 +1,31 @@
+import asyncio
+import bcrypt
+import pytest
+from unittest.mock import patch
+from backend.app.core import security
+from backend.app.core.config import settings
+
+# --- Testes de Hash de Senha ---
+def test_hash_password_uses_configured_cost():
+    with patch.object(settings, "BCRYPT_ROUNDS", 4):
+        hashed = security.hash_password("segredo")
+    assert hashed.startswith("$2b$04$")
+    assert security.verify_password("segredo", hashed)
+
+def test_async_hash_runs_off_the_event_loop():
+    # PASSWORD_HASH_WORKERS=0 usa threads; o resultado é o mesmo do pool de processos
+    with patch.object(settings, "PASSWORD_HASH_WORKERS", 0), patch.object(settings, "BCRYPT_ROUNDS", 4):
+        hashed = asyncio.run(security.hash_password_async("segredo"))
+        assert asyncio.run(security.verify_password_async("segredo", hashed))
+
+def test_password_queue_rejects_when_saturated():
+    async def saturate():
+        # Ocupa o único slot e tenta um segundo hash
+        slots = asyncio.Semaphore(1)
+        with patch.object(security, "password_slots", slots), \
+             patch.object(settings, "PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", 0.05):
+            await slots.acquire()
+            with pytest.raises(security.PasswordHashBusy):
+                await security.verify_password_async("segredo", bcrypt.hashpw(b"segredo", bcrypt.gensalt(4)).decode())
+
+    asyncio.run(saturate())
@@ -2,6 +2,9 @@ import pytest
 from httpx import Client
 from unittest.mock import patch
 import uuid
+import json
+from backend.app.database.models import Device, DeviceIngestKey
+from backend.app.services import ingest_auth, cache_service
 
 # Mock de dados de telemetria. O UUID deve ser válido no formato
 VALID_TELEMETRY_DATA = {
@@ -14,11 +17,23 @@ VALID_TELEMETRY_DATA = {
     "device_uuid": str(uuid.uuid4())
 }
 
+@pytest.fixture
+def device_headers(sync_db):
+    # Cadastra o dispositivo do payload com uma chave de ingestão e retorna o header
+    ingest_auth.key_cache.clear()
+    cache_service.local_cache.clear()
+    device_uuid = uuid.UUID(VALID_TELEMETRY_DATA["device_uuid"])
+    token, key_hash = ingest_auth.generate_ingest_token(device_uuid)
+    sync_db.add(Device(uuid=device_uuid, name="Sensor", location="Lab", sn="111122223333", description="Ingestão", user_id=uuid.uuid4()))
+    sync_db.add(DeviceIngestKey(device_uuid=device_uuid, key_hash=key_hash))
+    sync_db.commit()
+    return {"X-Device-Token": token}
+
 @patch('backend.app.api.endpoints.telemetry.publish_telemetry_message')
-def test_receive_telemetry_success(mock_publish, client: Client):
+def test_receive_telemetry_success(mock_publish, client: Client, device_headers: dict):
     # Testa se o endpoint recebe dados e chama o publicador de mensagens corretamente
     
-    response = client.post("/telemetry", json=VALID_TELEMETRY_DATA)
+    response = client.post("/telemetry", json=VALID_TELEMETRY_DATA, headers=device_headers)
     
     # Verifica o status HTTP da API
     assert response.status_code == 200
@@ -30,13 +45,13 @@ def test_receive_telemetry_success(mock_publish, client: Client):
     mock_publish.assert_called_once_with(VALID_TELEMETRY_DATA)
 
 @patch('backend.app.api.endpoints.telemetry.publish_telemetry_message')
-def test_receive_telemetry_error_handling(mock_publish, client: Client):
+def test_receive_telemetry_error_handling(mock_publish, client: Client, device_headers: dict):
     # Testa se o endpoint lida corretamente com exceções no serviço de mensageria.
 
     # Configura o mock para levantar uma exceção simulando uma falha de conexão/publicação
     mock_publish.side_effect = Exception("Falha de conexão com RabbitMQ simulada")
     
-    response = client.post("/telemetry", json=VALID_TELEMETRY_DATA)
+    response = client.post("/telemetry", json=VALID_TELEMETRY_DATA, headers=device_headers)
     
     # Verifica o status HTTP
     assert response.status_code == 200
@@ -47,3 +62,72 @@ def test_receive_telemetry_error_handling(mock_publish, client: Client):
     
     # Confirma que o publicador foi chamado, mesmo que tenha falhado
     mock_publish.assert_called_once()
+
+@patch('backend.app.api.endpoints.telemetry.publish_telemetry_batch')
+def test_receive_telemetry_batch_json(mock_publish_batch, client: Client, device_headers: dict):
+    # Testa o envio em lote (JSON array) com um item inválido no meio
+    invalid_item = {**VALID_TELEMETRY_DATA, "device_uuid": "nao-e-um-uuid"}
+    batch = [VALID_TELEMETRY_DATA, invalid_item, VALID_TELEMETRY_DATA]
+
+    response = client.post("/telemetry/batch", json=batch, headers=device_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "partial"
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert [r["status"] for r in body["results"]] == ["queued", "invalid", "queued"]
+
+    # O lote inteiro é publicado de uma vez só
+    mock_publish_batch.assert_called_once()
+    published = mock_publish_batch.call_args[0][0]
+    assert len(published) == 2
+    assert published[0]["device_uuid"] == VALID_TELEMETRY_DATA["device_uuid"]
+
+@patch('backend.app.api.endpoints.telemetry.publish_telemetry_batch')
+def test_receive_telemetry_batch_ndjson(mock_publish_batch, client: Client, device_headers: dict):
+    # Testa o envio em lote no formato NDJSON (um objeto por linha)
+    body = "\n".join(json.dumps(VALID_TELEMETRY_DATA) for _ in range(3))
+
+    response = client.post("/telemetry/batch", content=body, headers={**device_headers, "Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+    assert response.json()["accepted"] == 3
+    assert len(mock_publish_batch.call_args[0][0]) == 3
+
+def test_receive_telemetry_batch_rejects_invalid_utf8(client: Client):
+    # Bytes fora do UTF-8 são erro do cliente, não do servidor
+    for content_type in ("application/x-ndjson", "application/json"):
+        response = client.post("/telemetry/batch", content=b'{"cpu_usage": "\xff"}', headers={"Content-Type": content_type})
+        assert response.status_code == 400
+
+def test_receive_telemetry_batch_rejects_non_array(client: Client):
+    # Um objeto único não é um lote válido
+    response = client.post("/telemetry/batch", json=VALID_TELEMETRY_DATA)
+    assert response.status_code == 400
+
+@patch('backend.app.api.endpoints.telemetry.publish_telemetry_message')
+def test_receive_telemetry_rejects_missing_or_foreign_token(mock_publish, client: Client, device_headers: dict):
+    # Sem token, ou com o token de outro dispositivo, a telemetria é recusada
+    assert client.post("/telemetry", json=VALID_TELEMETRY_DATA).status_code == 401
+
+    other_device = {**VALID_TELEMETRY_DATA, "device_uuid": str(uuid.uuid4())}
+    assert client.post("/telemetry", json=other_device, headers=device_headers).status_code == 401
+    mock_publish.assert_not_called()
+
+@patch('backend.app.api.endpoints.telemetry.publish_telemetry_batch')
+def test_receive_telemetry_batch_checks_token_per_item(mock_publish_batch, client: Client, device_headers: dict):
+    # Itens podem trazer o próprio device_token; itens sem credencial válida são rejeitados
+    batch = [
+        {**VALID_TELEMETRY_DATA, "device_token": device_headers["X-Device-Token"]},
+        {**VALID_TELEMETRY_DATA, "device_token": "token-invalido"},
+        VALID_TELEMETRY_DATA,
+    ]
+
+    response = client.post("/telemetry/batch", json=batch)
+
+    assert response.json()["status"] == "partial"
+    assert [r["status"] for r in response.json()["results"]] == ["queued", "unauthorized", "unauthorized"]
+    published = mock_publish_batch.call_args[0][0]
+    assert len(published) == 1 and "device_token" not in published[0]
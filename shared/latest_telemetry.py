@@ -0,0 +1,31 @@
+# Convenções do hash de última telemetria, comuns ao backend (leitura e carga do banco)
+# e ao worker (gravação de cada lote): chave, campo de hash completo e script de mescla.
+
+# Hash por usuário com a última telemetria de cada dispositivo (campo = device_uuid, valor = JSON da leitura)
+NAMESPACE = "latest_telemetry_hash"
+# Marca que o hash foi carregado inteiro do banco (o worker só conhece os dispositivos que reportaram)
+COMPLETE_FIELD = "_complete"
+
+# ARGV[1] = "1" marca o hash como completo e devolve o conteúdo; em seguida trios
+# (device_uuid, boot_date, json). Leituras mais antigas que a gravada são ignoradas.
+MERGE_SCRIPT = f"""
+local function stamp(value)
+    if type(value) ~= 'string' then return '' end
+    if #value == 19 then return value .. '.000000' end
+    return value
+end
+for i = 2, #ARGV, 3 do
+    local current = redis.call('hget', KEYS[1], ARGV[i])
+    if not current or stamp(cjson.decode(current)['boot_date']) <= stamp(ARGV[i + 1]) then
+        redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 2])
+    end
+end
+if ARGV[1] == '1' then
+    redis.call('hset', KEYS[1], '{COMPLETE_FIELD}', '1')
+    return redis.call('hgetall', KEYS[1])
+end
+return 0
+"""
+
+def latest_key(user_id) -> str:
+    return f"{NAMESPACE}:{user_id}"
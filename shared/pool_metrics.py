@@ -0,0 +1,58 @@
+import threading
+import time
+from sqlalchemy import exc
+
+# Medição da espera por conexões do pool, usada pelas engines do backend e do worker
+
+class PoolMetrics:
+    # Tempo de espera por conexões do pool (acumulado desde o início do processo)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        # NullPool (modo PgBouncer) não tem contadores de ocupação
+        stats = {
+            "pool": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+            "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+        }
+        with self._lock:
+            stats.update({
+                "checkouts": self.checkouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "timeouts": self.timeouts,
+            })
+        return stats
+
+def measured_pool(base_class, metrics: PoolMetrics):
+    # Subclasse do pool que mede a espera em cada checkout
+    class MeasuredPool(base_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+    MeasuredPool.__name__ = f"Measured{base_class.__name__}"
+    # O logger do pool vem do módulo da classe: mantém o do SQLAlchemy (WARN por padrão)
+    MeasuredPool.__module__ = base_class.__module__
+    return MeasuredPool
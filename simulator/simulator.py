@@ -1,23 +1,56 @@
+import logging
 import requests
+import asyncio
+import heapq
+import httpx
 import json
 import time
 import os
 import random
 from datetime import datetime, timedelta
 import uuid
+from shared.logging_config import setup_logging
+
+logger = logging.getLogger("simulator")
 
 # --- CONFIGURAÇÕES DE AMBIENTE ---
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://backend_app:8000")
 LOGIN_URL = f"{BACKEND_URL}/api/v1/login"
 DEVICES_URL = f"{BACKEND_URL}/api/v1/devices"
 TELEMETRY_ENDPOINT = f"{BACKEND_URL}/telemetry"
+TELEMETRY_BATCH_ENDPOINT = f"{BACKEND_URL}/telemetry/batch"
+
+# Quantidade de heartbeats por requisição (1 = um POST por dispositivo)
+SIM_BATCH_SIZE = int(os.environ.get("SIM_BATCH_SIZE", 1))
+
+# Modo "async": gerador de carga concorrente (asyncio + httpx) para dimensionar a ingestão
+SIM_MODE = os.environ.get("SIM_MODE", "sync")
+# Dispositivos virtuais; os que faltarem são cadastrados para o usuário (0 = só os já cadastrados)
+SIM_DEVICE_COUNT = int(os.environ.get("SIM_DEVICE_COUNT", 0))
+SIM_INTERVAL_SECONDS = float(os.environ.get("SIM_INTERVAL_SECONDS", 60))
+# Heartbeats por segundo no total (0 = cada dispositivo uma vez por SIM_INTERVAL_SECONDS)
+SIM_RATE = float(os.environ.get("SIM_RATE", 0))
+# Requisições simultâneas em voo (também o tamanho do pool de conexões keep-alive)
+SIM_CONCURRENCY = int(os.environ.get("SIM_CONCURRENCY", 200))
+# Variação aleatória (±segundos) no horário de cada envio, para não sincronizar os dispositivos
+SIM_JITTER_SECONDS = float(os.environ.get("SIM_JITTER_SECONDS", 5))
+# Duração do teste de carga (0 = sem fim) e intervalo entre relatórios
+SIM_DURATION_SECONDS = float(os.environ.get("SIM_DURATION_SECONDS", 0))
+SIM_REPORT_SECONDS = float(os.environ.get("SIM_REPORT_SECONDS", 10))
+SIM_REQUEST_TIMEOUT = float(os.environ.get("SIM_REQUEST_TIMEOUT", 10))
+# Resposta do backend para número de série repetido e tentativas antes de desistir
+SN_COLLISION_DETAIL = "Serial Number already registered"
+SN_COLLISION_ATTEMPTS = 5
 
 # Credenciais de Teste para o Simulador
 SIM_USERNAME = os.environ.get("SIM_USERNAME", "simulador_user")
 SIM_PASSWORD = os.environ.get("SIM_PASSWORD", "simulador_pass")
 
 # --- Variáveis Globais de Estado ---
+# Cada dispositivo guarda o próprio token de ingestão (longa duração) e o usuário dono
 ALL_SIMULATED_DEVICES = []
+# Token JWT por usuário, usado apenas para listar dispositivos e emitir tokens de ingestão
+USER_TOKENS = {}
 
 # --- CONFIGURAÇÃO DE MÚLTIPLOS USUÁRIOS  ---
 SIMULATOR_USERS = [
@@ -37,26 +70,75 @@ def generate_heartbeat(device_uuid: str):
         "device_uuid": device_uuid,
     }
 
-def send_heartbeat(device_uuid: str, token: str):
-    # Envia os dados de telemetria para a API
+def send_heartbeat(device: dict):
+    # Envia os dados de telemetria para a API com o token de ingestão do dispositivo
+    device_uuid = device['uuid']
     heartbeat_data = generate_heartbeat(device_uuid)
-    headers = {"Authorization": f"Bearer {token}"}
+    headers = {"X-Device-Token": device['ingest_token']}
     
     try:
         response = requests.post(TELEMETRY_ENDPOINT, json=heartbeat_data, headers=headers)
         
         if response.status_code == 200:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] OK: Heartbeat enviado para {device_uuid}")
+            logger.debug("Heartbeat enviado.", extra={"sampled": True, "device_uuid": device_uuid})
         elif response.status_code == 401:
-             print(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO 401: Token expirado. Tentando refazer login.")
-             return False # Sinaliza que o token expirou
+             logger.warning("Token de ingestão recusado.", extra={"device_uuid": device_uuid})
+             return False # Sinaliza que o token do dispositivo precisa ser renovado
         else:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO: Falha no envio para {device_uuid}. Status: {response.status_code}")
+            logger.error("Falha no envio do heartbeat. Status: %s", response.status_code, extra={"device_uuid": device_uuid})
         return True
 
     except requests.exceptions.RequestException as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ERRO: Falha de conexão com o backend: {e}")
-        return False
+        logger.error("Falha de conexão com o backend: %s", e)
+        return True # Falha de rede não invalida o token
+
+def send_heartbeat_batch(devices: list):
+    # Envia os heartbeats de vários dispositivos em uma única requisição.
+    # Cada item leva o token do seu dispositivo, então o lote pode misturar usuários.
+    # Retorna os dispositivos cujo token foi recusado.
+    batch = [{**generate_heartbeat(device['uuid']), "device_token": device['ingest_token']} for device in devices]
+
+    try:
+        response = requests.post(TELEMETRY_BATCH_ENDPOINT, json=batch)
+
+        if response.status_code == 200:
+            result = response.json()
+            logger.debug("Lote enviado.", extra={"sampled": True, "accepted": result.get('accepted'), "rejected": result.get('rejected')})
+            return [devices[r['index']] for r in result.get('results', []) if r.get('status') == 'unauthorized']
+        logger.error("Falha no envio do lote. Status: %s", response.status_code)
+
+    except requests.exceptions.RequestException as e:
+        logger.error("Falha de conexão com o backend: %s", e)
+    return []
+
+def login_user(sim_user: dict):
+    # Faz login de um usuário e guarda o JWT
+    login_response = requests.post(LOGIN_URL, json={"username": sim_user["username"], "password": sim_user["password"]})
+    login_response.raise_for_status()
+    token = login_response.json().get("access_token")
+    USER_TOKENS[sim_user["username"]] = token
+    return token
+
+def issue_ingest_token(device_uuid: str, username: str):
+    # Emite o token de ingestão do dispositivo. Refaz o login apenas do dono, e só se o JWT expirou.
+    sim_user = next(u for u in SIMULATOR_USERS if u["username"] == username)
+    token = USER_TOKENS.get(username) or login_user(sim_user)
+    for attempt in range(2):
+        response = requests.post(f"{DEVICES_URL}/{device_uuid}/ingest-token", headers={"Authorization": f"Bearer {token}"})
+        if response.status_code == 401 and attempt == 0:
+            token = login_user(sim_user)
+            continue
+        response.raise_for_status()
+        return response.json()["ingest_token"]
+
+def refresh_device_tokens(devices: list):
+    # Renova somente os dispositivos recusados (sem re-login em massa)
+    for device in devices:
+        try:
+            device['ingest_token'] = issue_ingest_token(device['uuid'], device['username'])
+            logger.info("Token de ingestão renovado.", extra={"device_uuid": device['uuid']})
+        except requests.exceptions.RequestException as e:
+            logger.error("Falha ao renovar token: %s", e, extra={"device_uuid": device['uuid']})
 
 def login_and_fetch_devices():
     # Faz login para todos os usuários e coleta seus dispositivos e tokens
@@ -65,10 +147,7 @@ def login_and_fetch_devices():
     
     for sim_user in SIMULATOR_USERS:
         try:
-            login_response = requests.post(LOGIN_URL, json={"username": sim_user["username"], "password": sim_user["password"]})
-            login_response.raise_for_status()
-            
-            token = login_response.json().get("access_token")
+            token = login_user(sim_user)
             
             if not token: continue
                 
@@ -78,35 +157,229 @@ def login_and_fetch_devices():
             devices_response = requests.get(DEVICES_URL, headers=headers)
             devices_response.raise_for_status()
             
-            # Armazena o UUID do dispositivo e o Token do usuário
+            # Armazena o UUID do dispositivo e o seu token de ingestão
             for device in devices_response.json():
                 ALL_SIMULATED_DEVICES.append({
                     "uuid": device['uuid'],
-                    "token": token
+                    "username": sim_user["username"],
+                    "ingest_token": issue_ingest_token(device['uuid'], sim_user["username"])
                 })
             
-            print(f"[INFO] {len(devices_response.json())} dispositivos carregados para {sim_user['username']}.")
+            logger.info("%d dispositivos carregados para %s.", len(devices_response.json()), sim_user['username'])
             
         except requests.exceptions.RequestException as e:
-            print(f"[ERRO] Falha ao processar usuário {sim_user['username']}: {e}")
+            logger.error("Falha ao processar usuário %s: %s", sim_user['username'], e)
             
     return len(ALL_SIMULATED_DEVICES) > 0
 
 
+# --- GERADOR DE CARGA (asyncio + httpx) ---
+class LoadStats:
+    # Contadores do intervalo de relatório atual
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.sent = 0
+        self.ok = 0
+        self.errors = {}
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.lag_max = 0.0
+
+    def record(self, status, latency: float, heartbeats: int = 1):
+        self.requests += 1
+        self.sent += heartbeats
+        if status == 200:
+            self.ok += heartbeats
+        else:
+            self.errors[status] = self.errors.get(status, 0) + heartbeats
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def report(self, requests_in_flight: int):
+        elapsed = time.monotonic() - self.started
+        logger.info(
+            "%.0f heartbeats/s | ok: %d | erros: %s | latência média: %.1fms máx: %.1fms | atraso máx: %.2fs | em voo: %d",
+            self.sent / elapsed, self.ok, self.errors or 0, self.latency_total / max(self.requests, 1) * 1000,
+            self.latency_max * 1000, self.lag_max, requests_in_flight,
+        )
+        self.reset()
+
+async def async_login(client: httpx.AsyncClient, sim_user: dict) -> str:
+    response = await client.post("/api/v1/login", json={"username": sim_user["username"], "password": sim_user["password"]})
+    response.raise_for_status()
+    USER_TOKENS[sim_user["username"]] = response.json()["access_token"]
+    return USER_TOKENS[sim_user["username"]]
+
+async def async_issue_ingest_token(client: httpx.AsyncClient, device: dict) -> str:
+    # Mesmo fluxo da versão síncrona: refaz o login do dono apenas se o JWT expirou
+    sim_user = next(u for u in SIMULATOR_USERS if u["username"] == device["username"])
+    token = USER_TOKENS.get(sim_user["username"]) or await async_login(client, sim_user)
+    for attempt in range(2):
+        response = await client.post(f"/api/v1/devices/{device['uuid']}/ingest-token", headers={"Authorization": f"Bearer {token}"})
+        if response.status_code == 401 and attempt == 0:
+            token = await async_login(client, sim_user)
+            continue
+        response.raise_for_status()
+        return response.json()["ingest_token"]
+
+async def async_create_device(client: httpx.AsyncClient, token: str, number: int) -> str:
+    # Cadastra um dispositivo virtual; tenta outro número de série apenas se houver colisão
+    for attempt in range(SN_COLLISION_ATTEMPTS):
+        response = await client.post("/api/v1/devices", headers={"Authorization": f"Bearer {token}"}, json={
+            "name": f"sim-{number}",
+            "location": "Simulador",
+            "sn": "".join(random.choice("0123456789") for _ in range(12)),
+            "description": "Dispositivo virtual do gerador de carga",
+        })
+        collision = response.status_code == 400 and response.json().get("detail") == SN_COLLISION_DETAIL
+        if not collision or attempt == SN_COLLISION_ATTEMPTS - 1:
+            response.raise_for_status()
+            return response.json()["uuid"]
+
+async def provision_devices(client: httpx.AsyncClient) -> list:
+    # Carrega os dispositivos dos usuários, completa até SIM_DEVICE_COUNT e emite os tokens de ingestão
+    devices = []
+    for sim_user in SIMULATOR_USERS:
+        token = await async_login(client, sim_user)
+        response = await client.get("/api/v1/devices", headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        devices += [{"uuid": d["uuid"], "username": sim_user["username"]} for d in response.json()]
+
+    slots = asyncio.Semaphore(SIM_CONCURRENCY)
+
+    async def bounded(coroutine):
+        async with slots:
+            return await coroutine
+
+    missing = max(SIM_DEVICE_COUNT - len(devices), 0)
+    if missing:
+        logger.info("Cadastrando %d dispositivos virtuais...", missing)
+        owner = SIMULATOR_USERS[0]["username"]
+        created = await asyncio.gather(*(
+            bounded(async_create_device(client, USER_TOKENS[owner], len(devices) + i)) for i in range(missing)
+        ))
+        devices += [{"uuid": device_uuid, "username": owner} for device_uuid in created]
+    if SIM_DEVICE_COUNT:
+        devices = devices[:SIM_DEVICE_COUNT]
+
+    tokens = await asyncio.gather(*(bounded(async_issue_ingest_token(client, device)) for device in devices))
+    for device, ingest_token in zip(devices, tokens):
+        device["ingest_token"] = ingest_token
+    logger.info("%d dispositivos virtuais prontos.", len(devices))
+    return devices
+
+async def async_send(client: httpx.AsyncClient, devices: list, stats: LoadStats):
+    # Um heartbeat (ou um lote, se SIM_BATCH_SIZE > 1); tokens recusados são renovados só para o dispositivo
+    start = time.perf_counter()
+    try:
+        if len(devices) == 1:
+            response = await client.post("/telemetry", json=generate_heartbeat(devices[0]["uuid"]),
+                                         headers={"X-Device-Token": devices[0]["ingest_token"]})
+            refused = devices if response.status_code == 401 else []
+        else:
+            response = await client.post("/telemetry/batch", json=[
+                {**generate_heartbeat(device["uuid"]), "device_token": device["ingest_token"]} for device in devices
+            ])
+            results = response.json().get("results", []) if response.status_code == 200 else []
+            refused = [devices[r["index"]] for r in results if r.get("status") == "unauthorized"]
+        stats.record(response.status_code, time.perf_counter() - start, len(devices))
+    except httpx.HTTPError as e:
+        stats.record(type(e).__name__, time.perf_counter() - start, len(devices))
+        return
+
+    for device in refused:
+        try:
+            device["ingest_token"] = await async_issue_ingest_token(client, device)
+        except httpx.HTTPError as e:
+            logger.error("Falha ao renovar token: %s", e, extra={"device_uuid": device['uuid']})
+
+async def run_load_generator():
+    limits = httpx.Limits(max_connections=SIM_CONCURRENCY, max_keepalive_connections=SIM_CONCURRENCY)
+    async with httpx.AsyncClient(base_url=BACKEND_URL, limits=limits, timeout=SIM_REQUEST_TIMEOUT) as client:
+        devices = await provision_devices(client)
+        if not devices:
+            logger.critical("Nenhum dispositivo disponível para o gerador de carga.")
+            return
+
+        # Intervalo de cada dispositivo; com SIM_RATE ele é derivado da vazão total desejada
+        interval = len(devices) / SIM_RATE if SIM_RATE > 0 else SIM_INTERVAL_SECONDS
+        # O jitter nunca passa de meio intervalo (senão o próximo envio cairia no passado)
+        jitter = min(SIM_JITTER_SECONDS, interval / 2)
+        logger.info("Carga: %d dispositivos, %.0f heartbeats/s, concorrência %d, jitter ±%.2fs, lote %d.",
+                    len(devices), len(devices) / interval, SIM_CONCURRENCY, jitter, SIM_BATCH_SIZE)
+
+        # Agenda (próximo envio, índice) com os dispositivos espalhados ao longo do primeiro intervalo
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        schedule = [(start + random.uniform(0, interval), i) for i in range(len(devices))]
+        heapq.heapify(schedule)
+
+        stats = LoadStats()
+        slots = asyncio.Semaphore(SIM_CONCURRENCY)
+        in_flight = set()
+        next_report = start + SIM_REPORT_SECONDS
+
+        def release(task):
+            in_flight.discard(task)
+            slots.release()
+
+        while not SIM_DURATION_SECONDS or loop.time() - start < SIM_DURATION_SECONDS:
+            due, index = schedule[0]
+            now = loop.time()
+            if now >= next_report:
+                stats.report(len(in_flight))
+                next_report = now + SIM_REPORT_SECONDS
+            if due > now:
+                await asyncio.sleep(min(due - now, next_report - now))
+                continue
+
+            # Junta os dispositivos já vencidos em um lote de até SIM_BATCH_SIZE
+            batch = []
+            while schedule and schedule[0][0] <= now and len(batch) < SIM_BATCH_SIZE:
+                due, index = heapq.heappop(schedule)
+                batch.append(devices[index])
+                stats.lag_max = max(stats.lag_max, now - due)
+                heapq.heappush(schedule, (due + interval + random.uniform(-jitter, jitter), index))
+
+            # Com a concorrência esgotada o agendador espera, e o atraso aparece no relatório
+            await slots.acquire()
+            task = asyncio.create_task(async_send(client, batch, stats))
+            in_flight.add(task)
+            task.add_done_callback(release)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        stats.report(0)
+
+
 if __name__ == "__main__":
+    setup_logging("simulator")
+    if SIM_MODE == "async":
+        asyncio.run(run_load_generator())
+        exit(0)
+
     if not login_and_fetch_devices():
-        print("[CRÍTICO] Nenhuma sessão ativa ou dispositivo encontrado. O Simulador não pode iniciar. Verifique as credenciais.")
+        logger.critical("Nenhuma sessão ativa ou dispositivo encontrado. O Simulador não pode iniciar. Verifique as credenciais.")
         exit(1)
 
-    print(f"[INÍCIO] Simulação rodando para {len(ALL_SIMULATED_DEVICES)} dispositivos. Intervalo: 60s.")
+    logger.info("Simulação rodando para %d dispositivos. Intervalo: 60s.", len(ALL_SIMULATED_DEVICES))
     while True:
         start_time = time.time()
         
-        # Envia um heartbeat único para CADA dispositivo
-        for device_data in ALL_SIMULATED_DEVICES:
-            # Se o envio falhar tenta refazer o login
-            if not send_heartbeat(device_data['uuid'], device_data['token']):
-                login_and_fetch_devices() # Tenta refazer login e atualizar todos os tokens
+        if SIM_BATCH_SIZE > 1:
+            # Agrupa os dispositivos em lotes de até SIM_BATCH_SIZE heartbeats
+            for i in range(0, len(ALL_SIMULATED_DEVICES), SIM_BATCH_SIZE):
+                refresh_device_tokens(send_heartbeat_batch(ALL_SIMULATED_DEVICES[i:i + SIM_BATCH_SIZE]))
+        else:
+            # Envia um heartbeat único para CADA dispositivo
+            for device_data in ALL_SIMULATED_DEVICES:
+                # Token recusado: renova apenas o deste dispositivo
+                if not send_heartbeat(device_data):
+                    refresh_device_tokens([device_data])
                 
         elapsed_time = time.time() - start_time
         sleep_duration = 60 - elapsed_time
@@ -1,7 +1,9 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, NullPool
 from typing import Generator
 import os
+from shared.pool_metrics import PoolMetrics, measured_pool
 
 # Define o URL do banco de dados a partir das variáveis de ambiente
 DB_HOST = os.environ.get("DB_HOST", "db")
@@ -11,8 +13,35 @@ DB_NAME = os.environ.get("DB_NAME", "iotdb")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
 
+# Configurações do pool de conexões
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+# Conexão via PgBouncer (modo transação): o pooling fica a cargo dele
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "false").lower() == "true"
+
+# Espera acumulada por conexões do pool
+pool_metrics = PoolMetrics()
+
+def pool_stats() -> dict:
+    # Ocupação atual do pool e espera acumulada
+    return pool_metrics.snapshot(engine.pool)
+
 # Cria a engine do SQLAlchemy
-engine = create_engine(DATABASE_URL)
+if DB_PGBOUNCER:
+    engine = create_engine(DATABASE_URL, poolclass=NullPool)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=measured_pool(QueuePool, pool_metrics),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
 Base = declarative_base()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
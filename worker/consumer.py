@@ -1,86 +1,379 @@
+import logging
 import json
 import pika
+from sqlalchemy import insert, or_, func, select, exc
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from base import SessionLocal
-from models import Telemetry
+from base import SessionLocal, pool_stats
+from models import Device, Telemetry, DeviceLatestTelemetry, ROLLUP_METRICS, TelemetryRollupHourly, TelemetryRollupDaily
+from latest_cache import write_latest_telemetry
+import metrics
+from shared.logging_config import setup_logging
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
 import time
 
+logger = logging.getLogger("consumer")
+
 # Configurações do RabbitMQ
 RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
 RABBITMQ_QUEUE = os.environ.get('RABBITMQ_QUEUE', 'telemetry_queue')
+RABBITMQ_EXCHANGE = os.environ.get('RABBITMQ_EXCHANGE', 'telemetry_exchange')
+# Mensagens que nunca serão gravadas (payload inválido, dispositivo inexistente)
+RABBITMQ_DEAD_LETTER_QUEUE = os.environ.get('RABBITMQ_DEAD_LETTER_QUEUE', 'telemetry_dead_letter')
 
-def save_telemetry_to_db(data: dict):
-    # Salva dados de telemetria no PostgreSQL
-    db: Session = SessionLocal()
-    try:
-        print(f"[INFO] Recebido para salvar no DB: {data}")
-        boot_date_str = data.get('boot_date')
-        boot_date = None
-        if boot_date_str:
-            try:
-                # Adiciona o tratamento para o formato com Z no final
-                boot_date = datetime.fromisoformat(boot_date_str.replace('Z', '+00:00'))
-            except ValueError:
-                # Tenta formatar sem substituição caso o formato seja apenas ISO
-                try:
-                    boot_date = datetime.fromisoformat(boot_date_str)
-                except Exception as date_e:
-                    print(f"[ERRO CONVERSÃO] Falha ao converter boot_date '{boot_date_str}': {date_e}")
-
-        device_uuid_str = data.get('device_uuid')
-        device_uuid = None
-        if device_uuid_str:
+# Configurações de gravação em lote
+BATCH_SIZE = int(os.environ.get('WORKER_BATCH_SIZE', 500))
+FLUSH_INTERVAL_MS = int(os.environ.get('WORKER_FLUSH_INTERVAL_MS', 200))
+# Intervalo entre registros das métricas do pool de conexões (0 desativa)
+POOL_STATS_LOG_SECONDS = float(os.environ.get('WORKER_POOL_STATS_LOG_SECONDS', 60))
+# Intervalo entre amostras do tamanho da fila exposto em /metrics (0 desativa)
+QUEUE_DEPTH_SAMPLE_SECONDS = float(os.environ.get('WORKER_QUEUE_DEPTH_SAMPLE_SECONDS', 15))
+# Espera antes de devolver à fila um lote que falhou por erro transitório (dobra a cada falha seguida).
+# O máximo fica abaixo do heartbeat de 60s da conexão.
+RETRY_BACKOFF_SECONDS = float(os.environ.get('WORKER_RETRY_BACKOFF_SECONDS', 1))
+RETRY_BACKOFF_MAX_SECONDS = float(os.environ.get('WORKER_RETRY_BACKOFF_MAX_SECONDS', 30))
+
+# Erros do próprio dado: a linha nunca será gravada. Os demais (banco fora do ar, tabelas ainda
+# não criadas pelo backend) são transitórios e o lote volta para a fila.
+DATA_ERRORS = (exc.IntegrityError, exc.DataError)
+
+# Mensagens recebidas e ainda não gravadas: (delivery_tag, mensagem, corpo original)
+pending_messages = []
+retry_delay = 0.0
+flush_timer = None
+last_pool_log = time.monotonic()
+last_queue_sample = 0.0
+# Dono de cada dispositivo (não muda), para localizar o hash de última telemetria do usuário
+device_owners = {}
+
+def parse_telemetry(data: dict) -> dict:
+    # Converte a mensagem em uma linha da tabela de telemetria
+    boot_date_str = data.get('boot_date')
+    boot_date = None
+    if boot_date_str:
+        try:
+            # Adiciona o tratamento para o formato com Z no final
+            boot_date = datetime.fromisoformat(boot_date_str.replace('Z', '+00:00'))
+        except ValueError:
+            # Tenta formatar sem substituição caso o formato seja apenas ISO
             try:
-                device_uuid = uuid.UUID(device_uuid_str)
-            except Exception as uuid_e:
-                print(f"[ERRO CONVERSÃO] Falha ao converter device_uuid '{device_uuid_str}': {uuid_e}")
-            
-        if not device_uuid:
-            raise ValueError(f"UUID do dispositivo inválido ou ausente: {device_uuid_str}")
-
-
-        telemetry = Telemetry(
-            cpu_usage=data.get('cpu_usage'),
-            ram_usage=data.get('ram_usage'),
-            disk_free=data.get('disk_free'),
-            temperature=data.get('temperature'),
-            latency=data.get('latency'),
-            connectivity=data.get('connectivity'),
-            boot_date=boot_date,
-            device_uuid=device_uuid
+                boot_date = datetime.fromisoformat(boot_date_str)
+            except Exception as date_e:
+                logger.warning("Falha ao converter boot_date '%s': %s", boot_date_str, date_e)
+    if boot_date is None:
+        # boot_date é a chave de partição da telemetria e não pode ser nulo
+        boot_date = datetime.utcnow()
+
+    device_uuid_str = data.get('device_uuid')
+    device_uuid = None
+    if device_uuid_str:
+        try:
+            device_uuid = uuid.UUID(device_uuid_str)
+        except Exception as uuid_e:
+            logger.warning("Falha ao converter device_uuid '%s': %s", device_uuid_str, uuid_e)
+
+    if not device_uuid:
+        raise ValueError(f"UUID do dispositivo inválido ou ausente: {device_uuid_str}")
+
+    return {
+        "cpu_usage": data.get('cpu_usage'),
+        "ram_usage": data.get('ram_usage'),
+        "disk_free": data.get('disk_free'),
+        "temperature": data.get('temperature'),
+        "latency": data.get('latency'),
+        "connectivity": data.get('connectivity'),
+        "boot_date": boot_date,
+        "device_uuid": device_uuid,
+    }
+
+LATEST_COLUMNS = ("cpu_usage", "ram_usage", "disk_free", "temperature", "latency", "connectivity", "boot_date")
+
+# INSERT ... ON CONFLICT do dialeto da sessão (PostgreSQL em produção, SQLite no benchmark local)
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def upsert_statement(db: Session, model):
+    return UPSERT_INSERTS[db.get_bind().dialect.name](model)
+
+def least(db: Session, a, b):
+    # LEAST/GREATEST do PostgreSQL ignoram NULL; min/max de vários argumentos no SQLite não
+    if db.get_bind().dialect.name == "sqlite":
+        return func.min(func.coalesce(a, b), func.coalesce(b, a))
+    return func.least(a, b)
+
+def greatest(db: Session, a, b):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.max(func.coalesce(a, b), func.coalesce(b, a))
+    return func.greatest(a, b)
+
+def insert_telemetry_rows(db: Session, rows: list) -> list:
+    # INSERT multi-linha retornando os ids na ordem das linhas enviadas
+    result = db.execute(
+        insert(Telemetry).returning(Telemetry.id, sort_by_parameter_order=True),
+        rows
+    )
+    return [row_id for (row_id,) in result]
+
+def boot_date_key(row: dict) -> datetime:
+    # Compara datas com e sem fuso (o banco grava sem fuso) e trata ausência como a mais antiga
+    boot_date = row["boot_date"]
+    return boot_date.replace(tzinfo=None) if boot_date else datetime.min
+
+def upsert_latest_telemetry(db: Session, rows: list, ids: list) -> list:
+    # Mantém uma linha por dispositivo com a telemetria de boot_date mais recente do lote.
+    # Retorna apenas as linhas efetivamente gravadas (as que venceram a comparação de boot_date).
+    newest = {}
+    for row, row_id in zip(rows, ids):
+        current = newest.get(row["device_uuid"])
+        if current is None or boot_date_key(row) >= boot_date_key(current):
+            newest[row["device_uuid"]] = {**row, "telemetry_id": row_id, "updated_at": datetime.utcnow()}
+    if not newest:
+        return []
+
+    # Ordem fixa por dispositivo evita deadlocks entre réplicas do worker
+    values = [newest[device_uuid] for device_uuid in sorted(newest)]
+    statement = upsert_statement(db, DeviceLatestTelemetry).values(values)
+    excluded = statement.excluded
+    result = db.execute(statement.on_conflict_do_update(
+        index_elements=[DeviceLatestTelemetry.device_uuid],
+        set_={column: excluded[column] for column in LATEST_COLUMNS + ("telemetry_id", "updated_at")},
+        # Mensagens fora de ordem não sobrescrevem uma leitura mais nova
+        where=or_(
+            DeviceLatestTelemetry.boot_date.is_(None),
+            excluded.boot_date >= DeviceLatestTelemetry.boot_date
         )
+    ).returning(DeviceLatestTelemetry.device_uuid, DeviceLatestTelemetry.telemetry_id, *(
+        DeviceLatestTelemetry.__table__.c[column] for column in LATEST_COLUMNS
+    )))
+    return [dict(row._mapping) for row in result]
+
+def attach_owners(db: Session, latest_rows: list) -> list:
+    # (user_id, linha) para cada última telemetria; só consulta os dispositivos ainda desconhecidos
+    missing = {row["device_uuid"] for row in latest_rows} - device_owners.keys()
+    if missing:
+        device_owners.update(db.execute(select(Device.uuid, Device.user_id).where(Device.uuid.in_(missing))).all())
+    return [(device_owners[row["device_uuid"]], row) for row in latest_rows if device_owners.get(row["device_uuid"])]
+
+def rollup_bucket(boot_date: datetime, model) -> datetime:
+    # Início do balde (hora ou dia) em UTC sem fuso, como a coluna é gravada
+    if boot_date.tzinfo is not None:
+        boot_date = boot_date.astimezone(timezone.utc)
+    boot_date = boot_date.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    if model is TelemetryRollupDaily:
+        boot_date = boot_date.replace(hour=0)
+    return boot_date
+
+def upsert_rollups(db: Session, rows: list):
+    # Soma o lote aos agregados horários e diários (incremental, sem reler a telemetria bruta)
+    for model in (TelemetryRollupHourly, TelemetryRollupDaily):
+        buckets = {}
+        for row in rows:
+            if row["boot_date"] is None:
+                continue
+            key = (row["device_uuid"], rollup_bucket(row["boot_date"], model))
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = {"device_uuid": key[0], "bucket_start": key[1]}
+                for metric in ROLLUP_METRICS:
+                    bucket.update({f"{metric}_sum": None, f"{metric}_min": None, f"{metric}_max": None, f"{metric}_count": 0})
+                buckets[key] = bucket
+            for metric in ROLLUP_METRICS:
+                value = row[metric]
+                if value is None:
+                    continue
+                bucket[f"{metric}_sum"] = (bucket[f"{metric}_sum"] or 0) + value
+                bucket[f"{metric}_min"] = value if bucket[f"{metric}_min"] is None else min(bucket[f"{metric}_min"], value)
+                bucket[f"{metric}_max"] = value if bucket[f"{metric}_max"] is None else max(bucket[f"{metric}_max"], value)
+                bucket[f"{metric}_count"] += 1
+        if not buckets:
+            continue
+
+        # Ordem fixa evita deadlocks entre réplicas do worker
+        statement = upsert_statement(db, model).values([buckets[key] for key in sorted(buckets)])
+        current, excluded = model.__table__.c, statement.excluded
+        update = {}
+        for metric in ROLLUP_METRICS:
+            update[f"{metric}_sum"] = func.coalesce(current[f"{metric}_sum"], 0) + func.coalesce(excluded[f"{metric}_sum"], 0)
+            update[f"{metric}_min"] = least(db, current[f"{metric}_min"], excluded[f"{metric}_min"])
+            update[f"{metric}_max"] = greatest(db, current[f"{metric}_max"], excluded[f"{metric}_max"])
+            update[f"{metric}_count"] = func.coalesce(current[f"{metric}_count"], 0) + excluded[f"{metric}_count"]
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[model.device_uuid, model.bucket_start],
+            set_=update
+        ))
 
-        db.add(telemetry)
+def persist_rows(db: Session, rows: list) -> list:
+    # Telemetria bruta, última leitura por dispositivo e rollups na mesma transação.
+    # Retorna as últimas leituras gravadas, para atualizar o Redis após o commit.
+    ids = insert_telemetry_rows(db, rows)
+    latest_rows = upsert_latest_telemetry(db, rows, ids)
+    upsert_rollups(db, rows)
+    return attach_owners(db, latest_rows)
+
+class BatchInterrupted(Exception):
+    # Falha transitória no meio do lote: índices já resolvidos (gravados ou rejeitados) e os rejeitados
+    def __init__(self, cause: Exception, done: set, rejected: list):
+        super().__init__(str(cause))
+        self.done = done
+        self.rejected = rejected
+
+def save_telemetry_batch(messages: list) -> list:
+    # Salva um lote de telemetrias com um único INSERT multi-linha e um único commit.
+    # Retorna os índices das mensagens rejeitadas (nunca serão gravadas); falhas transitórias
+    # levantam BatchInterrupted.
+    rows, rejected = [], []
+    for i, data in enumerate(messages):
+        try:
+            rows.append((i, parse_telemetry(data)))
+        except Exception as e:
+            logger.warning("Mensagem descartada: %s", e)
+            rejected.append(i)
+
+    if not rows:
+        return rejected
+
+    db: Session = SessionLocal()
+    try:
+        latest = persist_rows(db, [row for _, row in rows])
         db.commit()
-        db.refresh(telemetry)
-        print(f"[INFO] Telemetria salva no DB: id={telemetry.id}, device={telemetry.device_uuid}")
-        
+        # Write-through: o dashboard lê a última telemetria direto do Redis
+        write_latest_telemetry(latest)
+        return rejected
+    except DATA_ERRORS as e:
+        db.rollback()
+        logger.error("Falha ao salvar lote de %d telemetrias: %s. Gravando individualmente...", len(rows), e)
     except Exception as e:
         db.rollback()
-        print(f"[ERRO FATAL SALVAMENTO] Falha ao salvar telemetria para {device_uuid_str}: {e}")
+        raise BatchInterrupted(e, set(rejected), rejected) from e
     finally:
         db.close()
 
+    # Uma linha inválida (ex.: dispositivo inexistente) não deve derrubar o lote inteiro
+    done = set(rejected)
+    for i, row in rows:
+        db = SessionLocal()
+        try:
+            latest = persist_rows(db, [row])
+            db.commit()
+            write_latest_telemetry(latest)
+        except DATA_ERRORS as e:
+            db.rollback()
+            logger.error("Falha ao salvar telemetria: %s", e, extra={"device_uuid": str(row['device_uuid'])})
+            rejected.append(i)
+        except Exception as e:
+            db.rollback()
+            raise BatchInterrupted(e, done, rejected) from e
+        finally:
+            db.close()
+        done.add(i)
+    return rejected
+
+def flush_pending(ch):
+    # Grava o lote acumulado; as mensagens só são confirmadas depois de gravadas (ou rejeitadas)
+    global pending_messages, flush_timer, retry_delay
+    if flush_timer is not None:
+        ch.connection.remove_timeout(flush_timer)
+        flush_timer = None
+    if not pending_messages:
+        return
+
+    batch, pending_messages = pending_messages, []
+    metrics.batch_size.observe(len(batch))
+    start = time.perf_counter()
+    try:
+        rejected = save_telemetry_batch([message for _, message, _ in batch])
+    except BatchInterrupted as e:
+        logger.error("Falha transitória ao gravar lote: %s. Devolvendo %d mensagens à fila.", e, len(batch) - len(e.done))
+        dead_letter(ch, [batch[i] for i in e.rejected])
+        retry_later(ch, batch, e.done)
+        metrics.messages.labels("saved").inc(len(e.done) - len(e.rejected))
+        metrics.messages.labels("rejected").inc(len(e.rejected))
+        metrics.messages.labels("requeued").inc(len(batch) - len(e.done))
+        return
+    except Exception as e:
+        logger.exception("Falha ao gravar lote: %s", e)
+        retry_later(ch, batch, set())
+        metrics.messages.labels("requeued").inc(len(batch))
+        return
+    finally:
+        metrics.flush_seconds.observe(time.perf_counter() - start)
+
+    # Sucesso: só agora o lote é confirmado; rejeitadas vão antes para a fila de mensagens mortas
+    retry_delay = 0.0
+    dead_letter(ch, [batch[i] for i in rejected])
+    ch.basic_ack(delivery_tag=batch[-1][0], multiple=True)
+    logger.debug("Lote gravado no banco.", extra={"saved": len(batch) - len(rejected), "messages": len(batch)})
+    metrics.messages.labels("saved").inc(len(batch) - len(rejected))
+    metrics.messages.labels("rejected").inc(len(rejected))
+    log_pool_stats()
+    sample_queue_depth(ch)
+
+def dead_letter(ch, entries: list):
+    # Publica o corpo original das mensagens rejeitadas; a confirmação delas vem com o lote
+    for _, _, body in entries:
+        ch.basic_publish(exchange='', routing_key=RABBITMQ_DEAD_LETTER_QUEUE, body=body,
+                         properties=pika.BasicProperties(delivery_mode=2))
+
+def retry_later(ch, batch: list, done: set):
+    # Aguarda (backoff exponencial) e devolve à fila o que não foi resolvido; o resto é confirmado
+    global retry_delay
+    retry_delay = min(retry_delay * 2 if retry_delay else RETRY_BACKOFF_SECONDS, RETRY_BACKOFF_MAX_SECONDS)
+    time.sleep(retry_delay)
+    if not done:
+        ch.basic_nack(delivery_tag=batch[-1][0], multiple=True, requeue=True)
+        return
+    for i, (delivery_tag, _, _) in enumerate(batch):
+        if i in done:
+            ch.basic_ack(delivery_tag=delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+def log_pool_stats():
+    # Registra periodicamente a ocupação e a espera do pool de conexões
+    global last_pool_log
+    if POOL_STATS_LOG_SECONDS <= 0 or time.monotonic() - last_pool_log < POOL_STATS_LOG_SECONDS:
+        return
+    last_pool_log = time.monotonic()
+    logger.info("Pool de conexões.", extra={"pool": pool_stats()})
+
+def sample_queue_depth(ch):
+    # Mensagens ainda na fila (declaração passiva), no máximo a cada QUEUE_DEPTH_SAMPLE_SECONDS
+    global last_queue_sample
+    if QUEUE_DEPTH_SAMPLE_SECONDS <= 0 or time.monotonic() - last_queue_sample < QUEUE_DEPTH_SAMPLE_SECONDS:
+        return
+    last_queue_sample = time.monotonic()
+    try:
+        declared = ch.queue_declare(queue=RABBITMQ_QUEUE, passive=True)
+        metrics.queue_messages.labels(RABBITMQ_QUEUE).set(declared.method.message_count)
+    except Exception as e:
+        logger.warning("Falha ao consultar o tamanho da fila: %s", e)
+
 def callback(ch, method, properties, body):
     # Função chamada para cada mensagem da fila
+    global flush_timer
+    metrics.observe_lag(properties)
     try:
         message = json.loads(body)
-        print(f"[INFO] Mensagem recebida do RabbitMQ: {message}")
-        save_telemetry_to_db(message)
     except Exception as e:
-        print(f"[ERRO] Falha no callback: {e}")
-    finally:
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        print(f"[INFO] Mensagem confirmada no RabbitMQ (ACK).")
+        logger.warning("Mensagem inválida descartada: %s", e)
+        message = {}
+    logger.debug("Mensagem recebida.", extra={"sampled": True, "device_uuid": message.get("device_uuid")})
+    pending_messages.append((method.delivery_tag, message, body))
+
+    if len(pending_messages) >= BATCH_SIZE:
+        flush_pending(ch)
+    elif flush_timer is None:
+        # Garante que um lote incompleto seja gravado em até FLUSH_INTERVAL_MS
+        flush_timer = ch.connection.call_later(FLUSH_INTERVAL_MS / 1000, lambda: flush_pending(ch))
 
 def start_consumer():
     # Inicia o consumidor com reconexão automática
+    global pending_messages, flush_timer
+    metrics.start_metrics_server()
     while True:
         try:
-            print(f"[INFO] Conectando ao RabbitMQ em {RABBITMQ_HOST}...")
+            logger.info("Conectando ao RabbitMQ em %s...", RABBITMQ_HOST)
             connection = pika.BlockingConnection(
                 pika.ConnectionParameters(
                     host=RABBITMQ_HOST,
@@ -90,24 +383,32 @@ def start_consumer():
             )
 
             channel = connection.channel()
+            # Fila própria do worker ligada ao exchange fanout de telemetria
+            channel.exchange_declare(exchange=RABBITMQ_EXCHANGE, exchange_type='fanout', durable=True)
             channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-            channel.basic_qos(prefetch_count=1)
-            print(f"[INFO] Conectado ao RabbitMQ. Aguardando mensagens na fila '{RABBITMQ_QUEUE}'...")
+            channel.queue_bind(queue=RABBITMQ_QUEUE, exchange=RABBITMQ_EXCHANGE)
+            channel.queue_declare(queue=RABBITMQ_DEAD_LETTER_QUEUE, durable=True)
+            channel.basic_qos(prefetch_count=BATCH_SIZE)
+            logger.info("Conectado ao RabbitMQ. Aguardando mensagens na fila '%s' (lote: %d, intervalo: %dms)...", RABBITMQ_QUEUE, BATCH_SIZE, FLUSH_INTERVAL_MS)
             channel.basic_consume(queue=RABBITMQ_QUEUE, on_message_callback=callback)
             channel.start_consuming()
 
 
         except pika.exceptions.AMQPConnectionError as e:
-            print(f"[ERRO] Conexão ao RabbitMQ falhou: {e}. Tentando reconectar em 5s...")
+            # Mensagens não confirmadas serão reentregues pelo broker
+            pending_messages, flush_timer = [], None
+            logger.error("Conexão ao RabbitMQ falhou: %s. Tentando reconectar em 5s...", e)
             time.sleep(5)
         except KeyboardInterrupt:
-            print("[INFO] Worker encerrado manualmente.")
+            logger.info("Worker encerrado manualmente.")
             try:
                 if connection and connection.is_open:
+                    flush_pending(channel)
                     connection.close()
             except:
                 pass
             break
 
 if __name__ == "__main__":
+    setup_logging("worker")
     start_consumer()
@@ -0,0 +1,46 @@
+import logging
+import json
+import os
+import redis
+from shared.latest_telemetry import MERGE_SCRIPT, latest_key
+
+logger = logging.getLogger(__name__)
+
+# Configurações do Redis (mesmo servidor de cache do backend)
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, socket_timeout=1, socket_connect_timeout=1)
+merge_latest = redis_client.register_script(MERGE_SCRIPT)
+
+def write_latest_telemetry(entries: list):
+    # entries: (user_id, linha da última telemetria). Um EVAL por usuário, todos em um pipeline.
+    by_user = {}
+    for user_id, latest in entries:
+        boot_date = latest["boot_date"].isoformat() if latest["boot_date"] else ""
+        value = json.dumps({
+            "id": latest["telemetry_id"],
+            "cpu_usage": latest["cpu_usage"],
+            "ram_usage": latest["ram_usage"],
+            "temperature": latest["temperature"],
+            "latency": latest["latency"],
+            "connectivity": latest["connectivity"],
+            "boot_date": boot_date or None,
+            "device_uuid": str(latest["device_uuid"]),
+        }, separators=(",", ":"))
+        by_user.setdefault(user_id, []).extend([str(latest["device_uuid"]), boot_date, value])
+    if not by_user:
+        return
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, args in by_user.items():
+            merge_latest(keys=[latest_key(user_id)], args=["0", *args], client=pipe)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Falha ao atualizar a última telemetria no Redis: %s", e)
+        # O dado já está no banco: sem o hash, o backend o recarrega na próxima leitura
+        try:
+            redis_client.delete(*(latest_key(user_id) for user_id in by_user))
+        except Exception:
+            pass
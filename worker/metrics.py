@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+from prometheus_client import CollectorRegistry, Counter, Histogram, Gauge, start_http_server
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy import event
+from base import engine, pool_stats
+
+logger = logging.getLogger(__name__)
+
+# Porta do endpoint /metrics do worker (0 desativa)
+METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9100))
+
+# Mesmos baldes do backend (app/core/metrics.py)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Registro próprio: não colide com as métricas do backend quando ambos rodam no mesmo processo (benchmarks)
+registry = CollectorRegistry()
+
+# Cabeçalho com o instante da publicação, gravado pelo publicador do backend
+PUBLISHED_AT_HEADER = "published_at"
+
+batch_size = Histogram("worker_batch_size", "Mensagens por lote gravado", buckets=BATCH_SIZE_BUCKETS, registry=registry)
+flush_seconds = Histogram("worker_flush_duration_seconds", "Tempo de gravação de um lote", buckets=LATENCY_BUCKETS, registry=registry)
+messages = Counter("worker_messages_total", "Mensagens processadas pelo worker", ["result"], registry=registry)
+consumer_lag_seconds = Histogram(
+    "rabbitmq_consumer_lag_seconds", "Tempo entre a publicação e o recebimento da mensagem",
+    ["consumer"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+queue_messages = Gauge("rabbitmq_queue_messages", "Mensagens prontas na fila (amostrado)", ["queue"], registry=registry)
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Tempo de execução das consultas ao banco",
+    ["engine", "operation"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+
+def observe_lag(properties):
+    published_at = (properties.headers or {}).get(PUBLISHED_AT_HEADER) if properties else None
+    if published_at is not None:
+        consumer_lag_seconds.labels("worker").observe(max(time.time() - float(published_at), 0.0))
+
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if starts:
+        operation = (statement.split(None, 1) or ["OTHER"])[0].upper()
+        db_query_seconds.labels("worker", operation).observe(time.perf_counter() - starts.pop())
+
+class PoolCollector:
+    # Ocupação e espera do pool de conexões (pool_stats) lidas no momento da coleta
+    def collect(self):
+        stats = pool_stats()
+        for field in ("size", "checked_out", "overflow"):
+            gauge = GaugeMetricFamily(f"db_pool_{field}", f"Conexões do pool ({field})", labels=["engine"])
+            gauge.add_metric(["worker"], stats[field])
+            yield gauge
+        for field, name in (("checkouts", "db_pool_checkouts"), ("wait_seconds_total", "db_pool_wait_seconds"), ("timeouts", "db_pool_timeouts")):
+            counter = CounterMetricFamily(name, f"Pool de conexões ({field})", labels=["engine"])
+            counter.add_metric(["worker"], stats[field])
+            yield counter
+
+registry.register(PoolCollector())
+
+def start_metrics_server():
+    if METRICS_PORT > 0:
+        start_http_server(METRICS_PORT, registry=registry)
+        logger.info("Métricas do worker em :%d/metrics", METRICS_PORT)
@@ -1,10 +1,12 @@
 from sqlalchemy import Column, Float, Integer, DateTime, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import declared_attr
 from base import Base
 
 class Device(Base):
     __tablename__ = "devices"
     uuid = Column(UUID(as_uuid=True), primary_key=True)
+    user_id = Column(UUID(as_uuid=True))
 
 class Telemetry(Base):
     __tablename__ = "telemetry"
@@ -17,3 +19,40 @@ class Telemetry(Base):
     connectivity = Column(Integer)
     boot_date = Column(DateTime)
     device_uuid = Column(UUID(as_uuid=True), ForeignKey("devices.uuid"))
+
+class DeviceLatestTelemetry(Base):
+    # Última telemetria por dispositivo, atualizada a cada lote gravado
+    __tablename__ = "device_latest_telemetry"
+    device_uuid = Column(UUID(as_uuid=True), ForeignKey("devices.uuid"), primary_key=True)
+    telemetry_id = Column(Integer, nullable=False)
+    cpu_usage = Column(Float)
+    ram_usage = Column(Float)
+    disk_free = Column(Float)
+    temperature = Column(Float)
+    latency = Column(Float)
+    connectivity = Column(Integer)
+    boot_date = Column(DateTime)
+    updated_at = Column(DateTime)
+
+# Agregados por balde de tempo (mesma estrutura do backend): soma, mínimo, máximo e contagem
+ROLLUP_METRICS = ("cpu_usage", "ram_usage", "disk_free", "temperature", "latency")
+
+class TelemetryRollupMixin:
+    @declared_attr
+    def device_uuid(cls):
+        return Column(UUID(as_uuid=True), ForeignKey("devices.uuid"), primary_key=True)
+
+    bucket_start = Column(DateTime, primary_key=True)
+
+for _metric in ROLLUP_METRICS:
+    setattr(TelemetryRollupMixin, f"{_metric}_sum", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_min", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_max", Column(Float))
+    setattr(TelemetryRollupMixin, f"{_metric}_count", Column(Integer))
+del _metric
+
+class TelemetryRollupHourly(TelemetryRollupMixin, Base):
+    __tablename__ = "telemetry_rollup_hourly"
+
+class TelemetryRollupDaily(TelemetryRollupMixin, Base):
+    __tablename__ = "telemetry_rollup_daily"
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Os módulos do worker são scripts soltos (from base import ...), como no container
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Pacote shared/ da raiz do repositório (no container fica em /app/shared, ao lado dos scripts)
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -0,0 +1,125 @@
+import json
+import uuid
+import pytest
+from unittest.mock import Mock, patch
+from sqlalchemy import exc
+import consumer
+
+def heartbeat() -> dict:
+    return {"device_uuid": str(uuid.uuid4()), "boot_date": "2025-10-16T12:00:00Z", "cpu_usage": 10.0}
+
+def pending(messages: list) -> list:
+    return [(tag, message, json.dumps(message).encode()) for tag, message in enumerate(messages, start=1)]
+
+@pytest.fixture
+def channel():
+    consumer.pending_messages, consumer.flush_timer, consumer.retry_delay = [], None, 0.0
+    ch = Mock()
+    with patch.object(consumer, "SessionLocal", Mock()), \
+         patch.object(consumer, "write_latest_telemetry", Mock()), \
+         patch.object(consumer, "sample_queue_depth", Mock()), \
+         patch.object(consumer.time, "sleep") as sleep:
+        ch.sleep = sleep
+        yield ch
+    consumer.pending_messages = []
+
+# --- Testes da Gravação em Lote do Worker ---
+def test_successful_batch_is_acked_once(channel):
+    consumer.pending_messages = pending([heartbeat() for _ in range(3)])
+    with patch.object(consumer, "persist_rows", Mock(return_value=[])) as persist:
+        consumer.flush_pending(channel)
+
+    persist.assert_called_once()
+    channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+    channel.basic_nack.assert_not_called()
+    channel.basic_publish.assert_not_called()
+
+def test_rows_with_data_errors_go_to_dead_letter(channel):
+    good, bad = heartbeat(), heartbeat()
+    consumer.pending_messages = pending([good, {"device_uuid": "invalido"}, bad])
+
+    def persist(db, rows):
+        # O lote falha por causa de uma linha; na gravação individual só ela é recusada
+        if len(rows) > 1 or str(rows[0]["device_uuid"]) == bad["device_uuid"]:
+            raise exc.IntegrityError("INSERT", {}, Exception("fk"))
+        return []
+
+    with patch.object(consumer, "persist_rows", Mock(side_effect=persist)):
+        consumer.flush_pending(channel)
+
+    dead = [c.kwargs["body"] for c in channel.basic_publish.call_args_list]
+    assert dead == [json.dumps({"device_uuid": "invalido"}).encode(), json.dumps(bad).encode()]
+    assert all(c.kwargs["routing_key"] == consumer.RABBITMQ_DEAD_LETTER_QUEUE for c in channel.basic_publish.call_args_list)
+    channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+    channel.basic_nack.assert_not_called()
+
+def test_database_outage_requeues_batch_with_backoff(channel):
+    consumer.pending_messages = pending([heartbeat() for _ in range(3)])
+    outage = exc.OperationalError("INSERT", {}, Exception("connection refused"))
+    with patch.object(consumer, "persist_rows", Mock(side_effect=outage)):
+        consumer.flush_pending(channel)
+        consumer.pending_messages = pending([heartbeat() for _ in range(3)])
+        consumer.flush_pending(channel)
+
+    channel.basic_ack.assert_not_called()
+    channel.basic_nack.assert_called_with(delivery_tag=3, multiple=True, requeue=True)
+    # Espera dobra a cada falha seguida
+    assert [c.args[0] for c in channel.sleep.call_args_list] == [consumer.RETRY_BACKOFF_SECONDS, consumer.RETRY_BACKOFF_SECONDS * 2]
+
+def test_outage_during_row_fallback_acks_only_resolved_messages(channel):
+    consumer.pending_messages = pending([heartbeat() for _ in range(3)])
+    calls = []
+
+    def persist(db, rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise exc.DataError("INSERT", {}, Exception("valor inválido"))
+        if len(calls) == 3:
+            raise exc.OperationalError("INSERT", {}, Exception("connection lost"))
+        return []
+
+    with patch.object(consumer, "persist_rows", Mock(side_effect=persist)):
+        consumer.flush_pending(channel)
+
+    channel.basic_ack.assert_called_once_with(delivery_tag=1)
+    assert [c.kwargs for c in channel.basic_nack.call_args_list] == [
+        {"delivery_tag": 2, "requeue": True}, {"delivery_tag": 3, "requeue": True}
+    ]
+
+def test_rollup_bucket_converts_aware_timestamps_to_utc():
+    from datetime import datetime, timedelta, timezone
+    from models import TelemetryRollupHourly, TelemetryRollupDaily
+    # 23:30 em UTC-3 é 02:30 UTC do dia seguinte
+    boot_date = datetime(2025, 9, 26, 23, 30, tzinfo=timezone(timedelta(hours=-3)))
+    assert consumer.rollup_bucket(boot_date, TelemetryRollupHourly) == datetime(2025, 9, 27, 2)
+    assert consumer.rollup_bucket(boot_date, TelemetryRollupDaily) == datetime(2025, 9, 27)
+    assert consumer.rollup_bucket(datetime(2025, 9, 26, 23, 30), TelemetryRollupHourly) == datetime(2025, 9, 26, 23)
+
+def test_persist_rows_upserts_latest_and_rollups_on_sqlite():
+    # Mesmas instruções ON CONFLICT no SQLite (benchmark local) e no PostgreSQL
+    from datetime import datetime
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from base import Base
+    from models import Device, DeviceLatestTelemetry, TelemetryRollupHourly
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    device_uuid, user_id = uuid.uuid4(), uuid.uuid4()
+    with Session(engine) as db:
+        db.add(Device(uuid=device_uuid, user_id=user_id))
+        db.commit()
+        consumer.device_owners.clear()
+
+        def row(hour: int, minute: int, cpu):
+            return consumer.parse_telemetry({"device_uuid": str(device_uuid), "boot_date": f"2025-10-16T{hour:02}:{minute:02}:00", "cpu_usage": cpu})
+
+        consumer.persist_rows(db, [row(12, 10, 30.0), row(12, 20, None)])
+        latest = consumer.persist_rows(db, [row(12, 5, 50.0)])
+        db.commit()
+
+        # Leitura mais antiga não substitui a última telemetria, mas entra no agregado
+        assert latest == []
+        assert db.get(DeviceLatestTelemetry, device_uuid).boot_date == datetime(2025, 10, 16, 12, 20)
+        bucket = db.get(TelemetryRollupHourly, {"device_uuid": device_uuid, "bucket_start": datetime(2025, 10, 16, 12)})
+        assert (bucket.cpu_usage_sum, bucket.cpu_usage_min, bucket.cpu_usage_max, bucket.cpu_usage_count) == (80.0, 30.0, 50.0, 2)